@@ -0,0 +1,213 @@
+"""
+Admission control: a priority queue in front of Claude and per-client quotas.
+
+Every call to Claude holds one of a fixed number of slots. Calls that find
+no free slot wait in a bounded queue, lowest priority value first, and new
+work is turned away (Overloaded) once the queue is full. Clients over their
+quota are turned away too (QuotaExceeded). Both carry the HTTP status and a
+Retry-After hint, so the servers answer overload immediately instead of
+letting requests time out.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from latency import LatencyWindow
+from rate_limit import TokenBucket
+
+
+class Rejected(Exception):
+    """A request turned away by admission control."""
+    status = 503
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Overloaded(Rejected):
+    status = 503
+
+
+class QuotaExceeded(Rejected):
+    status = 429
+
+
+class PriorityLimiter:
+    """
+    At most `limit` holders at a time; waiters are served lowest priority first.
+
+    acquire() blocks for a slot and release() hands it straight to the next
+    waiter. admit() is the cheap up-front check for new work: it raises
+    Overloaded when `max_queue` callers are already waiting.
+    """
+
+    def __init__(self, limit, max_queue):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters = []  # heap of [priority, seq, waiter]
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.wait_ms = LatencyWindow()
+
+    def admit(self):
+        """Raise Overloaded if the queue is full, so new work fails fast."""
+        with self._lock:
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"Server busy: {len(self._waiters)} calls to Claude already queued")
+            self.admitted += 1
+
+    def _enter(self, priority, waiter):
+        """Take a free slot (returns None) or queue the waiter (returns its heap entry)."""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return None
+            entry = [priority, next(self._seq), waiter]
+            heapq.heappush(self._waiters, entry)
+            self.queued += 1
+            return entry
+
+    def _leave(self, entry):
+        """Stop waiting; False if a slot was handed over in the meantime."""
+        with self._lock:
+            if entry not in self._waiters:
+                return False
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            return True
+
+    def _wake(self, waiter):
+        waiter.set()
+
+    def acquire(self, priority=0, timeout=None):
+        """Wait for a slot; returns the seconds waited, raises Overloaded after timeout."""
+        started = time.monotonic()
+        waiter = threading.Event()
+        entry = self._enter(priority, waiter)
+        if entry is not None and not waiter.wait(timeout) and self._leave(entry):
+            self._timed_out(timeout)
+        return self._waited(started)
+
+    def _timed_out(self, timeout):
+        with self._lock:
+            self.timeouts += 1
+        raise Overloaded(f"Timed out after {timeout:.1f}s waiting for a Claude slot")
+
+    def _waited(self, started):
+        waited = time.monotonic() - started
+        self.wait_ms.record(waited * 1000)
+        return waited
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if self._wake(waiter) is not False:
+                    return
+            self.active -= 1
+
+    def stats(self):
+        with self._lock:
+            waiting = len(self._waiters)
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "queued": self.queued,
+            "timeouts": self.timeouts,
+            "wait_ms": self.wait_ms.summary(),
+        }
+
+
+class AsyncPriorityLimiter(PriorityLimiter):
+    """PriorityLimiter for coroutines running on one event loop."""
+
+    def _wake(self, waiter):
+        if waiter.done():
+            return False  # its task was cancelled while waiting
+        waiter.set_result(None)
+
+    async def acquire(self, priority=0, timeout=None):
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        entry = self._enter(priority, waiter)
+        if entry is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            except asyncio.TimeoutError:
+                if self._leave(entry):
+                    self._timed_out(timeout)
+            except asyncio.CancelledError:
+                if not self._leave(entry):
+                    self.release()
+                raise
+        return self._waited(started)
+
+
+class ClientQuotas:
+    """
+    A token bucket per client: `per_minute` requests on average, bursts of `burst`.
+
+    Buckets of the least recently seen clients are dropped beyond
+    `max_clients`; a dropped client simply starts again with a full bucket.
+    A per_minute of 0 disables quotas.
+    """
+
+    def __init__(self, per_minute, burst, max_clients=10000):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def check(self, client, cost=1):
+        """
+        Charge `cost` requests to the client; raise QuotaExceeded if it is
+        over quota. A cost above the burst could never be paid, so it raises
+        ValueError instead: callers check it against max_cost() first.
+        """
+        if not self.per_minute:
+            return
+        with self._lock:
+            bucket = self._buckets.pop(client, None) or TokenBucket(self.per_minute / 60, self.burst)
+            self._buckets[client] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if cost > bucket.capacity:
+            raise ValueError(f"A cost of {cost} is more than a burst of {bucket.capacity:g}")
+        if not bucket.try_acquire(cost):
+            with self._lock:
+                self.rejected += 1
+            raise QuotaExceeded(
+                f"Rate limit exceeded: {self.per_minute:g} requests per minute",
+                retry_after=cost / bucket.rate
+            )
+
+    def max_cost(self, limit):
+        """The largest cost, up to limit, that one check() can ever accept."""
+        return min(limit, self.burst) if self.per_minute else limit
+
+    def stats(self):
+        with self._lock:
+            clients = len(self._buckets)
+        return {
+            "per_minute": self.per_minute,
+            "burst": self.burst,
+            "clients": clients,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,530 @@
+"""
+Async ASGI serving mode for the Bio for Dummies agent.
+
+Serves the same API as server.py (/health, /explain, /explain/stream,
+/explain/batch, /explain/followup, /tools, /cache/stats, /stats, /metrics), but runs the agent loop on an event loop
+with the async Anthropic client and async HTTP clients for the tools, so
+one process can hold hundreds of in-flight explanations.
+
+Run with:
+    python asgi_server.py --workers 4 --port 5000
+
+Requires: pip install starlette uvicorn httpx
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from anthropic import AsyncAnthropic
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import server
+from admission import AsyncPriorityLimiter, Rejected
+from async_tools import close_clients, execute_tool_async
+from capture import capture_stats, captured
+from context_reducer import context_stats
+from http_client import rate_limit_stats
+from request_log import log_request
+from metrics import render_metrics
+from model_routing import route_stats
+from pubmed import pubmed_stats
+from resilience import resilience_stats
+from retrieval_cache import retrieval_cache_stats
+from shared_cache import off_loop
+from singleflight import AsyncSingleFlight, AsyncStreamFlight
+from term_index import term_index_stats
+from tool_executor import run_tool_calls_async
+from tool_projection import projection_stats
+from token_usage import usage_summary
+from tracing import trace_request
+
+# No SDK retries, as for server.client, so AGENT_DEADLINE holds
+async_client = AsyncAnthropic(api_key=server.api_key, max_retries=0)
+
+# Seconds to wait for in-flight explanations when shutting down
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+_in_flight = 0
+_drained = None
+
+# Concurrent identical requests share one agent run, as in server.py
+explain_flight = AsyncSingleFlight()
+stream_flight = AsyncStreamFlight()
+
+# Calls to Claude queue on the event loop here; this replaces server.py's
+# thread-based limiter, so its stats and metrics report this one
+server.llm_limiter = AsyncPriorityLimiter(server.LLM_CONCURRENCY, server.LLM_QUEUE_SIZE)
+
+
+async def agent_events_async(term, page_context, difficulty_level="undergrad", length="brief",
+                             retrieval_mode=None, stream=False, history=None, followup=None):
+    """Async driver for server.agent_loop; yields the same events as server.agent_events."""
+    steps = captured(
+        server.agent_loop(term, page_context, difficulty_level, length, retrieval_mode, history, followup),
+        term, page_context, difficulty_level, length, retrieval_mode, history, followup
+    )
+    reply = error = None
+    rounds = 0
+    limiter = server.llm_limiter
+
+    while True:
+        try:
+            kind, payload = steps.throw(error) if error else steps.send(reply)
+        except StopIteration:
+            return
+        reply = error = None
+
+        if kind == "llm":
+            rounds += 1
+            try:
+                payload["timeout"] -= await limiter.acquire(
+                    server.llm_priority(length, rounds), payload["timeout"]
+                )
+                try:
+                    if stream:
+                        async with async_client.messages.stream(**payload) as message_stream:
+                            async for event in message_stream:
+                                if event.type == "text":
+                                    yield "text", {"delta": event.text}
+                            reply = await message_stream.get_final_message()
+                    else:
+                        reply = await async_client.messages.create(**payload)
+                finally:
+                    limiter.release()
+            except Exception as e:
+                error = e
+
+        elif kind == "tools":
+            reply = await run_tool_calls_async(payload["calls"], execute_tool_async, payload["timeout"])
+
+        elif kind == "cache":
+            # The shared tier is a blocking round trip; keep it off the loop
+            reply = await server.explanation_cache.get_async(payload)
+
+        else:
+            yield payload
+
+
+async def run_agent_async(term, page_context, difficulty_level="undergrad", length="brief", retrieval_mode=None,
+                          history=None, followup=None):
+    """Run the agent to completion and return the "done" event data."""
+    events = agent_events_async(
+        term, page_context, difficulty_level, length, retrieval_mode, history=history, followup=followup
+    )
+    async for event, data in events:
+        if event == "done":
+            return data
+
+
+async def explain_term_async(term, page_context, difficulty_level="undergrad", length="brief",
+                             retrieval_mode=None):
+    """Async server.explain_term: returns (result, cached)."""
+    cache_key, result = await off_loop(server.cached_explanation, term, difficulty_level, length, page_context)
+    if result is not None:
+        log_request(term, difficulty_level, length, cached=True)
+        return result, True
+
+    led = []
+
+    async def compute():
+        server.llm_limiter.admit()
+        result = await run_agent_async(term, page_context, difficulty_level, length, retrieval_mode)
+        await off_loop(server.store_explanation, cache_key, term, result)
+        return result
+
+    async def run():
+        led.append(True)
+        if server.shared_explanations is None:
+            return await compute()
+        return await server.shared_explanations.fill_async(cache_key, compute, server.EXPLAIN_FOLLOWER_TIMEOUT)
+
+    result = await explain_flight.do(cache_key, run, server.EXPLAIN_FOLLOWER_TIMEOUT)
+    if not led:
+        server.record_coalesced(result)
+    log_request(term, difficulty_level, length, cached=False)
+    return result, False
+
+
+class _track_in_flight:
+    """Count in-flight explanations so shutdown can wait for them to drain."""
+
+    def __enter__(self):
+        global _in_flight
+        _in_flight += 1
+        _drained.clear()
+
+    def __exit__(self, *exc):
+        global _in_flight
+        _in_flight -= 1
+        if _in_flight == 0:
+            _drained.set()
+
+
+# API Endpoints
+async def health(request):
+    """Health check endpoint."""
+    return JSONResponse({
+        "status": "ok",
+        "message": "Bio for Dummies Agent is running",
+        "in_flight": _in_flight
+    })
+
+
+def _client_id(request):
+    return server.client_id(request.headers, request.client.host if request.client else None)
+
+
+def _rejection(e):
+    """The 429/503 response for a request turned away by admission control."""
+    print(f"🚦 Rejected: {str(e)}")
+    return JSONResponse(
+        {"error": str(e), "retry_after": e.retry_after},
+        status_code=e.status,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def _read_explain_body(request):
+    """The explain_params of the body plus its include_timing and start_session flags, or None if invalid."""
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        data = None
+    if not data or 'term' not in data:
+        return None
+    return server.explain_params(data), bool(data.get('include_timing')), bool(data.get('start_session'))
+
+
+async def explain(request):
+    """Explain a biological term; same body and response as the Flask /explain."""
+    body = await _read_explain_body(request)
+    if body is None:
+        return JSONResponse({"error": "Missing required field: 'term'"}, status_code=400)
+    (term, page_context, difficulty_level, length, retrieval_mode), include_timing, open_session = body
+
+    try:
+        server.client_quotas.check(_client_id(request))
+        with _track_in_flight(), trace_request("/explain") as trace:
+            result, cached = await explain_term_async(
+                term, page_context, difficulty_level, length, retrieval_mode
+            )
+            timing = trace.summary()
+
+        response = {
+            "term": term,
+            "explanation": result["explanation"],
+            "sources": result["sources"],
+            "difficulty_level": difficulty_level,
+            "length": length,
+            "cached": cached,
+            "degraded": result.get("degraded", False),
+            "degraded_reason": result.get("degraded_reason"),
+            "context_tokens_saved": 0 if cached else result.get("context_tokens_saved", 0)
+        }
+        if include_timing:
+            response["timing"] = timing
+        if open_session:
+            response["session_id"] = await off_loop(
+                server.start_session, term, page_context, difficulty_level, length, result
+            )
+        return JSONResponse(response)
+
+    except Rejected as e:
+        return _rejection(e)
+
+    except TimeoutError as e:
+        print(f"Error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=504)
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def explain_stream(request):
+    """Server-Sent Events version of /explain; same events as the Flask endpoint."""
+    body = await _read_explain_body(request)
+    if body is None:
+        return JSONResponse({"error": "Missing required field: 'term'"}, status_code=400)
+    (term, page_context, difficulty_level, length, retrieval_mode), include_timing, open_session = body
+
+    # Turn the request away before the event stream starts, so it gets a real status
+    try:
+        server.client_quotas.check(_client_id(request))
+        cache_key, cached_result = await off_loop(
+            server.cached_explanation, term, difficulty_level, length, page_context
+        )
+        if cached_result is None:
+            server.llm_limiter.admit()
+    except Rejected as e:
+        return _rejection(e)
+
+    async def generate():
+        started = time.monotonic()
+        first_token_ms = None
+
+        try:
+            with _track_in_flight(), trace_request("/explain/stream") as trace:
+                result = cached_result
+                cached = result is not None
+                if cached:
+                    first_token_ms = (time.monotonic() - started) * 1000
+                    yield server.format_sse("text", {"delta": result["explanation"]})
+                else:
+                    async def produce():
+                        events = agent_events_async(
+                            term, page_context, difficulty_level, length, retrieval_mode, stream=True
+                        )
+                        async for event, payload in events:
+                            if event == "done":
+                                await off_loop(server.store_explanation, cache_key, term, payload)
+                            yield event, payload
+
+                    events, leader = stream_flight.subscribe(
+                        cache_key, produce, server.EXPLAIN_FOLLOWER_TIMEOUT
+                    )
+                    async for event, payload in events:
+                        if event == "done":
+                            result = payload
+                            break
+                        if event == "text" and first_token_ms is None:
+                            first_token_ms = (time.monotonic() - started) * 1000
+                        yield server.format_sse(event, payload)
+
+                    if not leader:
+                        server.record_coalesced(result)
+                timing = trace.summary()
+
+            log_request(term, difficulty_level, length, cached)
+            if first_token_ms is not None:
+                server.ttft_stats.record(first_token_ms)
+
+            done = {
+                "term": term,
+                "explanation": result["explanation"],
+                "sources": result["sources"],
+                "difficulty_level": difficulty_level,
+                "length": length,
+                "cached": cached,
+                "degraded": result.get("degraded", False),
+                "degraded_reason": result.get("degraded_reason"),
+                "context_tokens_saved": 0 if cached else result.get("context_tokens_saved", 0),
+                "ttft_ms": first_token_ms,
+                "total_ms": (time.monotonic() - started) * 1000
+            }
+            if include_timing:
+                done["timing"] = timing
+            if open_session:
+                done["session_id"] = await off_loop(
+                    server.start_session, term, page_context, difficulty_level, length, result
+                )
+            yield server.format_sse("done", done)
+
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            yield server.format_sse("error", {"error": str(e)})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def explain_batch(request):
+    """Explain many terms from one page; same body and response as the Flask /explain/batch."""
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        data = None
+    if not data or not isinstance(data.get('terms'), list) or not data['terms']:
+        return JSONResponse({"error": "Missing required field: 'terms' (non-empty list)"}, status_code=400)
+
+    terms = server.unique_terms(data['terms'])
+    max_terms = server.client_quotas.max_cost(server.BATCH_MAX_TERMS)
+    if len(terms) > max_terms:
+        return JSONResponse({"error": f"Too many terms: {len(terms)} (max {max_terms})"}, status_code=400)
+
+    try:
+        server.client_quotas.check(_client_id(request), cost=len(terms))
+    except Rejected as e:
+        return _rejection(e)
+
+    page_context = data.get('page_context', {})
+    difficulty_level = data.get('difficulty_level', 'undergrad')
+    length = data.get('length', 'brief')
+    retrieval_mode = data.get('retrieval_mode')
+    limit = asyncio.Semaphore(server.BATCH_CONCURRENCY)
+
+    async def explain_one(term):
+        async with limit:
+            try:
+                result, cached = await explain_term_async(
+                    term, page_context, difficulty_level, length, retrieval_mode
+                )
+                return {
+                    "explanation": result["explanation"],
+                    "sources": result["sources"],
+                    "cached": cached,
+                    "degraded": result.get("degraded", False),
+                    "degraded_reason": result.get("degraded_reason")
+                }
+            except Exception as e:
+                print(f"Error explaining '{term}': {str(e)}")
+                return {"error": str(e)}
+
+    with _track_in_flight(), trace_request("/explain/batch"):
+        results = dict(zip(terms, await asyncio.gather(*(explain_one(term) for term in terms))))
+
+    return JSONResponse({
+        "results": results,
+        "difficulty_level": difficulty_level,
+        "length": length,
+        "failed": sum(1 for r in results.values() if "error" in r)
+    })
+
+
+async def explain_followup(request):
+    """Ask a follow-up question about an earlier explanation; same body and response as the Flask endpoint."""
+    try:
+        data = await request.json()
+        session_id, question = server.followup_params(data)
+    except (json.JSONDecodeError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    session = await off_loop(server.sessions.get, session_id)
+    if session is None:
+        return JSONResponse({"error": "Unknown or expired session"}, status_code=404)
+
+    try:
+        server.client_quotas.check(_client_id(request))
+        server.llm_limiter.admit()
+
+        with _track_in_flight(), trace_request("/explain/followup") as trace:
+            result = await run_agent_async(
+                session["term"], session["page_context"], session["difficulty_level"], session["length"],
+                session["retrieval_mode"], history=session["messages"], followup=question
+            )
+            timing = trace.summary()
+
+        response = await off_loop(server.followup_body, session_id, session, question, result)
+        if data.get('include_timing'):
+            response["timing"] = timing
+        return JSONResponse(response)
+
+    except Rejected as e:
+        return _rejection(e)
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def list_tools(request):
+    """List available tools."""
+    return JSONResponse({
+        "tools": [tool["name"] for tool in server.tools],
+        "details": server.tools
+    })
+
+
+async def cache_stats(request):
+    """Hit/miss/eviction counters for the explanation and retrieval caches, and request coalescing."""
+    return JSONResponse({
+        "explanations": server.explanation_cache.stats(),
+        "retrieval": retrieval_cache_stats(),
+        "pubmed": pubmed_stats(),
+        "term_index": term_index_stats(),
+        "similarity": server.explanation_terms.stats(),
+        "coalescing": server.coalescing_stats(explain_flight, stream_flight),
+        "include_page_context": server.EXPLAIN_CACHE_USE_CONTEXT
+    })
+
+
+async def stats(request):
+    """Latency stats; time-to-first-token of /explain/stream is the headline number."""
+    return JSONResponse({
+        "ttft_ms": server.ttft_stats.summary(),
+        "tool_results": projection_stats(),
+        "usage": usage_summary(),
+        "upstream_rate_limits": rate_limit_stats(),
+        "upstreams": resilience_stats(),
+        "admission": server.admission_stats(),
+        "routes": route_stats(),
+        "sessions": server.sessions.stats(),
+        "context": context_stats(),
+        "capture": capture_stats(),
+        "in_flight": _in_flight
+    })
+
+
+async def metrics(request):
+    """Request, LLM, tool and upstream metrics in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global _drained
+    _drained = asyncio.Event()
+    _drained.set()
+    yield
+    # Uvicorn has stopped accepting connections; let in-flight work finish
+    if _in_flight:
+        print(f"⏳ Draining {_in_flight} in-flight explanation(s)...")
+        try:
+            await asyncio.wait_for(_drained.wait(), SHUTDOWN_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⚠️  Shutting down with {_in_flight} explanation(s) still in flight")
+    await close_clients()
+    await async_client.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health, methods=['GET']),
+        Route('/explain', explain, methods=['POST']),
+        Route('/explain/stream', explain_stream, methods=['POST']),
+        Route('/explain/batch', explain_batch, methods=['POST']),
+        Route('/explain/followup', explain_followup, methods=['POST']),
+        Route('/tools', list_tools, methods=['GET']),
+        Route('/cache/stats', cache_stats, methods=['GET']),
+        Route('/stats', stats, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+    ],
+    middleware=[
+        # Allow browser extension to call this API
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+    ],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the Bio for Dummies agent as an ASGI server")
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", "1")),
+                        help="Number of worker processes")
+    parser.add_argument("--graceful-timeout", type=float, default=SHUTDOWN_DRAIN_TIMEOUT,
+                        help="Seconds to let in-flight requests finish on shutdown")
+    args = parser.parse_args()
+
+    print("🚀 Starting Bio for Dummies Agent Server (ASGI)...")
+    print(f"📍 Server will run on http://{args.host}:{args.port} with {args.workers} worker(s)")
+    uvicorn.run(
+        "asgi_server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout
+    )
@@ -0,0 +1,236 @@
+"""Async versions of the retrieval tools, used by the ASGI server."""
+import asyncio
+import random
+import time
+from urllib.parse import quote, urlsplit
+
+import httpx
+
+from http_client import (
+    CONNECT_TIMEOUT,
+    DEFAULT_POOL_SIZE,
+    EUTILS_URL,
+    HTTP_BACKOFF,
+    HTTP_BACKOFF_MAX,
+    HTTP_RETRIES,
+    RATE_LIMIT_MAX_WAIT,
+    READ_TIMEOUT,
+    RETRY_STATUSES,
+    UNIPROT_API_URL,
+    USER_AGENT,
+    WIKIPEDIA_API_URL,
+    host_buckets,
+    host_pool_sizes,
+)
+import pubmed
+from rate_limit import RateLimited
+from resilience import BREAKER_SLOW_SECONDS, check_breaker, resilient_get_async
+from retrieval_cache import async_cached_tool
+from shared_cache import off_loop
+from term_index import lookup_term
+from tracing import record_upstream
+
+# One pooled client per upstream host, created on the running event loop
+_clients = {}
+
+
+def _get_client(url):
+    host = urlsplit(url).netloc
+    client = _clients.get(host)
+    if client is None:
+        pool_size = host_pool_sizes.get(host, DEFAULT_POOL_SIZE)
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+        )
+        _clients[host] = client
+    return client
+
+
+async def close_clients():
+    """Close every pooled client; call on shutdown."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+async def take_token(host, bucket):
+    """Async http_client.take_token."""
+    if bucket is not None and not await bucket.acquire_async(timeout=RATE_LIMIT_MAX_WAIT):
+        record_upstream(host, "rate_limited", 0, 0)
+        raise RateLimited(f"{host}: over its rate limit, try again shortly")
+
+
+async def async_http_get(url, params=None):
+    """
+    GET with the same timeouts, rate limits, jittered retries, circuit
+    breaker and hedging as http_client.http_get; every attempt takes a
+    token from the host's rate limit.
+    """
+    client = _get_client(url)
+    host = urlsplit(url).netloc
+    bucket = host_buckets.get(host)
+    await take_token(host, bucket)
+
+    async def get():
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = await client.get(url, params=params)
+                if response.status_code not in RETRY_STATUSES or attempt >= HTTP_RETRIES:
+                    record_upstream(host, response.status_code, len(response.content), time.perf_counter() - started)
+                    return response
+            except httpx.TransportError:
+                if attempt >= HTTP_RETRIES:
+                    record_upstream(host, "error", 0, time.perf_counter() - started)
+                    raise
+            backoff = min(HTTP_BACKOFF * (2 ** attempt), HTTP_BACKOFF_MAX)
+            await asyncio.sleep(random.uniform(0, backoff))
+            await take_token(host, bucket)
+            attempt += 1
+
+    return await resilient_get_async(host, get, may_hedge=lambda: bucket is None or bucket.try_acquire())
+
+
+async def async_http_stream(url, params=None):
+    """
+    Yield the body of a GET in chunks as it arrives.
+
+    Rate limited and retried like async_http_get, but retries stop once
+    the body has started: a failure part-way through is raised. Goes
+    through the host's circuit breaker, but is not hedged.
+    """
+    client = _get_client(url)
+    host = urlsplit(url).netloc
+    bucket = host_buckets.get(host)
+    await take_token(host, bucket)
+    breaker = check_breaker(host)
+    started = time.perf_counter()
+    attempt = 0
+    nbytes = 0
+    while True:
+        try:
+            async with client.stream("GET", url, params=params) as response:
+                if response.status_code not in RETRY_STATUSES or attempt >= HTTP_RETRIES:
+                    if response.is_error:
+                        record_upstream(host, response.status_code, 0, time.perf_counter() - started)
+                        breaker.record(response.status_code not in RETRY_STATUSES)
+                        response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        nbytes += len(chunk)
+                        yield chunk
+                    record_upstream(host, response.status_code, nbytes, time.perf_counter() - started)
+                    breaker.record(time.perf_counter() - started < BREAKER_SLOW_SECONDS)
+                    return
+        except httpx.TransportError:
+            if nbytes or attempt >= HTTP_RETRIES:
+                record_upstream(host, "error", nbytes, time.perf_counter() - started)
+                breaker.record(False)
+                raise
+        backoff = min(HTTP_BACKOFF * (2 ** attempt), HTTP_BACKOFF_MAX)
+        await asyncio.sleep(random.uniform(0, backoff))
+        await take_token(host, bucket)
+        attempt += 1
+
+
+async def fetch_records(pmids):
+    """Async pubmed.fetch_records: efetch PMIDs, parsing the XML as it streams in."""
+    parser = pubmed.EfetchParser()
+    async for chunk in async_http_stream(f"{EUTILS_URL}/efetch.fcgi", params=pubmed.efetch_params(pmids)):
+        parser.feed(chunk)
+    return parser.close()
+
+
+record_batcher = pubmed.AsyncRecordBatcher(fetch_records)
+
+
+async def search_pmids(term, max_results):
+    """Async pubmed.search_pmids, sharing its search cache."""
+    key = pubmed.search_key(term, max_results)
+    pmids = await pubmed.search_cache.get_async(key)
+    if pmids is not None:
+        return pmids
+
+    async def run():
+        response = await async_http_get(
+            f"{EUTILS_URL}/esearch.fcgi", params=pubmed.esearch_params(term, max_results)
+        )
+        return await off_loop(pubmed.store_search, key, response.json())
+
+    return await pubmed.async_search_flight.do(key, run)
+
+
+async def search_pubmed(term, max_results=3):
+    """Search PubMed and return article summaries with abstracts (see pubmed.py)."""
+    try:
+        pmids = await search_pmids(term, max_results)
+        records = await off_loop(pubmed.cached_records, pmids)
+        missing = [pmid for pmid in pmids if pmid not in records]
+        if missing:
+            records.update(await record_batcher.get(missing))
+        return pubmed.assemble(pmids, records)
+
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@async_cached_tool("wikipedia")
+async def get_wikipedia_summary(term):
+    """Get Wikipedia summary for a term, from the local term index when it has one."""
+    local = lookup_term("wikipedia", term)
+    if local is not None:
+        return local
+
+    try:
+        url = f"{WIKIPEDIA_API_URL}/page/summary/{quote(term)}"
+        response = await async_http_get(url)
+        data = response.json()
+
+        return {
+            "title": data.get("title"),
+            "summary": data.get("extract"),
+            "url": data.get("content_urls", {}).get("desktop", {}).get("page")
+        }
+
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@async_cached_tool("uniprot")
+async def search_uniprot(protein_name):
+    """Search UniProt for protein information, from the local term index when it has one."""
+    local = lookup_term("uniprot", protein_name)
+    if local is not None:
+        return local
+
+    try:
+        url = f"{UNIPROT_API_URL}/uniprotkb/search"
+        params = {
+            "query": protein_name,
+            "format": "json",
+            "size": 3
+        }
+        response = await async_http_get(url, params=params)
+        return response.json()
+
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async_tool_functions = {
+    "search_pubmed": search_pubmed,
+    "get_wikipedia_summary": get_wikipedia_summary,
+    "search_uniprot": search_uniprot
+}
+
+
+async def execute_tool_async(tool_name, tool_input):
+    """Execute a tool by name with given input."""
+    if tool_name in async_tool_functions:
+        return await async_tool_functions[tool_name](**tool_input)
+    else:
+        return {"error": f"Unknown tool: {tool_name}"}
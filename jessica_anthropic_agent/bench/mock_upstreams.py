@@ -0,0 +1,464 @@
+"""
+Local stand-ins for the Anthropic Messages API, NCBI E-utilities, the
+Wikipedia REST summary endpoint and UniProt REST.
+
+Each upstream runs as its own HTTP server on 127.0.0.1 with configurable
+latency, jitter, occasional stalls, payload size and error rate, and
+counts the requests and tokens it serves. Used by run_bench.py; can also be run by hand:
+
+    python bench/mock_upstreams.py --anthropic-latency 500
+
+and then point the agent at the printed URLs (ANTHROPIC_BASE_URL,
+EUTILS_URL, WIKIPEDIA_API_URL, UNIPROT_API_URL).
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+# Per-upstream behavior; latencies in milliseconds
+DEFAULT_PROFILE = {
+    "anthropic": {"latency_ms": 800, "jitter_ms": 200, "error_rate": 0.0, "payload_scale": 1.0,
+                  "stall_rate": 0.0, "stall_ms": 0},
+    "eutils": {"latency_ms": 300, "jitter_ms": 100, "error_rate": 0.0, "payload_scale": 1.0,
+               "stall_rate": 0.0, "stall_ms": 0},
+    "wikipedia": {"latency_ms": 150, "jitter_ms": 50, "error_rate": 0.0, "payload_scale": 1.0,
+                  "stall_rate": 0.0, "stall_ms": 0},
+    "uniprot": {"latency_ms": 400, "jitter_ms": 150, "error_rate": 0.0, "payload_scale": 1.0,
+                "stall_rate": 0.0, "stall_ms": 0},
+}
+
+# Tools the mock model asks for on the first round of the agent loop
+MOCK_TOOL_CALLS = ("get_wikipedia_summary", "search_pubmed")
+
+# Latency of models with one of these in their name, relative to the profile's
+FAST_MODEL_LATENCY_SCALE = {"haiku": 0.4}
+
+# Prompts shorter than this are never cached, as with the real API
+MIN_CACHEABLE_TOKENS = 1024
+
+_LOREM = (
+    "Proteins fold into specific shapes that determine their function in the cell, "
+    "and small changes in sequence can alter binding, signalling and regulation. "
+)
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _ids_for(term, count):
+    digest = hashlib.sha1(term.lower().encode("utf-8")).hexdigest()
+    return [str(10000000 + int(digest[i * 6:(i + 1) * 6], 16) % 9000000) for i in range(count)]
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, upstream, config):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.upstream = upstream
+        self.config = dict(config)
+        self.lock = threading.Lock()
+        self.prompt_cache = set()
+        self.reset_stats()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "errors": 0, "paths": {}, "tokens": {
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cache_read_input_tokens": 0,
+                "cache_creation_input_tokens": 0,
+            }}
+
+    def count(self, path, error=False, usage=None):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["errors"] += int(error)
+            self.stats["paths"][path] = self.stats["paths"].get(path, 0) + 1
+            for field, value in (usage or {}).items():
+                self.stats["tokens"][field] += value
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # Plumbing
+
+    def _simulate_latency(self, scale=1.0):
+        config = self.server.config
+        delay = config["latency_ms"] + random.uniform(-1, 1) * config["jitter_ms"]
+        if random.random() < config["stall_rate"]:
+            delay += config["stall_ms"]
+        time.sleep(max(0.0, delay * scale) / 1000)
+
+    def _should_fail(self):
+        return random.random() < self.server.config["error_rate"]
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_xml(self, body):
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/__stats":
+            with self.server.lock:
+                return self._send_json(200, self.server.stats)
+
+        self._simulate_latency()
+        if self._should_fail():
+            self.server.count(url.path, error=True)
+            return self._send_json(503, {"error": "Service temporarily unavailable"})
+
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        upstream = self.server.upstream
+        if upstream == "eutils" and url.path.endswith("/esearch.fcgi"):
+            payload = self._esearch(params)
+        elif upstream == "eutils" and url.path.endswith("/esummary.fcgi"):
+            payload = self._esummary(params)
+        elif upstream == "eutils" and url.path.endswith("/efetch.fcgi"):
+            self.server.count(url.path)
+            return self._send_xml(self._efetch(params))
+        elif upstream == "wikipedia" and "/page/summary/" in url.path:
+            payload = self._wikipedia(unquote(url.path.rsplit("/", 1)[-1]))
+        elif upstream == "uniprot" and url.path.endswith("/uniprotkb/search"):
+            payload = self._uniprot(params)
+        else:
+            self.server.count(url.path, error=True)
+            return self._send_json(404, {"error": f"Unknown path {url.path}"})
+
+        self.server.count(url.path)
+        self._send_json(200, payload)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if self.server.upstream != "anthropic" or url.path != "/v1/messages":
+            return self._send_json(404, {"error": f"Unknown path {url.path}"})
+
+        body = self._read_json()
+        model = body.get("model", "")
+        self._simulate_latency(next(
+            (scale for name, scale in FAST_MODEL_LATENCY_SCALE.items() if name in model), 1.0
+        ))
+        if self._should_fail():
+            self.server.count(url.path, error=True)
+            return self._send_json(529, {
+                "type": "error",
+                "error": {"type": "overloaded_error", "message": "Overloaded"}
+            })
+
+        message = self._message(body)
+        self.server.count(url.path, usage=message["usage"])
+        if body.get("stream"):
+            self._stream_message(message)
+        else:
+            self._send_json(200, message)
+
+    # Bio APIs
+
+    def _esearch(self, params):
+        ids = _ids_for(params.get("term", ""), int(params.get("retmax", 3)))
+        return {"esearchresult": {"count": str(len(ids)), "retmax": str(len(ids)), "idlist": ids}}
+
+    def _esummary(self, params):
+        scale = self.server.config["payload_scale"]
+        ids = [i for i in params.get("id", "").split(",") if i]
+        result = {"uids": ids}
+        for uid in ids:
+            result[uid] = {
+                "uid": uid,
+                "pubdate": "2023 Mar",
+                "source": "J Mock Biol",
+                "fulljournalname": "Journal of Mock Biology",
+                "title": f"Study {uid} of molecular mechanisms",
+                "authors": [{"name": f"Author {n}", "authtype": "Author"} for n in range(int(12 * scale))],
+                "articleids": [{"idtype": "pubmed", "value": uid}],
+                "history": [{"pubstatus": "pubmed", "date": "2023/03/01 00:00"}] * int(4 * scale),
+            }
+        return {"header": {"type": "esummary", "version": "0.3"}, "result": result}
+
+    def _efetch(self, params):
+        scale = self.server.config["payload_scale"]
+        sentences = max(1, int(6 * scale))
+        articles = []
+        for uid in [i for i in params.get("id", "").split(",") if i]:
+            authors = "".join(
+                f"<Author><LastName>Author{n}</LastName><Initials>A</Initials></Author>"
+                for n in range(int(12 * scale))
+            )
+            abstract = "".join(
+                f'<AbstractText Label="{label}">{escape(_LOREM * sentences)}</AbstractText>'
+                for label in ("BACKGROUND", "RESULTS")
+            )
+            articles.append(
+                "<PubmedArticle><MedlineCitation>"
+                f"<PMID>{uid}</PMID><Article>"
+                "<Journal><JournalIssue><PubDate><Year>2023</Year><Month>Mar</Month></PubDate></JournalIssue>"
+                "<Title>Journal of Mock Biology</Title><ISOAbbreviation>J Mock Biol</ISOAbbreviation></Journal>"
+                f"<ArticleTitle>Study {uid} of <i>molecular</i> mechanisms</ArticleTitle>"
+                f"<Abstract>{abstract}</Abstract><AuthorList>{authors}</AuthorList>"
+                "</Article></MedlineCitation>"
+                f'<PubmedData><ArticleIdList><ArticleId IdType="pubmed">{uid}</ArticleId>'
+                f'<ArticleId IdType="doi">10.0000/mock.{uid}</ArticleId></ArticleIdList></PubmedData>'
+                "</PubmedArticle>"
+            )
+        return '<?xml version="1.0" ?>\n<PubmedArticleSet>' + "".join(articles) + "</PubmedArticleSet>"
+
+    def _wikipedia(self, title):
+        scale = self.server.config["payload_scale"]
+        return {
+            "type": "standard",
+            "title": title,
+            "extract": (f"{title} is a concept in biology. " + _LOREM * int(3 * scale)).strip(),
+            "content_urls": {"desktop": {"page": f"https://en.wikipedia.org/wiki/{title}"}},
+        }
+
+    def _uniprot(self, params):
+        scale = self.server.config["payload_scale"]
+        query = params.get("query", "")
+        results = []
+        for n, accession in enumerate(_ids_for(query, int(params.get("size", 3)))):
+            results.append({
+                "primaryAccession": f"P{accession[:5]}",
+                "proteinDescription": {"recommendedName": {"fullName": {"value": f"{query} protein {n}"}}},
+                "genes": [{"geneName": {"value": query.upper()[:8]}}],
+                "organism": {"scientificName": "Homo sapiens"},
+                "comments": [{"commentType": "FUNCTION", "texts": [{"value": _LOREM * int(2 * scale)}]}],
+                "features": [{"type": "Domain", "location": {"start": i, "end": i + 10}}
+                             for i in range(int(60 * scale))],
+                "sequence": {"value": "M" + "ACDEFGHIKLMNPQRSTVWY" * int(25 * scale)},
+            })
+        return {"results": results}
+
+    # Anthropic Messages API
+
+    def _message(self, body):
+        messages = body.get("messages", [])
+        has_tool_results = any(
+            isinstance(m.get("content"), list)
+            and any(isinstance(b, dict) and b.get("type") == "tool_result" for b in m["content"])
+            for m in messages
+        )
+        first = messages[0]["content"] if messages else ""
+        if isinstance(first, list):
+            first = " ".join(b.get("text", "") for b in first if isinstance(b, dict))
+        match = re.search(r"Explain '(.+?)'", first)
+        term = match.group(1) if match else "the term"
+
+        if body.get("tools") and not has_tool_results:
+            content = [{"type": "text", "text": "Let me look that up."}]
+            for n, name in enumerate(MOCK_TOOL_CALLS):
+                key = "protein_name" if name == "search_uniprot" else "term"
+                content.append({
+                    "type": "tool_use",
+                    "id": f"toolu_{random.getrandbits(48):012x}{n}",
+                    "name": name,
+                    "input": {key: term},
+                })
+            stop_reason = "tool_use"
+        else:
+            words = int(60 * self.server.config["payload_scale"])
+            text = f"{term} is explained here. " + " ".join(_LOREM.split()[i % 20] for i in range(words))
+            stop_reason = "end_turn"
+            # Roughly 4 characters a token; cut the answer off at max_tokens
+            if _estimate_tokens(text) > body.get("max_tokens", 4096):
+                text = text[:body["max_tokens"] * 4]
+                stop_reason = "max_tokens"
+            content = [{"type": "text", "text": text}]
+
+        return {
+            "id": f"msg_{random.getrandbits(64):016x}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "mock"),
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": self._usage(body, content),
+        }
+
+    def _usage(self, body, content):
+        """Token counts, simulating prompt caching at the request's cache breakpoints."""
+        parts = [json.dumps(tool, sort_keys=True) for tool in body.get("tools", [])]
+        breakpoints = [len(parts)] if body.get("tools") and "cache_control" in body["tools"][-1] else []
+
+        system = body.get("system", "")
+        for block in ([{"text": system}] if isinstance(system, str) else system):
+            parts.append(block.get("text", ""))
+            if block.get("cache_control"):
+                breakpoints.append(len(parts))
+
+        for message in body.get("messages", []):
+            blocks = message["content"] if isinstance(message["content"], list) else [message["content"]]
+            for block in blocks:
+                parts.append(json.dumps(block, sort_keys=True))
+                if isinstance(block, dict) and block.get("cache_control"):
+                    breakpoints.append(len(parts))
+
+        total = _estimate_tokens("".join(parts))
+        cache_read = cache_creation = 0
+        cacheable = [(end, _estimate_tokens("".join(parts[:end]))) for end in breakpoints]
+        cacheable = [(end, tokens) for end, tokens in cacheable if tokens >= MIN_CACHEABLE_TOKENS]
+        with self.server.lock:
+            for end, tokens in reversed(cacheable):
+                digest = hashlib.sha1("\x1f".join(parts[:end]).encode("utf-8")).hexdigest()
+                if digest in self.server.prompt_cache:
+                    cache_read = tokens
+                    break
+            if cacheable and cache_read < cacheable[-1][1]:
+                end, tokens = cacheable[-1]
+                self.server.prompt_cache.add(hashlib.sha1("\x1f".join(parts[:end]).encode("utf-8")).hexdigest())
+                cache_creation = tokens - cache_read
+
+        output = sum(_estimate_tokens(json.dumps(block)) for block in content)
+        return {
+            "input_tokens": max(0, total - cache_read - cache_creation),
+            "output_tokens": output,
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_creation,
+        }
+
+    def _stream_message(self, message):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(event, data):
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        usage = message["usage"]
+        send("message_start", {"type": "message_start", "message": {
+            **message, "content": [], "stop_reason": None,
+            "usage": {**usage, "output_tokens": 1},
+        }})
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                send("content_block_start", {"type": "content_block_start", "index": index,
+                                             "content_block": {"type": "text", "text": ""}})
+                for word in re.findall(r"\S+\s*", block["text"]):
+                    send("content_block_delta", {"type": "content_block_delta", "index": index,
+                                                 "delta": {"type": "text_delta", "text": word}})
+                    time.sleep(0.002)
+            else:
+                send("content_block_start", {"type": "content_block_start", "index": index,
+                                             "content_block": {**block, "input": {}}})
+                send("content_block_delta", {"type": "content_block_delta", "index": index,
+                                             "delta": {"type": "input_json_delta",
+                                                       "partial_json": json.dumps(block["input"])}})
+            send("content_block_stop", {"type": "content_block_stop", "index": index})
+        send("message_delta", {"type": "message_delta",
+                               "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                               "usage": {"output_tokens": usage["output_tokens"]}})
+        send("message_stop", {"type": "message_stop"})
+
+
+def start_mocks(profile=None):
+    """Start one mock server per upstream in background threads; returns {name: MockServer}."""
+    profile = profile or DEFAULT_PROFILE
+    servers = {}
+    for name, config in profile.items():
+        server = MockServer(name, config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers[name] = server
+    return servers
+
+
+def stop_mocks(servers):
+    for server in servers.values():
+        server.shutdown()
+        server.server_close()
+
+
+def agent_env(servers):
+    """Environment variables that point the agent at the mocks."""
+    return {
+        "ANTHROPIC_BASE_URL": servers["anthropic"].base_url,
+        "EUTILS_URL": servers["eutils"].base_url + "/entrez/eutils",
+        "WIKIPEDIA_API_URL": servers["wikipedia"].base_url + "/api/rest_v1",
+        "UNIPROT_API_URL": servers["uniprot"].base_url,
+        # The mocks have no rate limits; keep NCBI's 3/s from capping throughput
+        "NCBI_RATE_LIMIT": "0",
+    }
+
+
+def add_profile_arguments(parser):
+    """Add --<upstream>-latency/-jitter/-errors/-payload/-stall-rate/-stall options for every upstream."""
+    for name, config in DEFAULT_PROFILE.items():
+        parser.add_argument(f"--{name}-latency", type=float, default=config["latency_ms"],
+                            help=f"Mean {name} latency in ms")
+        parser.add_argument(f"--{name}-jitter", type=float, default=config["jitter_ms"],
+                            help=f"{name} latency jitter in ms")
+        parser.add_argument(f"--{name}-errors", type=float, default=config["error_rate"],
+                            help=f"Fraction of {name} requests that fail")
+        parser.add_argument(f"--{name}-payload", type=float, default=config["payload_scale"],
+                            help=f"Scale factor for {name} response sizes")
+        parser.add_argument(f"--{name}-stall-rate", type=float, default=config["stall_rate"],
+                            help=f"Fraction of {name} requests that stall")
+        parser.add_argument(f"--{name}-stall", type=float, default=config["stall_ms"],
+                            help=f"Extra latency of a stalled {name} request in ms")
+
+
+def profile_from_args(args):
+    return {
+        name: {
+            "latency_ms": getattr(args, f"{name}_latency"),
+            "jitter_ms": getattr(args, f"{name}_jitter"),
+            "error_rate": getattr(args, f"{name}_errors"),
+            "payload_scale": getattr(args, f"{name}_payload"),
+            "stall_rate": getattr(args, f"{name}_stall_rate"),
+            "stall_ms": getattr(args, f"{name}_stall"),
+        }
+        for name in DEFAULT_PROFILE
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local mocks of the agent's upstream APIs")
+    add_profile_arguments(parser)
+    servers = start_mocks(profile_from_args(parser.parse_args()))
+
+    print("🧪 Mock upstreams running. Point the agent at them with:")
+    for key, value in agent_env(servers).items():
+        print(f"   export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_mocks(servers)
@@ -0,0 +1,501 @@
+"""
+Replay captured agent runs against their recorded responses, to profile our own overhead.
+
+capture.py records agent runs (CAPTURE_FILE). This script runs them again
+through server.run_agent, the function behind process_query. Claude and
+the tools are replaced by stand-ins that give back the recorded responses
+after the recorded delays. Those delays are divided by --speed; with
+--speed 0 there are no delays at all. Runs start at their recorded times,
+also divided by --speed, with up to --concurrency of them at once.
+
+Each run is timed by phase. The phases on the run's own thread add up to
+its wall time:
+
+    routing        plan_retrieval, choose_route
+    context        reduce_context
+    prompt         build_system_prompt, explain_question, mark_last_message_for_cache
+    serialization  serialize_tool_result, collect_sources, plain_messages
+    llm/queue      waiting for an llm_limiter slot
+    llm/network    the recorded Claude latency (replayed)
+    llm/parse      decoding and validating Claude's JSON into a Message
+    tools          waiting for a turn's tool calls
+    other          the agent loop itself, tracing and logging
+
+Inside the tool calls, tools/network is the recorded tool latency and
+tools/parse is decoding the result JSON. "Own overhead" is everything
+except the replayed network and the waits. With --tracemalloc the report
+also shows allocations per phase. tracemalloc counts for the whole
+process, so those numbers are exact only with --concurrency 1.
+
+    python bench/replay.py captures.jsonl                         # original pace
+    python bench/replay.py captures.jsonl --speed 10              # ten times faster
+    python bench/replay.py captures.jsonl --speed 0 --repeat 20 --tracemalloc
+    python bench/replay.py captures.jsonl --speed 0 --cprofile replay.prof
+    python bench/replay.py captures.jsonl --speed 0 --sample stacks.txt   # flamegraph.pl, speedscope
+
+A run "diverges" when it asks for a Claude call or tool result that
+wasn't recorded, or ends with a different explanation. That usually means
+the code changed how it talks to Claude since the capture was made.
+"""
+import argparse
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# Replays must not be captured again, or touch the caches, logs and API key of a real deployment
+os.environ.update({"CAPTURE_FILE": "", "SHARED_CACHE_URL": "", "EXPLAIN_CACHE_DB": "", "REQUEST_LOG": "",
+                   "API_KEY": "replay"})
+
+from anthropic import APITimeoutError  # noqa: E402
+from anthropic.types import Message  # noqa: E402
+
+import server  # noqa: E402
+from admission import Overloaded  # noqa: E402
+from latency import nearest_rank  # noqa: E402
+
+PHASES = {
+    "routing": ["plan_retrieval", "choose_route"],
+    "context": ["reduce_context"],
+    "prompt": ["build_system_prompt", "explain_question", "mark_last_message_for_cache"],
+    "serialization": ["serialize_tool_result", "collect_sources", "plain_messages"],
+}
+SESSION_PHASES = ["routing", "context", "prompt", "serialization", "llm/queue", "llm/network", "llm/parse",
+                  "tools", "other"]
+TOOL_PHASES = ["tools/network", "tools/parse"]
+WAITS = {"llm/queue", "llm/network", "tools"}
+
+# The run being replayed on this thread (and in the tool calls it starts)
+_current = contextvars.ContextVar("replay_run", default=None)
+# Threads working on a replay right now, for the sampling profiler
+_active = set()
+
+
+class ReplayMismatch(Exception):
+    """A replayed run asked for a Claude call that wasn't recorded."""
+
+
+class Phases:
+    """Wall time, CPU time and allocations per phase, across threads."""
+
+    def __init__(self, allocations=False):
+        self.allocations = allocations
+        self.totals = defaultdict(lambda: {"calls": 0, "wall": 0.0, "cpu": 0.0, "net": 0, "peak": 0})
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def measure(self, name):
+        # Only the outermost phase on a thread counts, so nothing is counted twice
+        if getattr(self._local, "phase", None) is not None:
+            yield
+            return
+        self._local.phase = name
+        if self.allocations:
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            if self.allocations:
+                current, peak = tracemalloc.get_traced_memory()
+            self._local.phase = None
+            with self._lock:
+                total = self.totals[name]
+                total["calls"] += 1
+                total["wall"] += wall
+                total["cpu"] += cpu
+                if self.allocations:
+                    total["net"] += current - memory
+                    total["peak"] = max(total["peak"], peak - memory)
+
+    def wrap(self, name, function):
+        @functools.wraps(function)
+        def measured(*args, **kwargs):
+            with self.measure(name):
+                return function(*args, **kwargs)
+        return measured
+
+
+class Replay:
+    """The recorded Claude responses and tool results of one run, handed out in order."""
+
+    def __init__(self, run, speed, phases):
+        self.run = run
+        self.speed = speed
+        self.phases = phases
+        self.llm = deque(step for step in run["steps"] if step["kind"] == "llm")
+        self.recorded_llm = len(self.llm)
+        self.tools = defaultdict(deque)
+        for step in run["steps"]:
+            if step["kind"] == "tools":
+                for (name, tool_input), result in zip(step["calls"], step["results"]):
+                    self.tools[_tool_key(name, tool_input)].append((result, step["duration_ms"]))
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.mismatches = []
+
+    def wait(self, phase, duration_ms):
+        if self.speed > 0:
+            with self.phases.measure(phase):
+                time.sleep(duration_ms / 1000 / self.speed)
+
+    def next_response(self, request_args):
+        self.llm_calls += 1
+        if not self.llm:
+            self.mismatches.append(f"Claude call {self.llm_calls} wasn't recorded")
+            raise ReplayMismatch(f"Claude call {self.llm_calls} wasn't recorded")
+        step = self.llm.popleft()
+        asked = {
+            "model": request_args["model"],
+            "max_tokens": request_args["max_tokens"],
+            "messages": len(request_args["messages"]),
+            "tool_choice": request_args.get("tool_choice"),
+        }
+        if asked != step["request"]:
+            self.mismatches.append(f"Claude call {self.llm_calls} differs: {asked} != {step['request']}")
+        self.wait("llm/network", step["duration_ms"])
+        if step["error"] is not None:
+            raise _error(step["error"])
+        with self.phases.measure("llm/parse"):
+            return Message.model_validate(json.loads(step["body"]))
+
+    def tool_result(self, tool_name, tool_input):
+        self.tool_calls += 1
+        recorded = self.tools.get(_tool_key(tool_name, tool_input))
+        if not recorded:
+            self.mismatches.append(f"{tool_name}({tool_input}) wasn't recorded")
+            return {"error": f"{tool_name} wasn't recorded for this input"}
+        body, duration_ms = recorded.popleft()
+        self.wait("tools/network", duration_ms)
+        with self.phases.measure("tools/parse"):
+            return json.loads(body)
+
+
+def _tool_key(tool_name, tool_input):
+    return tool_name, json.dumps(tool_input, sort_keys=True)
+
+
+def _error(recorded):
+    """The exception a recorded failed Claude call raised, as far as the agent loop can tell."""
+    if recorded["type"] == "APITimeoutError":
+        return APITimeoutError(request=httpx.Request("POST", "https://api.anthropic.com/v1/messages"))
+    if recorded["type"] == "Overloaded":
+        return Overloaded(recorded["message"])
+    return RuntimeError(recorded["message"])
+
+
+class ReplayMessages:
+    def create(self, **request_args):
+        return _current.get().next_response(request_args)
+
+
+class ReplayClient:
+    """Stands in for server.client, answering from the run being replayed."""
+
+    def __init__(self):
+        self.messages = ReplayMessages()
+
+
+def replay_tool(tool_name, tool_input):
+    """Stands in for server.execute_tool."""
+    _active.add(threading.get_ident())
+    try:
+        return _current.get().tool_result(tool_name, tool_input)
+    finally:
+        _active.discard(threading.get_ident())
+
+
+def install(phases):
+    """Point the server at the recorded responses and time its phases."""
+    server.client = ReplayClient()
+    server.execute_tool = replay_tool
+    for phase, names in PHASES.items():
+        for name in names:
+            setattr(server, name, phases.wrap(phase, getattr(server, name)))
+    server.run_tool_calls = phases.wrap("tools", server.run_tool_calls)
+    server.llm_limiter.acquire = phases.wrap("llm/queue", server.llm_limiter.acquire)
+
+
+def load_runs(path, limit=None):
+    """Captured runs, with response and result bodies re-encoded as the JSON they arrived as."""
+    runs = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            run = json.loads(line)
+            for step in run["steps"]:
+                if step["kind"] == "llm" and step["response"] is not None:
+                    step["body"] = json.dumps(step["response"])
+                elif step["kind"] == "tools":
+                    step["results"] = [json.dumps(result) for result in step["results"]]
+            runs.append(run)
+            if limit and len(runs) >= limit:
+                break
+    return sorted(runs, key=lambda run: run["ts"])
+
+
+def replay_run(run, speed, phases, profile=None):
+    """Run one captured run through run_agent; returns its timings and whether it diverged."""
+    replay = Replay(run, speed, phases)
+    token = _current.set(replay)
+    _active.add(threading.get_ident())
+    request = run["request"]
+    error = None
+    if profile is not None:
+        profile.enable()
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        done = server.run_agent(
+            request["term"], request["page_context"], request["difficulty_level"], request["length"],
+            request["retrieval_mode"], history=request["history"], followup=request["followup"]
+        )
+    except Exception as e:
+        done, error = None, f"{type(e).__name__}: {e}"
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+        if profile is not None:
+            profile.disable()
+        _active.discard(threading.get_ident())
+        _current.reset(token)
+
+    recorded = run["done"] or {}
+    explanation = (done or {}).get("explanation")
+    if error is None and recorded.get("explanation") is not None and explanation != recorded["explanation"]:
+        replay.mismatches.append("the explanation differs from the recorded one")
+    if replay.llm:
+        replay.mismatches.append(f"{len(replay.llm)} recorded Claude call(s) weren't made")
+    return {
+        "id": run["id"],
+        "endpoint": run.get("endpoint"),
+        "wall_ms": wall * 1000,
+        "cpu_ms": cpu * 1000,
+        "recorded_ms": run["duration_ms"],
+        "llm_calls": replay.llm_calls,
+        "recorded_llm_calls": replay.recorded_llm,
+        "tool_calls": replay.tool_calls,
+        "error": error,
+        "mismatches": replay.mismatches,
+    }
+
+
+class StackSampler(threading.Thread):
+    """Samples the stacks of threads working on a replay, as collapsed stacks for flame graphs."""
+
+    def __init__(self, interval):
+        super().__init__(name="sampler", daemon=True)
+        self.interval = interval
+        self.counts = defaultdict(int)
+        self.samples = 0
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(_active):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    self.counts[";".join(reversed(stack))] += 1
+                    self.samples += 1
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+
+
+def schedule(runs, speed, repeat):
+    """(start offset in seconds, run) for every replay, in start order."""
+    first = runs[0]["ts"]
+    span = runs[-1]["ts"] - first + runs[-1]["duration_ms"] / 1000
+    starts = []
+    for rep in range(repeat):
+        for run in runs:
+            offset = rep * span + run["ts"] - first
+            starts.append((offset / speed if speed > 0 else 0.0, run))
+    return starts
+
+
+def replay(runs, args, phases, profiles):
+    """Replay every run on schedule; returns their results and the wall time taken."""
+    results = []
+    lock = threading.Lock()
+
+    def one(run):
+        profile = cProfile.Profile() if args.cprofile else None
+        result = replay_run(run, args.speed, phases, profile)
+        with lock:
+            results.append(result)
+            if profile is not None:
+                profiles.append(profile)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="replay") as executor:
+        for offset, run in schedule(runs, args.speed, args.repeat):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(contextvars.copy_context().run, one, run)
+    return results, time.perf_counter() - started
+
+
+def phase_report(phases, results):
+    """Per-phase totals, with "other" filling in the rest of each run's wall time."""
+    totals = {name: dict(total) for name, total in phases.totals.items()}
+    measured_wall = sum(totals.get(name, {}).get("wall", 0) for name in SESSION_PHASES)
+    measured_cpu = sum(totals.get(name, {}).get("cpu", 0) for name in SESSION_PHASES)
+    wall = sum(result["wall_ms"] for result in results) / 1000
+    cpu = sum(result["cpu_ms"] for result in results) / 1000
+    totals["other"] = {"calls": len(results), "wall": max(0.0, wall - measured_wall),
+                       "cpu": max(0.0, cpu - measured_cpu), "net": None, "peak": None}
+    report = {}
+    for name in SESSION_PHASES + TOOL_PHASES:
+        total = totals.get(name)
+        if not total:
+            continue
+        report[name] = {
+            "calls": total["calls"],
+            "wall_ms": round(total["wall"] * 1000, 2),
+            "share": round(total["wall"] / wall, 4) if name in SESSION_PHASES and wall else None,
+            "mean_ms": round(total["wall"] * 1000 / total["calls"], 3) if total["calls"] else 0,
+            "cpu_ms": round(total["cpu"] * 1000, 2),
+            "alloc_kib": round(total["net"] / 1024, 1) if phases.allocations and total["net"] is not None else None,
+            "peak_kib": round(total["peak"] / 1024, 1) if phases.allocations and total["peak"] is not None else None,
+        }
+    own_ms = sum(phase["wall_ms"] for name, phase in report.items()
+                 if name in SESSION_PHASES and name not in WAITS)
+    return report, own_ms
+
+
+def print_report(report, own_ms, results, elapsed, args):
+    count = len(results)
+    failed = sum(1 for result in results if result["error"])
+    diverged = sum(1 for result in results if result["mismatches"])
+    pace = "no delays" if args.speed <= 0 else f"{args.speed:g}x speed"
+    print(f"\n🔁 Replayed {count} run(s) in {elapsed:.2f} s ({pace}, concurrency {args.concurrency}); "
+          f"{failed} failed, {diverged} diverged")
+
+    walls = sorted(result["wall_ms"] for result in results)
+    print(f"   run wall ms: p50 {nearest_rank(walls, 50):.1f}  p95 {nearest_rank(walls, 95):.1f}  "
+          f"p99 {nearest_rank(walls, 99):.1f}")
+    network_ms = sum(report.get(name, {}).get("wall_ms", 0) for name in WAITS)
+    print(f"   per run: own overhead {own_ms / count:.2f} ms, waiting on Claude and tools {network_ms / count:.2f} ms")
+
+    print(f"\n{'phase':<15} {'calls':>7} {'wall ms':>10} {'share':>7} {'mean ms':>9} {'cpu ms':>9} "
+          f"{'alloc KiB':>10} {'peak KiB':>9}")
+    for name, phase in report.items():
+        if name == TOOL_PHASES[0]:
+            print("  in tool calls:")
+        share = f"{phase['share'] * 100:.1f}%" if phase["share"] is not None else ""
+        alloc = f"{phase['alloc_kib']:.1f}" if phase["alloc_kib"] is not None else ""
+        peak = f"{phase['peak_kib']:.1f}" if phase["peak_kib"] is not None else ""
+        print(f"{name:<15} {phase['calls']:>7} {phase['wall_ms']:>10.1f} {share:>7} {phase['mean_ms']:>9.3f} "
+              f"{phase['cpu_ms']:>9.1f} {alloc:>10} {peak:>9}")
+
+    for result in results:
+        if result["error"] or result["mismatches"]:
+            print(f"⚠️  {result['id']}: {result['error'] or '; '.join(result['mismatches'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured agent runs and profile our own overhead")
+    parser.add_argument("captures", help="JSON lines written by capture.py (CAPTURE_FILE)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Divide recorded delays and start times by this; 0 replays without delays")
+    parser.add_argument("--concurrency", type=int, default=8, help="Runs replayed at once")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the captures this many times")
+    parser.add_argument("--limit", type=int, help="Only the first N captured runs")
+    parser.add_argument("--tracemalloc", action="store_true", help="Report allocations per phase")
+    parser.add_argument("--cprofile", help="Write a cProfile of the runs here (replays one run at a time)")
+    parser.add_argument("--sample", help="Write sampled collapsed stacks here, for a flame graph")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="Milliseconds between stack samples")
+    parser.add_argument("--verbose", action="store_true", help="Keep the agent's log output")
+    parser.add_argument("--output", help="Where to write the report JSON")
+    args = parser.parse_args()
+
+    runs = load_runs(args.captures, args.limit)
+    if not runs:
+        sys.exit(f"No captured runs in {args.captures}")
+    if args.cprofile and args.concurrency > 1:
+        # cProfile follows one thread; overlapping runs would leave gaps
+        print("ℹ️  --cprofile replays one run at a time")
+        args.concurrency = 1
+    if args.tracemalloc and args.concurrency > 1:
+        print("ℹ️  Allocations are counted for the whole process; use --concurrency 1 for exact per-phase numbers")
+
+    phases = Phases(allocations=args.tracemalloc)
+    install(phases)
+    profiles = []
+    sampler = StackSampler(args.sample_interval / 1000) if args.sample else None
+    if args.tracemalloc:
+        tracemalloc.start()
+    if sampler is not None:
+        sampler.start()
+
+    print(f"🔁 Replaying {len(runs)} captured run(s) x {args.repeat}...")
+    with open(os.devnull, "w") as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+        # The first run pays for one-off setup (imports, pydantic schemas); keep it out of the numbers
+        replay_run(next((run for run in runs if any(step.get("body") for step in run["steps"])), runs[0]), 0, phases)
+        phases.totals.clear()
+        results, elapsed = replay(runs, args, phases, profiles)
+
+    if sampler is not None:
+        sampler.stop()
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    report, own_ms = phase_report(phases, results)
+    print_report(report, own_ms, results, elapsed, args)
+
+    if profiles:
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(args.cprofile)
+        print(f"\n📈 Top functions by own time (full profile in {args.cprofile}):")
+        stats.sort_stats("tottime").print_stats(15)
+    if sampler is not None:
+        sampler.write(args.sample)
+        print(f"📈 {sampler.samples} stack samples in {args.sample}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "config": {key: value for key, value in vars(args).items() if key != "output"},
+                "elapsed_s": round(elapsed, 3),
+                "own_overhead_ms_per_run": round(own_ms / len(results), 3),
+                "phases": report,
+                "runs": results,
+            }, f, indent=2)
+        print(f"\n💾 Saved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
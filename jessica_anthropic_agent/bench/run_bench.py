@@ -0,0 +1,263 @@
+"""
+Offline benchmark and load test for the /explain endpoint.
+
+Starts the mock upstreams (mock_upstreams.py) and an agent server pointed
+at them, then drives POST /explain at fixed concurrency levels. Reports
+throughput, p50/p95/p99 latency, tokens per request, LLM calls per
+request and tool calls per request. Nothing leaves the machine and no
+API keys are needed.
+
+    python bench/run_bench.py                        # Flask server, default levels
+    python bench/run_bench.py --server asgi --workers 2
+    python bench/run_bench.py --server gunicorn --workers 4
+    python bench/run_bench.py --save-baseline        # record bench/baselines/<name>.json
+    python bench/run_bench.py --baseline bench/baselines/default.json   # exit 1 on regression
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AGENT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, AGENT_DIR)
+
+from latency import nearest_rank  # noqa: E402
+from mock_upstreams import (  # noqa: E402
+    add_profile_arguments,
+    agent_env,
+    profile_from_args,
+    start_mocks,
+    stop_mocks,
+)
+
+TERMS = [
+    "CRISPR", "cytokine storm", "mRNA", "monoclonal antibody", "apoptosis", "TP53",
+    "interleukin-6", "mitochondria", "T cell", "insulin receptor", "ribosome", "DNA polymerase",
+]
+
+# Relative worsening allowed before a metric counts as a regression
+DEFAULT_TOLERANCE = 0.20
+
+
+def start_server(kind, port, workers, env):
+    """Start the agent server in a subprocess and wait until /health answers."""
+    if kind == "asgi":
+        command = [sys.executable, "asgi_server.py", "--port", str(port), "--workers", str(workers)]
+    elif kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                   "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "server:app"]
+    else:
+        command = [sys.executable, "-c",
+                   f"import server; server.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+
+    process = subprocess.Popen(
+        command, cwd=AGENT_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{url}/health", timeout=1).ok:
+                return process, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not become healthy within 30s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_level(url, mocks, concurrency, total_requests, term_pool, run_id, extra_body):
+    """Send total_requests to /explain with `concurrency` clients; returns the level's metrics."""
+    for mock in mocks.values():
+        mock.reset_stats()
+
+    def one(n):
+        if term_pool:
+            term = TERMS[n % min(term_pool, len(TERMS))]
+        else:
+            # A fresh term every time, so the explanation cache never hits
+            term = f"{TERMS[n % len(TERMS)]} {run_id}-{concurrency}-{n}"
+        body = {
+            "term": term,
+            "page_context": {
+                "title": "Benchmark Article",
+                "url": "https://example.com/bench",
+                "surrounding_text": f"This article discusses {term} and related biology."
+            },
+            **extra_body,
+        }
+        started = time.perf_counter()
+        try:
+            response = requests.post(f"{url}/explain", json=body, timeout=120)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - started) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(ms for ms, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    anthropic = mocks["anthropic"].stats
+    tool_calls = (
+        mocks["eutils"].stats["paths"].get("/entrez/eutils/esearch.fcgi", 0)
+        + mocks["wikipedia"].stats["requests"]
+        + mocks["uniprot"].stats["requests"]
+    )
+
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "throughput_rps": round(total_requests / elapsed, 3),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 1),
+            "p50": round(nearest_rank(latencies, 50), 1),
+            "p95": round(nearest_rank(latencies, 95), 1),
+            "p99": round(nearest_rank(latencies, 99), 1),
+            "max": round(latencies[-1], 1),
+        },
+        "tokens_per_request": {
+            field: round(count / total_requests, 1) for field, count in anthropic["tokens"].items()
+        },
+        "llm_calls_per_request": round(anthropic["requests"] / total_requests, 3),
+        "tool_calls_per_request": round(tool_calls / total_requests, 3),
+        "upstream_requests": {name: mock.stats["requests"] for name, mock in mocks.items()},
+    }
+
+
+def compare(results, baseline, tolerance):
+    """List the metrics that got worse than the baseline by more than `tolerance`."""
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in results["levels"]:
+        base = baseline_levels.get(level["concurrency"])
+        if base is None:
+            continue
+        checks = [
+            ("p95 latency", level["latency_ms"]["p95"], base["latency_ms"]["p95"], True),
+            ("p99 latency", level["latency_ms"]["p99"], base["latency_ms"]["p99"], True),
+            ("throughput", level["throughput_rps"], base["throughput_rps"], False),
+            ("input tokens/request", level["tokens_per_request"]["input_tokens"],
+             base["tokens_per_request"]["input_tokens"], True),
+            ("tool calls/request", level["tool_calls_per_request"], base["tool_calls_per_request"], True),
+        ]
+        for name, value, reference, lower_is_better in checks:
+            if not reference:
+                continue
+            change = (value - reference) / reference
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(
+                    f"c={level['concurrency']}: {name} {reference} -> {value} ({change:+.0%})"
+                )
+    return regressions
+
+
+def print_table(results):
+    print(f"\n{'conc':>5} {'req':>5} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'in tok':>8} {'out tok':>8} {'llm/req':>8} {'tools/req':>9}")
+    for level in results["levels"]:
+        latency = level["latency_ms"]
+        tokens = level["tokens_per_request"]
+        print(f"{level['concurrency']:>5} {level['requests']:>5} {level['errors']:>4} "
+              f"{level['throughput_rps']:>8.2f} {latency['p50']:>8.0f} {latency['p95']:>8.0f} "
+              f"{latency['p99']:>8.0f} {tokens['input_tokens']:>8.0f} {tokens['output_tokens']:>8.0f} "
+              f"{level['llm_calls_per_request']:>8.2f} {level['tool_calls_per_request']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /explain against local mock upstreams")
+    parser.add_argument("--name", default="default", help="Name of this benchmark profile")
+    parser.add_argument("--server", choices=["flask", "asgi", "gunicorn"], default="flask")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (asgi, gunicorn)")
+    parser.add_argument("--port", type=int, default=5057)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=48, help="Requests per concurrency level")
+    parser.add_argument("--term-pool", type=int, default=0,
+                        help="Cycle through this many terms (0 = every request unique, no cache hits)")
+    parser.add_argument("--retrieval-mode", choices=["agent", "prefetch", "auto"],
+                        help="retrieval_mode to send with each request")
+    parser.add_argument("--output", help="Where to write results JSON")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write results to bench/baselines/<name>.json")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    profile = profile_from_args(args)
+    mocks = start_mocks(profile)
+    env = {**os.environ, **agent_env(mocks), "API_KEY": "bench", "EXPLAIN_CACHE_DB": "", "SHARED_CACHE_URL": ""}
+
+    extra_body = {"retrieval_mode": args.retrieval_mode} if args.retrieval_mode else {}
+    run_id = int(time.time())
+
+    print(f"🏁 Benchmarking {args.server} server against mock upstreams...")
+    process, url = start_server(args.server, args.port, args.workers, env)
+    try:
+        levels = []
+        for concurrency in args.concurrency:
+            print(f"   concurrency {concurrency}: {args.requests} requests")
+            levels.append(run_level(
+                url, mocks, concurrency, args.requests, args.term_pool, run_id, extra_body
+            ))
+    finally:
+        stop_server(process)
+        stop_mocks(mocks)
+
+    results = {
+        "name": args.name,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "server": args.server,
+            "workers": args.workers,
+            "requests_per_level": args.requests,
+            "term_pool": args.term_pool,
+            "retrieval_mode": args.retrieval_mode,
+            "profile": profile,
+        },
+        "levels": levels,
+    }
+    print_table(results)
+
+    outputs = [args.output] if args.output else []
+    if args.save_baseline:
+        outputs.append(os.path.join(BENCH_DIR, "baselines", f"{args.name}.json"))
+    for path in outputs:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Saved results to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Throughput by number of worker processes, with per-process and shared caches.
+
+Starts the mock upstreams (mock_upstreams.py) and the shared cache
+stand-in (shared_cache.LocalRespServer). Then, for each worker count, it
+starts the agent server with that many workers twice: once with only
+per-process caches and once with SHARED_CACHE_URL pointing at the stand-in.
+Each run starts cold and sends --requests requests for --term-pool terms,
+so most of them can be answered from cache if the cache has seen the term.
+Reports throughput, latency, Claude calls per request (fewer means more
+cache hits) and speedup over one worker with the same caches.
+
+    python bench/scaling_bench.py                            # asgi, 1 2 4 workers
+    python bench/scaling_bench.py --server gunicorn --workers 1 2 4 8
+    python bench/scaling_bench.py --anthropic-latency 20 --eutils-latency 5 \\
+        --wikipedia-latency 5 --uniprot-latency 5            # CPU-bound servers
+
+With the default mock latencies the servers mostly wait, and the shared
+cache shows up as fewer Claude calls. With low latencies the servers are
+CPU-bound and throughput scales with cores, up to os.cpu_count().
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from mock_upstreams import (  # noqa: E402
+    add_profile_arguments,
+    agent_env,
+    profile_from_args,
+    start_mocks,
+    stop_mocks,
+)
+from run_bench import run_level, start_server, stop_server  # noqa: E402
+from shared_cache import LocalRespServer, RespConnection  # noqa: E402
+
+
+def run_config(args, mocks, cache_url, cache, workers):
+    """One cold server with `workers` processes; returns its level metrics."""
+    env = {**os.environ, **agent_env(mocks), "API_KEY": "bench", "EXPLAIN_CACHE_DB": "",
+           "SHARED_CACHE_URL": cache_url if cache == "shared" else ""}
+    if cache == "shared":
+        conn = RespConnection(cache_url)
+        conn.command("FLUSHDB")
+        conn.close()
+
+    process, url = start_server(args.server, args.port, workers, env)
+    try:
+        # Let every worker come up before the clock starts
+        time.sleep(args.warmup)
+        level = run_level(url, mocks, args.concurrency, args.requests, args.term_pool, int(time.time()), {})
+    finally:
+        stop_server(process)
+    return {"workers": workers, "cache": cache, **level}
+
+
+def print_table(runs):
+    print(f"\n{'cache':<7} {'workers':>7} {'err':>4} {'rps':>8} {'speedup':>8} {'p50':>8} {'p95':>8} "
+          f"{'llm/req':>8} {'tools/req':>9}")
+    base = {}
+    for run in runs:
+        base.setdefault(run["cache"], run["throughput_rps"])
+        latency = run["latency_ms"]
+        print(f"{run['cache']:<7} {run['workers']:>7} {run['errors']:>4} {run['throughput_rps']:>8.2f} "
+              f"{run['throughput_rps'] / base[run['cache']]:>7.2f}x {latency['p50']:>8.0f} "
+              f"{latency['p95']:>8.0f} {run['llm_calls_per_request']:>8.2f} "
+              f"{run['tool_calls_per_request']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput by worker processes and cache sharing")
+    parser.add_argument("--server", choices=["asgi", "gunicorn"], default="asgi")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--cache", choices=["local", "shared"], nargs="+", default=["local", "shared"])
+    parser.add_argument("--port", type=int, default=5058)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=192, help="Requests per run")
+    parser.add_argument("--term-pool", type=int, default=12, help="Distinct terms requested (at most 12)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds to wait after the server is up")
+    parser.add_argument("--output", help="Where to write results JSON")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    mocks = start_mocks(profile_from_args(args))
+    cache_server = LocalRespServer()
+    threading.Thread(target=cache_server.serve_forever, daemon=True).start()
+
+    print(f"🏁 Scaling {args.server} workers {args.workers} on {os.cpu_count()} core(s)...")
+    runs = []
+    try:
+        for cache in args.cache:
+            for workers in args.workers:
+                print(f"   {cache} caches, {workers} worker(s): {args.requests} requests")
+                runs.append(run_config(args, mocks, cache_server.url, cache, workers))
+    finally:
+        stop_mocks(mocks)
+        cache_server.shutdown()
+        cache_server.server_close()
+    print_table(runs)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "cpu_count": os.cpu_count(),
+                "config": {key: value for key, value in vars(args).items() if key != "output"},
+                "runs": runs,
+            }, f, indent=2)
+        print(f"\n💾 Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
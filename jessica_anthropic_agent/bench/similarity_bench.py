@@ -0,0 +1,155 @@
+"""
+Offline benchmark for similarity.py: hit rate gained and lookup latency.
+
+Fills a TermMatcher with synthetic biomedical-looking terms (100k by
+default), then looks up spelling variants of cached terms (case, plurals,
+hyphens, Greek letters, typos) and terms that were never cached. Reports,
+per kind of variant, how often an exact normalized key would have hit,
+how often the matcher finds the cached term, and how often it picks the
+wrong one. Unseen terms should resolve to themselves; any match there is
+a false positive.
+
+    python bench/similarity_bench.py
+    python bench/similarity_bench.py --terms 200000 --threshold 0.8 --ngram 2
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from cache import normalize_term  # noqa: E402
+from latency import nearest_rank  # noqa: E402
+import similarity  # noqa: E402
+
+# Word parts are more than one edit apart: distinct terms a single typo
+# apart ("chemokinase"/"hemokinase") can't be told apart by spelling
+PREFIXES = ["inter", "cyto", "neuro", "immuno", "hemo", "glyco", "phospho", "lipo", "myo", "osteo",
+            "chondro", "angio", "thrombo", "lympho", "nephro", "hepato", "cardio", "fibro", "adipo", "erythro",
+            "dermo", "gastro", "pneumo", "endo", "exo", "macro", "micro", "retro", "proto", "syn"]
+ROOTS = ["kine", "leukin", "globin", "protein", "kinase", "lysin", "statin", "genin", "tropin", "nectin",
+         "plasmin", "toxin", "cidin", "ferrin", "modulin", "sialin", "sporin", "actin", "tensin", "versican",
+         "tubulin", "keratin", "mucin", "integrin", "cadherin", "laminin", "defensin", "opsin", "tachin", "zymin"]
+HEADS = ["", "receptor", "complex", "pathway", "inhibitor", "binding protein", "deficiency",
+         "antibody", "transporter", "channel", "signaling", "factor", "syndrome", "domain"]
+SUFFIXES = ["", "1", "2", "3", "6", "8", "12", "a", "b", "alpha", "beta", "gamma"]
+GREEK_SYMBOLS = {name: letter for letter, name in similarity.GREEK_LETTERS.items() if letter != "ς"}
+
+
+def synthetic_terms():
+    """Distinct terms, many of them one number or letter apart."""
+    for prefix, root, head, suffix in itertools.product(PREFIXES, ROOTS, HEADS, SUFFIXES):
+        yield " ".join(part for part in (prefix + root, suffix, head) if part)
+
+
+def typo(term, rng):
+    """One deletion, substitution or transposition inside the longest word."""
+    words = term.split()
+    n = max(range(len(words)), key=lambda i: len(words[i]))
+    word = words[n]
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(["delete", "substitute", "transpose"])
+    if kind == "delete":
+        word = word[:i] + word[i + 1:]
+    elif kind == "substitute":
+        word = word[:i] + rng.choice("aeioutnrs".replace(word[i], "")) + word[i + 1:]
+    else:
+        word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    words[n] = word
+    return " ".join(words)
+
+
+def plural(term):
+    if term.endswith("y"):
+        return term[:-1] + "ies"
+    return term + "s" if not term.endswith("s") else term
+
+
+def variants(term, rng):
+    """(kind, variant) pairs of a cached term; kinds that don't apply are skipped."""
+    out = [("case", term.upper() if rng.random() < 0.5 else term.title())]
+    if not term.split()[-1].isdigit() and len(term.split()[-1]) > 2:
+        out.append(("plural", plural(term)))
+    if " " in term:
+        out.append(("hyphen", term.replace(" ", "-", 1)))
+    greek = [w for w in term.split() if w in GREEK_SYMBOLS]
+    if greek:
+        out.append(("greek", term.replace(" " + greek[0], "-" + GREEK_SYMBOLS[greek[0]])))
+    if max(len(w) for w in term.split()) >= 6:
+        out.append(("typo", typo(term, rng)))
+    return out
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    terms = list(itertools.islice(synthetic_terms(), args.terms + args.unseen))
+    if len(terms) < args.terms + args.unseen:
+        raise SystemExit(f"Only {len(terms)} synthetic terms available")
+    rng.shuffle(terms)
+    cached, unseen = terms[:args.terms], terms[args.terms:]
+
+    matcher = similarity.TermMatcher(threshold=args.threshold, n=args.ngram, max_terms=len(cached))
+    started = time.perf_counter()
+    for term in cached:
+        matcher.add(term)
+    build_s = time.perf_counter() - started
+
+    queries = []
+    for term in rng.sample(cached, args.queries):
+        queries.extend((kind, variant, term) for kind, variant in variants(term, rng))
+    queries.extend(("unseen", term, None) for term in unseen)
+
+    rows = {}
+    latencies = []
+    for kind, query, original in queries:
+        started = time.perf_counter()
+        name = matcher.resolve(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        row = rows.setdefault(kind, {"queries": 0, "exact_key": 0, "matched": 0, "wrong": 0})
+        row["queries"] += 1
+        if original is None:
+            row["wrong"] += name != similarity.canonical_term(query)
+            continue
+        expected = similarity.canonical_term(original)
+        row["exact_key"] += normalize_term(query) == normalize_term(original)
+        row["matched"] += name == expected
+        row["wrong"] += name != expected and name in matcher._ids
+
+    latencies.sort()
+    postings_mb = sum(ids.nbytes for ids, _ in matcher._postings.values()) / 1e6
+    print(f"\n{len(matcher):,} cached terms, {args.ngram}-grams, threshold {args.threshold}")
+    print(f"Build {build_s:.1f} s, {len(matcher._postings):,} n-grams, posting arrays {postings_mb:.1f} MB")
+    print(f"Lookup p50 {nearest_rank(latencies, 50):.3f} ms, p95 {nearest_rank(latencies, 95):.3f} ms, "
+          f"p99 {nearest_rank(latencies, 99):.3f} ms over {len(latencies):,} lookups\n")
+    print(f"{'variant':<8} {'queries':>8} {'exact key':>10} {'matched':>8} {'wrong':>6}")
+    total = {"queries": 0, "exact_key": 0, "matched": 0}
+    for kind, row in rows.items():
+        n = row["queries"]
+        if kind == "unseen":
+            print(f"{kind:<8} {n:>8} {'':>10} {'':>8} {row['wrong'] / n:>6.1%}")
+            continue
+        for field in total:
+            total[field] += row[field]
+        print(f"{kind:<8} {n:>8} {row['exact_key'] / n:>10.1%} {row['matched'] / n:>8.1%} {row['wrong'] / n:>6.1%}")
+    n = total["queries"]
+    print(f"\nHit rate on variants: {total['exact_key'] / n:.1%} with exact keys, "
+          f"{total['matched'] / n:.1%} with similarity matching")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark similarity matching of cached terms")
+    parser.add_argument("--terms", type=int, default=100000, help="Cached terms")
+    parser.add_argument("--unseen", type=int, default=2000, help="Terms looked up that were never cached")
+    parser.add_argument("--queries", type=int, default=2000, help="Cached terms to look up variants of")
+    parser.add_argument("--threshold", type=float, default=similarity.SIMILARITY_THRESHOLD)
+    parser.add_argument("--ngram", type=int, default=similarity.SIMILARITY_NGRAM)
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,10 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+# Local modules read their settings from the environment when imported
+from tool_executor import run_tool_calls
+from http_client import EUTILS_URL, UNIPROT_API_URL, WIKIPEDIA_API_URL, http_get
+
 # Initialize Anthropic client
 api_key = os.environ.get("API_KEY")
 if not api_key:
@@ -15,6 +19,9 @@ if not api_key:
 
 client = Anthropic(api_key=api_key)
 
+# At most this many calls to Claude per query; the last one may not use tools
+MAX_AGENT_ROUNDS = int(os.environ.get("MAX_AGENT_ROUNDS", "4"))
+
 # Define tools
 tools = [
     {
@@ -72,14 +79,14 @@ def search_pubmed(term, max_results=3):
     """Search PubMed and return article summaries."""
     try:
         # Search for article IDs
-        search_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+        search_url = f"{EUTILS_URL}/esearch.fcgi"
         search_params = {
             "db": "pubmed",
             "term": term,
             "retmax": max_results,
             "retmode": "json"
         }
-        search_response = requests.get(search_url, params=search_params)
+        search_response = http_get(search_url, params=search_params)
         search_data = search_response.json()
 
         ids = search_data.get("esearchresult", {}).get("idlist", [])
@@ -88,13 +95,13 @@ def search_pubmed(term, max_results=3):
             return {"error": "No results found"}
 
         # Fetch article details
-        summary_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+        summary_url = f"{EUTILS_URL}/esummary.fcgi"
         summary_params = {
             "db": "pubmed",
             "id": ",".join(ids),
             "retmode": "json"
         }
-        summary_response = requests.get(summary_url, params=summary_params)
+        summary_response = http_get(summary_url, params=summary_params)
         summary_data = summary_response.json()
 
         return summary_data.get("result", {})
@@ -106,8 +113,8 @@ def search_pubmed(term, max_results=3):
 def get_wikipedia_summary(term):
     """Get Wikipedia summary for a term."""
     try:
-        url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{requests.utils.quote(term)}"
-        response = requests.get(url)
+        url = f"{WIKIPEDIA_API_URL}/page/summary/{requests.utils.quote(term)}"
+        response = http_get(url)
         data = response.json()
 
         return {
@@ -123,13 +130,13 @@ def get_wikipedia_summary(term):
 def search_uniprot(protein_name):
     """Search UniProt for protein information."""
     try:
-        url = "https://rest.uniprot.org/uniprotkb/search"
+        url = f"{UNIPROT_API_URL}/uniprotkb/search"
         params = {
             "query": protein_name,
             "format": "json",
             "size": 3
         }
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         return response.json()
 
     except Exception as e:
@@ -199,12 +206,14 @@ Be concise but thorough."""
     # Agent loop
     print(f"\n🔍 Processing query: {term}")
 
-    while True:
+    for round_number in range(1, MAX_AGENT_ROUNDS + 1):
+        final_round = round_number == MAX_AGENT_ROUNDS
         response = client.messages.create(
             model="claude-sonnet-4-5-20250929",
             max_tokens=2000,
             system=system_prompt,
             tools=tools,
+            tool_choice={"type": "none"} if final_round else {"type": "auto"},
             messages=messages
         )
 
@@ -218,22 +227,23 @@ Be concise but thorough."""
                 "content": response.content
             })
 
-            # Execute all requested tools
-            tool_results = []
-            for block in response.content:
-                if block.type == "tool_use":
-                    tool_name = block.name
-                    tool_input = block.input
+            # Execute all requested tools concurrently, keeping their order
+            tool_blocks = [block for block in response.content if block.type == "tool_use"]
+            for block in tool_blocks:
+                print(f"🔧 Calling tool: {block.name} with input: {block.input}")
 
-                    print(f"🔧 Calling tool: {tool_name} with input: {tool_input}")
+            results = run_tool_calls(
+                [(block.name, block.input) for block in tool_blocks],
+                execute_tool
+            )
 
-                    result = execute_tool(tool_name, tool_input)
-
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": block.id,
-                        "content": str(result)
-                    })
+            tool_results = []
+            for block, result in zip(tool_blocks, results):
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": block.id,
+                    "content": str(result)
+                })
 
             # Add tool results to messages
             messages.append({
@@ -254,6 +264,8 @@ Be concise but thorough."""
             # Unexpected stop reason
             return f"Unexpected stop reason: {response.stop_reason}"
 
+    return f"Stopped after {MAX_AGENT_ROUNDS} rounds without a final answer"
+
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,196 @@
+"""
+Opt-in capture of agent runs, for replaying them offline (see replay.py).
+
+With CAPTURE_FILE set, each agent run (a /explain miss, a stream, a
+batch item or a follow-up) is appended to that file as one JSON line:
+the request, then every Claude response and tool result the loop
+received, with their timings, then the done event. A "{pid}" in the path
+is replaced by the process id, so each worker writes its own file.
+
+Runs are picked at CAPTURE_SAMPLE_RATE. Lines are built and written by a
+background thread, so requests don't wait for the disk. When the
+thread's queue is full, runs are dropped. Capture stops once a file
+reaches CAPTURE_MAX_MB.
+
+With CAPTURE_REDACT on (the default), every string is redacted before it
+is written: email addresses, phone numbers, IP addresses, API keys,
+bearer tokens and URL query strings. Client identities and headers are
+never captured.
+"""
+import json
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+
+from tracing import current_trace
+
+CAPTURE_FILE = os.environ.get("CAPTURE_FILE")
+CAPTURE_SAMPLE_RATE = float(os.environ.get("CAPTURE_SAMPLE_RATE", "1"))
+CAPTURE_REDACT = os.environ.get("CAPTURE_REDACT", "true").lower() == "true"
+CAPTURE_MAX_MB = float(os.environ.get("CAPTURE_MAX_MB", "512"))
+CAPTURE_QUEUE_SIZE = 1000
+
+REDACTIONS = [
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), "[email]"),
+    (re.compile(r"\bsk-[\w-]{16,}"), "[key]"),
+    (re.compile(r"\bBearer\s+[\w.~+/-]+=*", re.IGNORECASE), "Bearer [token]"),
+    (re.compile(r"(https?://[^\s?#\"']+)\?[^\s#\"']*"), r"\1?[query]"),
+    (re.compile(r"\+\d{1,3}[\s.-]?\(?\d{2,4}\)?[\s.-]?\d{3,4}[\s.-]?\d{3,4}\b|\(\d{3}\)\s?\d{3}-\d{4}\b"), "[phone]"),
+    (re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b"), "[ip]"),
+]
+
+_queue = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"captured": 0, "dropped": 0, "bytes": 0, "full": False}
+
+
+def redact_text(text):
+    for pattern, replacement in REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def redact(value):
+    """A redacted copy of a JSON-like value; the original is left alone."""
+    if isinstance(value, str):
+        return redact_text(value)
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def capture_path():
+    return CAPTURE_FILE.replace("{pid}", str(os.getpid()))
+
+
+def captured(steps, term, page_context, difficulty_level, length, retrieval_mode, history, followup):
+    """steps (an agent_loop generator started with these arguments), recorded if this run is captured."""
+    if not CAPTURE_FILE or _stats["full"] or random.random() >= CAPTURE_SAMPLE_RATE:
+        return steps
+    return _record(steps, {
+        "term": term,
+        "page_context": page_context,
+        "difficulty_level": difficulty_level,
+        "length": length,
+        "retrieval_mode": retrieval_mode,
+        "history": history,
+        "followup": followup,
+    })
+
+
+def _record(steps, request):
+    """Pass steps' requests to the driver and its replies back, noting the llm and tools ones."""
+    trace = current_trace()
+    run = {
+        "id": secrets.token_hex(8),
+        "ts": round(time.time(), 3),
+        "endpoint": trace.endpoint if trace is not None else None,
+        "request": request,
+        "steps": [],
+        "done": None,
+    }
+    started = time.perf_counter()
+    reply = error = None
+    try:
+        while True:
+            try:
+                kind, payload = steps.throw(error) if error else steps.send(reply)
+            except StopIteration:
+                return
+            finally:
+                # Its traceback holds this frame; keeping it would delay the write until a gc pass
+                error = None
+            asked = time.perf_counter()
+            try:
+                reply, error = (yield kind, payload), None
+            except Exception as e:
+                reply, error = None, e
+
+            if kind == "llm":
+                run["steps"].append(_llm_step(payload, reply, error, asked - started, time.perf_counter() - asked))
+            elif kind == "tools":
+                run["steps"].append({
+                    "kind": "tools",
+                    "offset_ms": round((asked - started) * 1000, 1),
+                    "duration_ms": round((time.perf_counter() - asked) * 1000, 1),
+                    "calls": [[name, tool_input] for name, tool_input in payload["calls"]],
+                    "results": reply,
+                })
+            elif kind == "event" and payload[0] == "done":
+                run["done"] = {key: value for key, value in payload[1].items() if key != "messages"}
+    finally:
+        run["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        _enqueue(run)
+
+
+def _llm_step(request_args, response, error, offset, duration):
+    return {
+        "kind": "llm",
+        "offset_ms": round(offset * 1000, 1),
+        "duration_ms": round(duration * 1000, 1),
+        # Enough of the request to notice a replay going a different way
+        "request": {
+            "model": request_args["model"],
+            "max_tokens": request_args["max_tokens"],
+            "messages": len(request_args["messages"]),
+            "tool_choice": request_args.get("tool_choice"),
+        },
+        "response": response.model_dump(mode="json") if response is not None else None,
+        "error": {"type": type(error).__name__, "message": str(error)} if error is not None else None,
+    }
+
+
+def _enqueue(run):
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_runs, name="capture", daemon=True)
+                _writer.start()
+    try:
+        _queue.put_nowait(run)
+    except queue.Full:
+        with _stats_lock:
+            _stats["dropped"] += 1
+
+
+def _write_runs():
+    while True:
+        run = _queue.get()
+        try:
+            line = json.dumps(redact(run) if CAPTURE_REDACT else run, default=str) + "\n"
+            with open(capture_path(), "a") as f:
+                f.write(line)
+                size = f.tell()
+        except Exception as e:
+            print(f"⚠️  Couldn't write a captured run: {e}")
+            with _stats_lock:
+                _stats["dropped"] += 1
+            continue
+        with _stats_lock:
+            _stats["captured"] += 1
+            _stats["bytes"] = size
+            if size >= CAPTURE_MAX_MB * 1e6 and not _stats["full"]:
+                _stats["full"] = True
+                print(f"⚠️  {capture_path()} reached {CAPTURE_MAX_MB:.0f} MB; capture stopped")
+
+
+def capture_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        "enabled": bool(CAPTURE_FILE),
+        "file": capture_path() if CAPTURE_FILE else None,
+        "sample_rate": CAPTURE_SAMPLE_RATE,
+        "redact": CAPTURE_REDACT,
+        "queued": _queue.qsize(),
+        **stats,
+    }
@@ -0,0 +1,199 @@
+"""
+Trims page_context["surrounding_text"] to the part that is about the term.
+
+The extension can send kilobytes of article text, and the system prompt
+carries it on every call of the agent loop. reduce_context() keeps:
+
+- the sentences that mention the term (matched like the caches match
+  terms, so "TNF-α" is found for "TNF alpha"), then their neighbours up
+  to CONTEXT_WINDOW_SENTENCES away, nearest first;
+- or the opening sentences when the term isn't mentioned;
+
+within CONTEXT_TOKEN_BUDGET tokens, in page order, with "…" where
+sentences were left out. Repeated sentences and page furniture (cookie
+banners, "Sign in", share links, lone menu words) are dropped first.
+
+Sentences of a page are cached by its URL and text, and reduced contexts
+by page and term, so other lookups on the same article skip the work.
+A budget of 0 turns reduction off.
+"""
+import os
+import re
+import threading
+
+from cache import LRUCache, context_fingerprint
+from similarity import canonical_term, normalize_words
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "300"))
+CONTEXT_WINDOW_SENTENCES = int(os.environ.get("CONTEXT_WINDOW_SENTENCES", "2"))
+CONTEXT_CACHE_SIZE = int(os.environ.get("CONTEXT_CACHE_SIZE", "2048"))
+CONTEXT_CACHE_TTL = float(os.environ.get("CONTEXT_CACHE_TTL", "3600"))
+CHARS_PER_TOKEN = 4
+GAP = " … "
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])|\s*\n\s*")
+# A sentence ending in one of these was split too early ("Fig. 2", "et al. 2020")
+_ABBREVIATION = re.compile(r"\b(?:fig|figs|et al|e\.g|i\.e|vs|approx|ca|no|ref|refs|dr|st)\.$", re.IGNORECASE)
+_BOILERPLATE = re.compile(
+    r"\b(?:cookies?|sign (?:in|up)|log ?in|subscribe|newsletter|advertisement|all rights reserved"
+    r"|privacy policy|terms of (?:use|service)|share (?:this|on)|click here|skip to (?:main )?content"
+    r"|download pdf|back to top)\b",
+    re.IGNORECASE,
+)
+# Fragments this short (in words) are navigation, captions or headings
+MIN_SENTENCE_WORDS = 3
+
+sentence_cache = LRUCache(max_entries=CONTEXT_CACHE_SIZE, ttl=CONTEXT_CACHE_TTL)
+reduced_cache = LRUCache(max_entries=CONTEXT_CACHE_SIZE, ttl=CONTEXT_CACHE_TTL)
+
+_stats_lock = threading.Lock()
+_stats = {"reduced": 0, "unchanged": 0, "original_tokens": 0, "reduced_tokens": 0}
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+def split_sentences(text):
+    """Sentences of text, with splits after abbreviations undone."""
+    sentences = []
+    for piece in _SENTENCE_END.split(text):
+        piece = " ".join(piece.split())
+        if not piece:
+            continue
+        if sentences and _ABBREVIATION.search(sentences[-1]):
+            sentences[-1] += " " + piece
+        else:
+            sentences.append(piece)
+    return sentences
+
+
+def page_sentences(text):
+    """
+    The sentences worth keeping, as (sentence, normalized words) pairs:
+    repeats and page furniture are dropped.
+    """
+    seen = set()
+    kept = []
+    for sentence in split_sentences(text):
+        words = normalize_words(sentence)
+        if words in seen:
+            continue
+        seen.add(words)
+        kept.append((sentence, f" {words} "))
+    return kept
+
+
+def is_furniture(sentence):
+    return len(sentence.split()) < MIN_SENTENCE_WORDS or _BOILERPLATE.search(sentence) is not None
+
+
+def select_sentences(sentences, term, max_chars):
+    """Page-ordered indexes of the sentences to keep for term, within max_chars."""
+    needles = {f" {canonical_term(term)} ", f" {normalize_words(term)} "}
+    hits = [i for i, (_, words) in enumerate(sentences) if any(n in words for n in needles)]
+    if hits:
+        order = hits + [
+            i + offset
+            for distance in range(1, CONTEXT_WINDOW_SENTENCES + 1)
+            for i in hits
+            for offset in (-distance, distance)
+        ]
+    else:
+        order = range(len(sentences))
+
+    chosen = set()
+    used = 0
+    for i in order:
+        if i < 0 or i >= len(sentences) or i in chosen:
+            continue
+        sentence = sentences[i][0]
+        if i not in hits and is_furniture(sentence):
+            continue
+        if used + len(sentence) + len(GAP) > max_chars:
+            if hits:
+                continue
+            break
+        chosen.add(i)
+        used += len(sentence) + len(GAP)
+    return sorted(chosen)
+
+
+def join_sentences(sentences, indexes):
+    """The chosen sentences in page order, with GAP where others were left out."""
+    parts = []
+    previous = None
+    for i in indexes:
+        if parts and i != previous + 1:
+            parts.append(GAP.strip())
+        parts.append(sentences[i][0])
+        previous = i
+    if indexes and indexes[0] != 0:
+        parts.insert(0, GAP.strip())
+    if indexes and indexes[-1] != len(sentences) - 1:
+        parts.append(GAP.strip())
+    return " ".join(parts)
+
+
+def reduce_text(term, text, max_chars):
+    """surrounding_text cut down to the sentences about term, within max_chars."""
+    fingerprint = context_fingerprint({"surrounding_text": text})
+    sentences = sentence_cache.get(fingerprint)
+    if sentences is None:
+        sentences = page_sentences(text)
+        sentence_cache.set(fingerprint, sentences)
+
+    reduced = join_sentences(sentences, select_sentences(sentences, term, max_chars))
+    if not reduced:
+        # One sentence is over budget on its own: keep its start
+        reduced = text[:max_chars - 1].rstrip() + "…"
+    return reduced
+
+
+def reduce_context(term, page_context):
+    """
+    (page_context with surrounding_text reduced for term, stats), where
+    stats has the original and reduced token estimates, the tokens saved
+    per call to Claude, and whether the reduction came from the cache.
+    """
+    text = page_context.get("surrounding_text") or ""
+    original_tokens = estimate_tokens(text)
+    max_chars = CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN
+    cached = False
+    if not CONTEXT_TOKEN_BUDGET or len(text) <= max_chars:
+        reduced = text
+    else:
+        key = f"{context_fingerprint(page_context)}:{canonical_term(term)}"
+        reduced = reduced_cache.get(key)
+        cached = reduced is not None
+        if reduced is None:
+            reduced = reduce_text(term, text, max_chars)
+            reduced_cache.set(key, reduced)
+
+    reduced_tokens = estimate_tokens(reduced)
+    with _stats_lock:
+        _stats["reduced" if reduced is not text else "unchanged"] += 1
+        _stats["original_tokens"] += original_tokens
+        _stats["reduced_tokens"] += reduced_tokens
+
+    if reduced is not text:
+        page_context = {**page_context, "surrounding_text": reduced}
+    return page_context, {
+        "original_tokens": original_tokens,
+        "reduced_tokens": reduced_tokens,
+        "saved_tokens": original_tokens - reduced_tokens,
+        "cached": cached,
+    }
+
+
+def context_stats():
+    """How much page context has been cut, and the reducer's cache counters."""
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        **stats,
+        "saved_tokens": stats["original_tokens"] - stats["reduced_tokens"],
+        "token_budget": CONTEXT_TOKEN_BUDGET,
+        "sentence_cache": sentence_cache.stats(),
+        "reduced_cache": reduced_cache.stats(),
+    }
@@ -0,0 +1,40 @@
+"""
+Gunicorn settings for serving server.py from several worker processes:
+
+    SHARED_CACHE_URL=redis://127.0.0.1:6379/0 gunicorn -c gunicorn.conf.py server:app
+
+Every worker has its own in-process caches, HTTP pools and Claude slots
+(LLM_CONCURRENCY and LLM_QUEUE_SIZE are per worker). Set SHARED_CACHE_URL
+so the workers share explanations, retrieval results and follow-up
+sessions (see shared_cache.py). Without it, cache hit rates drop as
+workers are added, and follow-ups need sticky routing.
+
+Requires: pip install gunicorn
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("WORKERS", multiprocessing.cpu_count()))
+# Requests mostly wait on Claude and the tools, so each worker runs threads
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", "16"))
+# An explanation can take AGENT_DEADLINE seconds after waiting for a Claude slot
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+graceful_timeout = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+# Workers import the app themselves: the Anthropic client and SQLite
+# connections are opened at import and can't be shared across a fork
+preload_app = False
+
+
+def post_fork(server, worker):
+    # HTTP pools opened in the master (by --preload or a hook) would
+    # otherwise be shared by every worker
+    from http_client import reset_sessions
+    reset_sessions()
+
+
+def when_ready(server):
+    if server.cfg.workers > 1 and not os.environ.get("SHARED_CACHE_URL"):
+        server.log.warning("SHARED_CACHE_URL is not set: each of the %d workers has its own caches "
+                           "and follow-ups need sticky routing", server.cfg.workers)
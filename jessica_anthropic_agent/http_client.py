@@ -0,0 +1,202 @@
+"""Pooled, keep-alive HTTP sessions shared by the retrieval tools."""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from rate_limit import RateLimited, TokenBucket
+from resilience import DeadlineExceeded, resilient_get
+from tool_executor import time_left
+from tracing import record_upstream
+
+# Timeouts in seconds; without them a stalled upstream pins a worker forever
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "10"))
+
+# Bounded retries for connection errors, 429 and 5xx, with jittered backoff
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.3"))
+HTTP_BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", "4"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Upstream API roots; overridable to point the tools at local stand-ins
+EUTILS_URL = os.environ.get("EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils").rstrip("/")
+WIKIPEDIA_API_URL = os.environ.get("WIKIPEDIA_API_URL", "https://en.wikipedia.org/api/rest_v1").rstrip("/")
+UNIPROT_API_URL = os.environ.get("UNIPROT_API_URL", "https://rest.uniprot.org").rstrip("/")
+
+# Connections kept open per host
+DEFAULT_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+host_pool_sizes = {
+    urlsplit(EUTILS_URL).netloc: int(os.environ.get("NCBI_POOL_SIZE", "4")),
+    urlsplit(WIKIPEDIA_API_URL).netloc: int(os.environ.get("WIKIPEDIA_POOL_SIZE", str(DEFAULT_POOL_SIZE))),
+    urlsplit(UNIPROT_API_URL).netloc: int(os.environ.get("UNIPROT_POOL_SIZE", str(DEFAULT_POOL_SIZE))),
+}
+
+# Requests per second per host, shared by every request in the process; 0 is
+# unlimited. NCBI allows 3/s without an API key. With several worker
+# processes, divide the limit between them.
+host_rate_limits = {
+    urlsplit(EUTILS_URL).netloc: float(os.environ.get("NCBI_RATE_LIMIT", "3")),
+    urlsplit(WIKIPEDIA_API_URL).netloc: float(os.environ.get("WIKIPEDIA_RATE_LIMIT", "0")),
+    urlsplit(UNIPROT_API_URL).netloc: float(os.environ.get("UNIPROT_RATE_LIMIT", "0")),
+}
+host_buckets = {host: TokenBucket(rate) for host, rate in host_rate_limits.items() if rate > 0}
+
+# A request that would queue longer than this for its host's rate limit fails
+# at once (RateLimited) instead of eating into the explanation's deadline
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", "5"))
+
+USER_AGENT = "BioForDummies/1.0 (biology explainer)"
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class JitteredRetry(Retry):
+    """
+    Retry with "full jitter": sleep a random time up to the exponential
+    backoff. Each retry then takes a token from the host's rate limit
+    (bucket), as the first attempt did, so retries can't exceed the limit.
+    """
+
+    def __init__(self, *args, host=None, bucket=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.host = host
+        self.bucket = bucket
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.host, retry.bucket = self.host, self.bucket
+        return retry
+
+    def get_backoff_time(self):
+        backoff = min(super().get_backoff_time(), HTTP_BACKOFF_MAX)
+        return random.uniform(0, backoff) if backoff else 0
+
+    def sleep(self, response=None):
+        super().sleep(response)
+        _check_time_left(self.host)
+        take_token(self.host, self.bucket)
+
+
+def _check_time_left(host):
+    """Raise DeadlineExceeded once the tool call this request is made for is due."""
+    left = time_left()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"{host}: out of time for this tool call")
+    return left
+
+
+def _bounded_timeout(timeout, host):
+    """(connect, read) timeouts cut to the time left for the current tool call, and whether they were cut."""
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    left = _check_time_left(host)
+    if left is None or left >= max(connect, read):
+        return (connect, read), False
+    return (min(connect, left), min(read, left)), True
+
+
+def take_token(host, bucket):
+    """Wait for a token from host's rate limit (if it has one); raises RateLimited if that takes too long."""
+    left = time_left()
+    max_wait = RATE_LIMIT_MAX_WAIT if left is None else max(0.0, min(RATE_LIMIT_MAX_WAIT, left))
+    if bucket is not None and not bucket.acquire(timeout=max_wait):
+        record_upstream(host, "rate_limited", 0, 0)
+        raise RateLimited(f"{host}: over its rate limit, try again shortly")
+
+
+def _build_session(host):
+    pool_size = host_pool_sizes.get(host, DEFAULT_POOL_SIZE)
+    retry = JitteredRetry(
+        host=host,
+        bucket=host_buckets.get(host),
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url):
+    """Return the shared session for the URL's host, creating it on first use."""
+    host = urlsplit(url).netloc
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _build_session(host)
+                _sessions[host] = session
+    return session
+
+
+def http_get(url, params=None, timeout=None, **kwargs):
+    """
+    GET through the host's pooled session with the configured timeouts and rate limit.
+
+    Every attempt, retries and hedges included, takes a token from the
+    host's rate limit. Raises RateLimited when a retry can't get one in
+    time, and CircuitOpen while the host's breaker is open. With
+    stream=True the body is left unread and only the wait for the headers
+    is hedged; its size is taken from Content-Length.
+
+    Inside a tool call (see tool_executor) the timeouts, the rate-limit
+    wait and the retries are kept within the time the call has left;
+    DeadlineExceeded is raised once it has none, or when a timeout that was
+    cut short for it expires.
+    """
+    host = urlsplit(url).netloc
+    bucket = host_buckets.get(host)
+    _check_time_left(host)
+    take_token(host, bucket)
+
+    def attempt():
+        started = time.perf_counter()
+        bounded, cut = _bounded_timeout(timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), host)
+        try:
+            response = get_session(url).get(url, params=params, timeout=bounded, **kwargs)
+        except requests.Timeout as e:
+            if cut:
+                # Our deadline, not the host, ran out
+                raise DeadlineExceeded(f"{host}: out of time for this tool call") from e
+            record_upstream(host, "error", 0, time.perf_counter() - started)
+            raise
+        except requests.RequestException:
+            record_upstream(host, "error", 0, time.perf_counter() - started)
+            raise
+        if kwargs.get("stream"):
+            nbytes = int(response.headers.get("Content-Length") or 0)
+        else:
+            nbytes = len(response.content)
+        record_upstream(host, response.status_code, nbytes, time.perf_counter() - started)
+        return response
+
+    # Behind the host's circuit breaker, hedged when slow (see resilience.py)
+    return resilient_get(host, attempt, may_hedge=lambda: bucket is None or bucket.try_acquire())
+
+
+def reset_sessions():
+    """Close every pooled session, e.g. in a freshly forked worker process."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def rate_limit_stats():
+    """Rate and wait counts of each rate-limited upstream host."""
+    return {host: bucket.stats() for host, bucket in host_buckets.items()}
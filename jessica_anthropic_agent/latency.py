@@ -0,0 +1,42 @@
+"""Rolling latency windows with percentile summaries."""
+import threading
+from collections import deque
+
+
+def nearest_rank(sorted_samples, p):
+    """Nearest-rank p-th percentile of an already sorted, non-empty list."""
+    rank = int(round(p / 100 * len(sorted_samples))) - 1
+    return sorted_samples[max(0, min(len(sorted_samples) - 1, rank))]
+
+
+class LatencyWindow:
+    """Keeps the most recent latency samples (ms) and summarizes their percentiles."""
+
+    def __init__(self, size=1000):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+            self.count += 1
+
+    def percentile(self, p):
+        """Nearest-rank percentile of the window, or None if it is empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        return nearest_rank(samples, p) if samples else None
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count, "p50": None, "p95": None, "p99": None, "max": None}
+        return {
+            "count": self.count,
+            "p50": nearest_rank(samples, 50),
+            "p95": nearest_rank(samples, 95),
+            "p99": nearest_rank(samples, 99),
+            "max": samples[-1],
+        }
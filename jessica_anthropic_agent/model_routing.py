@@ -0,0 +1,142 @@
+"""
+Which Claude model writes an explanation, and with how many output tokens.
+
+A one-sentence definition doesn't need the largest model. A routing table
+maps (length, difficulty_level) to a model and a max_tokens budget; rules
+are tried in order and "*" matches anything. The default table sends brief
+definitions and eli5 answers to FAST_MODEL and everything else to
+DEFAULT_MODEL.
+
+Set MODEL_ROUTES to a JSON file, or to inline JSON, to replace the table:
+
+    [
+      {"name": "brief", "length": "brief", "model": "claude-haiku-4-5-20251001",
+       "max_tokens": 300, "escalate_to": "claude-sonnet-4-5-20250929"},
+      {"name": "default", "model": "claude-sonnet-4-5-20250929", "max_tokens": 2000}
+    ]
+
+"length" and "difficulty_level" default to "*"; without "max_tokens" the
+budget follows the requested length (LENGTH_MAX_TOKENS). A route with
+"escalate_to" retries the final answer on that model when the fast one
+fails quality_problem(), unless ROUTE_ESCALATION is false.
+
+Per-route latency, output tokens and escalations are kept for /stats and
+/metrics, so the table can be tuned from real traffic.
+"""
+import json
+import os
+import threading
+
+from latency import LatencyWindow
+from metrics import Histogram, Sampled
+
+DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL", "claude-sonnet-4-5-20250929")
+FAST_MODEL = os.environ.get("FAST_MODEL", "claude-haiku-4-5-20251001")
+DEFAULT_MAX_TOKENS = 2000
+
+# Output budget by requested length, for routes that don't set max_tokens
+LENGTH_MAX_TOKENS = {"brief": 300, "short": 600, "medium": 1200, "detailed": 2000}
+
+ROUTE_ESCALATION = os.environ.get("ROUTE_ESCALATION", "true").lower() == "true"
+
+# Answers shorter than this (in characters) count as failed
+MIN_ANSWER_CHARS = int(os.environ.get("MIN_ANSWER_CHARS", "40"))
+
+DEFAULT_ROUTES = [
+    {"name": "brief", "length": "brief", "model": FAST_MODEL,
+     "max_tokens": LENGTH_MAX_TOKENS["brief"], "escalate_to": DEFAULT_MODEL},
+    {"name": "eli5", "difficulty_level": "eli5", "model": FAST_MODEL, "escalate_to": DEFAULT_MODEL},
+    {"name": "default", "model": DEFAULT_MODEL, "max_tokens": DEFAULT_MAX_TOKENS},
+]
+
+ROUTE_SECONDS = Histogram(
+    "bio_route_duration_seconds", "Wall time of agent runs by model route", ["route"]
+)
+
+
+def load_routes(spec):
+    """Parse MODEL_ROUTES: a path to a JSON file or the JSON itself."""
+    if not spec:
+        return DEFAULT_ROUTES
+    if not spec.lstrip().startswith("["):
+        with open(spec) as f:
+            spec = f.read()
+    routes = json.loads(spec)
+    for n, route in enumerate(routes):
+        if "model" not in route:
+            raise ValueError(f"MODEL_ROUTES rule {n} has no model")
+        route.setdefault("name", f"{route.get('length', '*')}/{route.get('difficulty_level', '*')}")
+    return routes
+
+
+routes = load_routes(os.environ.get("MODEL_ROUTES"))
+
+_lock = threading.Lock()
+_route_stats = {}
+
+
+def choose_route(length, difficulty_level):
+    """
+    The first rule matching the request, as {"name", "model", "max_tokens",
+    "escalate_to", "escalate_max_tokens"}; escalate_to is None when the
+    route has no escalation (or escalation is off).
+    """
+    for rule in routes:
+        if rule.get("length", "*") in ("*", length) and rule.get("difficulty_level", "*") in ("*", difficulty_level):
+            break
+    else:
+        rule = {"name": "default", "model": DEFAULT_MODEL, "max_tokens": DEFAULT_MAX_TOKENS}
+    escalate_to = rule.get("escalate_to") if ROUTE_ESCALATION else None
+    return {
+        "name": rule["name"],
+        "model": rule["model"],
+        "max_tokens": rule.get("max_tokens") or LENGTH_MAX_TOKENS.get(length, DEFAULT_MAX_TOKENS),
+        "escalate_to": escalate_to if escalate_to != rule["model"] else None,
+        "escalate_max_tokens": rule.get("escalate_max_tokens", DEFAULT_MAX_TOKENS),
+    }
+
+
+def quality_problem(text, stop_reason):
+    """Why a final answer isn't good enough to keep ("truncated", "too_short"), or None."""
+    if stop_reason == "max_tokens":
+        return "truncated"
+    if len(text.strip()) < MIN_ANSWER_CHARS:
+        return "too_short"
+    return None
+
+
+def record_route(name, seconds, output_tokens, escalated):
+    """Add one finished agent run to its route's stats."""
+    ROUTE_SECONDS.observe(seconds, route=name)
+    with _lock:
+        stats = _route_stats.get(name)
+        if stats is None:
+            stats = _route_stats[name] = {
+                "runs": 0, "escalations": 0, "latency_ms": LatencyWindow(), "output_tokens": LatencyWindow()
+            }
+        stats["runs"] += 1
+        stats["escalations"] += int(escalated)
+    stats["latency_ms"].record(seconds * 1000)
+    stats["output_tokens"].record(output_tokens)
+
+
+def route_stats():
+    """Runs, escalation rate, latency and output-token percentiles per route."""
+    with _lock:
+        items = list(_route_stats.items())
+    return {
+        name: {
+            "runs": stats["runs"],
+            "escalations": stats["escalations"],
+            "escalation_rate": stats["escalations"] / stats["runs"],
+            "latency_ms": stats["latency_ms"].summary(),
+            "output_tokens": stats["output_tokens"].summary(),
+        }
+        for name, stats in items
+    }
+
+
+Sampled(
+    "bio_route_escalations_total", "Answers retried on the escalation model, by route", "counter", ["route"],
+    lambda: [((name,), stats["escalations"]) for name, stats in route_stats().items()]
+)
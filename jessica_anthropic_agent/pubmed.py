@@ -0,0 +1,346 @@
+"""
+PubMed retrieval for the search_pubmed tools: esearch for PMIDs, then
+efetch for the records, abstracts included.
+
+Two caches keep round trips down. Term -> PMIDs (PUBMED_SEARCH_TTL) means a
+repeated search skips esearch. PMID -> record (PUBMED_CACHE_TTL) is shared
+by every search: popular papers turn up under many terms and are fetched
+once. With SHARED_CACHE_URL set, searches and records are also shared with
+the other worker processes (see shared_cache.py); otherwise, with
+PUBMED_CACHE_DB set, records go to an SQLite file that every worker
+process on the host shares.
+
+PMIDs that are not cached go through a batcher. Searches running at the
+same time, within PUBMED_BATCH_WINDOW seconds of each other, share one
+efetch, and a PMID already being fetched is waited for rather than fetched
+again. efetch XML is parsed incrementally as it arrives and each article is
+dropped once its record is built, so large batches never sit in memory.
+
+Results keep the esummary layout the tools always returned
+({"uids": [...], pmid: {"title", "fulljournalname", "pubdate", ...}}),
+with "abstract" and "doi" added to each record.
+"""
+import asyncio
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future
+
+from cache import LRUCache, SQLiteStore, TieredCache, normalize_term
+from http_client import EUTILS_URL, http_get
+from retrieval_cache import NEGATIVE_CACHE_TTL
+from shared_cache import off_loop, shared_store
+from singleflight import AsyncSingleFlight, SingleFlight
+
+PUBMED_SEARCH_TTL = float(os.environ.get("PUBMED_SEARCH_TTL", str(24 * 3600)))
+# Records almost never change
+PUBMED_CACHE_TTL = float(os.environ.get("PUBMED_CACHE_TTL", str(7 * 24 * 3600)))
+PUBMED_RECORD_CACHE_SIZE = int(os.environ.get("PUBMED_RECORD_CACHE_SIZE", "20000"))
+_pubmed_cache_db = os.environ.get("PUBMED_CACHE_DB")
+
+# How long the first uncached PMID waits for others to share its efetch,
+# and the most PMIDs one efetch asks for
+PUBMED_BATCH_WINDOW = float(os.environ.get("PUBMED_BATCH_WINDOW", "0.01"))
+PUBMED_BATCH_SIZE = int(os.environ.get("PUBMED_BATCH_SIZE", "200"))
+
+# Authors kept per record; the prompt never needs the full list
+MAX_AUTHORS = 3
+CHUNK_SIZE = 64 * 1024
+
+search_cache = TieredCache(
+    LRUCache(max_entries=int(os.environ.get("PUBMED_SEARCH_CACHE_SIZE", "4096")), ttl=PUBMED_SEARCH_TTL),
+    shared_store("pubmed-search", PUBMED_SEARCH_TTL)
+)
+record_cache = TieredCache(
+    LRUCache(max_entries=PUBMED_RECORD_CACHE_SIZE, ttl=PUBMED_CACHE_TTL),
+    shared_store("pubmed", PUBMED_CACHE_TTL)
+    or (SQLiteStore(_pubmed_cache_db, ttl=PUBMED_CACHE_TTL, max_entries=10 * PUBMED_RECORD_CACHE_SIZE)
+        if _pubmed_cache_db else None)
+)
+search_flight = SingleFlight()
+async_search_flight = AsyncSingleFlight()
+
+_stats_lock = threading.Lock()
+_counts = {"esearch_calls": 0, "efetch_calls": 0, "pmids_fetched": 0, "record_hits": 0}
+_batchers = []
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _counts[name] += amount
+
+
+# E-utilities requests and responses
+
+def esearch_params(term, max_results):
+    return {"db": "pubmed", "term": term, "retmax": max_results, "retmode": "json"}
+
+
+def efetch_params(pmids):
+    return {"db": "pubmed", "id": ",".join(pmids), "rettype": "abstract", "retmode": "xml"}
+
+
+def _text(elem):
+    """All the text in an element, inline markup (<i>, <sup>) included."""
+    return " ".join("".join(elem.itertext()).split()) if elem is not None else None
+
+
+def parse_article(elem):
+    """(pmid, record) from one <PubmedArticle> element."""
+    citation = elem.find("MedlineCitation")
+    article = citation.find("Article")
+    pmid = citation.findtext("PMID")
+
+    paragraphs = []
+    for part in article.iterfind("Abstract/AbstractText"):
+        label = part.get("Label")
+        paragraphs.append(f"{label}: {_text(part)}" if label else _text(part))
+
+    pubdate = article.find("Journal/JournalIssue/PubDate")
+    year = None
+    if pubdate is not None:
+        year = pubdate.findtext("Year") or (pubdate.findtext("MedlineDate") or "")[:4] or None
+
+    authors = []
+    for author in article.iterfind("AuthorList/Author"):
+        name = author.findtext("LastName") or author.findtext("CollectiveName")
+        if name:
+            authors.append({"name": f"{name} {author.findtext('Initials') or ''}".strip()})
+
+    doi = None
+    for article_id in elem.iterfind("PubmedData/ArticleIdList/ArticleId"):
+        if article_id.get("IdType") == "doi":
+            doi = article_id.text
+
+    return pmid, {
+        "uid": pmid,
+        "title": _text(article.find("ArticleTitle")),
+        "fulljournalname": article.findtext("Journal/Title"),
+        "source": article.findtext("Journal/ISOAbbreviation"),
+        "pubdate": year,
+        "authors": authors[:MAX_AUTHORS],
+        "abstract": "\n".join(paragraphs) or None,
+        "doi": doi,
+    }
+
+
+class EfetchParser:
+    """Incremental parser for efetch XML: feed() it chunks, close() returns {pmid: record}."""
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+        self.records = {}
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+            elif elem.tag == "PubmedArticle":
+                pmid, record = parse_article(elem)
+                self.records[pmid] = record
+                # Drop the parsed article (and its siblings) from the tree
+                self._root.clear()
+
+    def close(self):
+        self._parser.close()
+        return self.records
+
+
+def fetch_records(pmids):
+    """efetch PMIDs, parsing the XML as it streams in: {pmid: record}."""
+    response = http_get(f"{EUTILS_URL}/efetch.fcgi", params=efetch_params(pmids), stream=True)
+    with response:
+        response.raise_for_status()
+        parser = EfetchParser()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            parser.feed(chunk)
+        return parser.close()
+
+
+# Caches
+
+def search_key(term, max_results):
+    return f"{normalize_term(term)}:{max_results}"
+
+
+def store_search(key, data):
+    """The PMIDs in an esearch response, cached under key (briefly if there are none)."""
+    _count("esearch_calls")
+    pmids = data.get("esearchresult", {}).get("idlist", [])
+    search_cache.set(key, pmids, ttl=None if pmids else NEGATIVE_CACHE_TTL)
+    return pmids
+
+
+def cached_records(pmids):
+    """The records of pmids that are cached, as {pmid: record}."""
+    records = {}
+    for pmid in pmids:
+        record = record_cache.get(pmid)
+        if record is not None:
+            records[pmid] = record
+    _count("record_hits", len(records))
+    return records
+
+
+def _store_records(pmids, records):
+    _count("efetch_calls")
+    _count("pmids_fetched", len(pmids))
+    for pmid, record in records.items():
+        record_cache.set(pmid, record)
+
+
+def assemble(pmids, records):
+    """The tool result for a search, in esummary layout, keeping search order."""
+    found = [pmid for pmid in pmids if records.get(pmid)]
+    if not found:
+        return {"error": "No results found"}
+    return {"uids": found, **{pmid: records[pmid] for pmid in found}}
+
+
+# Batching
+
+class _Batcher:
+    """Bookkeeping shared by the thread and asyncio batchers."""
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._in_flight = {}  # pmid -> future of its record
+        self._open = None  # batch still taking PMIDs
+        self.shared = 0
+        _batchers.append(self)
+
+    def _enqueue(self, pmids, new_future):
+        """Futures for pmids, plus the batches this call opened (and must run)."""
+        futures = {}
+        opened = []
+        with self._lock:
+            for pmid in pmids:
+                future = self._in_flight.get(pmid)
+                if future is not None:
+                    self.shared += 1
+                else:
+                    future = self._in_flight[pmid] = new_future()
+                    if self._open is None or len(self._open) >= self.max_batch:
+                        self._open = []
+                        opened.append(self._open)
+                    self._open.append(pmid)
+                futures[pmid] = future
+        return futures, opened
+
+    def _close(self, batch):
+        with self._lock:
+            if self._open is batch:
+                self._open = None
+
+    def _settle(self, batch, records, error):
+        """Hand out a finished batch's records (already stored) or its error."""
+        with self._lock:
+            futures = [self._in_flight.pop(pmid) for pmid in batch]
+        for pmid, future in zip(batch, futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(records.get(pmid))
+
+
+class RecordBatcher(_Batcher):
+    """Fetches PMIDs for concurrent threads in shared efetch calls."""
+
+    def __init__(self, fetch, window=PUBMED_BATCH_WINDOW, max_batch=PUBMED_BATCH_SIZE):
+        super().__init__(window, max_batch)
+        self.fetch = fetch
+
+    def get(self, pmids):
+        """{pmid: record or None}; raises if the efetch carrying one of them failed."""
+        futures, opened = self._enqueue(pmids, Future)
+        if opened and self.window:
+            time.sleep(self.window)
+        for batch in opened:
+            self._close(batch)
+            try:
+                records, error = self.fetch(batch), None
+                _store_records(batch, records)
+            except Exception as e:
+                records, error = None, e
+            self._settle(batch, records, error)
+        return {pmid: future.result() for pmid, future in futures.items()}
+
+
+class AsyncRecordBatcher(_Batcher):
+    """RecordBatcher for coroutines running on one event loop."""
+
+    def __init__(self, fetch, window=PUBMED_BATCH_WINDOW, max_batch=PUBMED_BATCH_SIZE):
+        super().__init__(window, max_batch)
+        self.fetch = fetch
+        self._tasks = set()
+
+    async def _run(self, batch):
+        await asyncio.sleep(self.window)
+        self._close(batch)
+        try:
+            records, error = await self.fetch(batch), None
+            await off_loop(_store_records, batch, records)
+        except Exception as e:
+            records, error = None, e
+        self._settle(batch, records, error)
+
+    async def get(self, pmids):
+        loop = asyncio.get_running_loop()
+        futures, opened = self._enqueue(pmids, loop.create_future)
+        for batch in opened:
+            # A task of its own, so a cancelled caller doesn't strand the others
+            task = loop.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return {pmid: await asyncio.shield(future) for pmid, future in futures.items()}
+
+
+record_batcher = RecordBatcher(fetch_records)
+
+
+def search_pmids(term, max_results):
+    """PMIDs for a term, from the search cache or esearch."""
+    key = search_key(term, max_results)
+    pmids = search_cache.get(key)
+    if pmids is not None:
+        return pmids
+
+    def run():
+        response = http_get(f"{EUTILS_URL}/esearch.fcgi", params=esearch_params(term, max_results))
+        return store_search(key, response.json())
+
+    return search_flight.do(key, run)
+
+
+def search_pubmed(term, max_results=3):
+    """Search PubMed and return article summaries with abstracts."""
+    try:
+        pmids = search_pmids(term, max_results)
+        records = cached_records(pmids)
+        missing = [pmid for pmid in pmids if pmid not in records]
+        if missing:
+            records.update(record_batcher.get(missing))
+        return assemble(pmids, records)
+
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def pubmed_stats():
+    """Search and record cache counters, and how much efetch batching shared."""
+    with _stats_lock:
+        counts = dict(_counts)
+    return {
+        **counts,
+        "pmids_per_efetch": counts["pmids_fetched"] / counts["efetch_calls"] if counts["efetch_calls"] else None,
+        "pmids_shared_in_flight": sum(b.shared for b in _batchers),
+        "search_cache": search_cache.stats(),
+        "record_cache": record_cache.stats(),
+        "coalesced_searches": search_flight.followers + async_search_flight.followers,
+    }
@@ -0,0 +1,71 @@
+"""Token buckets for pacing requests to rate-limited upstreams."""
+import asyncio
+import threading
+import time
+
+
+class RateLimited(Exception):
+    """Raised when a request would wait too long for its upstream's rate limit."""
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, in bursts of up to `capacity`.
+
+    Callers that have to wait reserve their tokens up front, so waiters are
+    served in arrival order and the long-run rate never exceeds `rate`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.rejections = 0
+
+    def _reserve(self, tokens, max_wait):
+        """Take tokens, possibly on credit; returns the seconds to wait, or None if over max_wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                self.rejections += 1
+                return None
+            self._tokens -= tokens
+            if wait:
+                self.waits += 1
+            return wait
+
+    def try_acquire(self, tokens=1):
+        """Take tokens only if they are available right now."""
+        return self._reserve(tokens, 0) is not None
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until tokens are available; False if that would take longer than timeout."""
+        wait = self._reserve(tokens, timeout)
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, tokens=1, timeout=None):
+        """acquire() for coroutines: sleeps on the event loop instead of blocking it."""
+        wait = self._reserve(tokens, timeout)
+        if wait is None:
+            return False
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "waits": self.waits,
+            "rejections": self.rejections,
+        }
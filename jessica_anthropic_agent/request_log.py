@@ -0,0 +1,44 @@
+"""Optional JSON-lines log of explained terms, used to pick terms for cache warm-up."""
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from cache import normalize_term
+
+# Set REQUEST_LOG to a file path to record every explained term
+REQUEST_LOG = os.environ.get("REQUEST_LOG")
+
+_lock = threading.Lock()
+
+
+def log_request(term, difficulty_level, length, cached):
+    """Append one request to REQUEST_LOG, if it is set."""
+    if not REQUEST_LOG:
+        return
+    line = json.dumps({
+        "ts": round(time.time(), 3),
+        "term": term,
+        "difficulty_level": difficulty_level,
+        "length": length,
+        "cached": cached
+    })
+    with _lock, open(REQUEST_LOG, "a") as f:
+        f.write(line + "\n")
+
+
+def frequent_terms(path, limit):
+    """The `limit` most requested terms in a request log, most frequent first."""
+    counts = Counter()
+    spellings = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                term = json.loads(line)["term"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            key = normalize_term(term)
+            counts[key] += 1
+            spellings.setdefault(key, term.strip())
+    return [spellings[key] for key, _ in counts.most_common(limit)]
@@ -0,0 +1,365 @@
+"""
+Hedged requests and circuit breakers for the retrieval upstreams.
+
+Hedging. Most requests to NCBI, UniProt and Wikipedia answer quickly, but
+a few stall for seconds, and those stalls set the p99 of /explain. Each
+host keeps a window of its recent response times. A GET that hasn't
+answered by the HEDGE_PERCENTILE of that window is sent again, and
+whichever copy answers first is used; the other is closed when it
+finishes (or cancelled, on the event loop). A host is not hedged until it
+has HEDGE_MIN_SAMPLES responses. Hedges are capped at HEDGE_MAX_RATIO of
+the host's requests and take a token from its rate limit, so a slow host
+is never sent double its traffic.
+
+Circuit breakers. BREAKER_FAILURES failed requests in a row open a host's
+breaker: connection errors, timeouts, 5xx or 429 after retries, and
+answers slower than BREAKER_SLOW_SECONDS, but not attempts cut short by the
+caller's own deadline (DeadlineExceeded). While the breaker is open,
+requests to the host fail at once with CircuitOpen. The tools turn that
+into an error result, which is not cached, and the model carries on with
+the other sources; results already cached are still served, since the
+caches sit in front of the HTTP client. After BREAKER_COOLDOWN seconds the
+breaker is half-open and lets BREAKER_PROBES requests through. A success
+closes it; a failure opens it for another cooldown.
+
+Breaker states, hedge counts and hedge delays are in /stats ("upstreams")
+and /metrics.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from latency import LatencyWindow
+from metrics import Sampled
+from tracing import record_upstream
+
+# Percentile of a host's recent response times after which a request is
+# sent again; 0 disables hedging
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+# Never hedge sooner than this (seconds), however fast the host usually is
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.05"))
+# Most hedges per request sent to a host
+HEDGE_MAX_RATIO = float(os.environ.get("HEDGE_MAX_RATIO", "0.1"))
+# Threads running hedged requests: a request and its hedge each take one
+HEDGE_WORKERS = int(os.environ.get("HEDGE_WORKERS", "32"))
+
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", "30"))
+BREAKER_PROBES = int(os.environ.get("BREAKER_PROBES", "1"))
+BREAKER_SLOW_SECONDS = float(os.environ.get("BREAKER_SLOW_SECONDS", "5"))
+
+FAILURE_STATUSES = (429, 500, 502, 503, 504)
+
+_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+# host -> {"breaker": CircuitBreaker, "hedge": Hedge}
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+class CircuitOpen(Exception):
+    """Raised instead of sending a request to a host whose breaker is open."""
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised by an attempt that ran out of its caller's time, not the host's:
+    it counts neither against the breaker nor in the hedge latencies.
+    """
+
+
+class CircuitBreaker:
+    """Closed, open or half-open, from the outcomes of a host's recent requests."""
+
+    def __init__(self, host, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, probes=BREAKER_PROBES):
+        self.host = host
+        self.failures = failures
+        self.cooldown = cooldown
+        self.probes = probes
+        self.state = "closed"
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = 0
+        self._probed_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+        self.probed = 0
+
+    def allow(self):
+        """Whether a request may go to the host now; counts a rejection if not."""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self.state = "half_open"
+                self._probing = 0
+            if self.state == "half_open":
+                # A probe that never reported back (abandoned mid-stream) stops counting after a cooldown
+                if self._probing >= self.probes and time.monotonic() - self._probed_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self._probing = min(self._probing, self.probes - 1) + 1
+                self._probed_at = time.monotonic()
+                self.probed += 1
+            return True
+
+    def record(self, ok):
+        """Count the outcome of a request that allow() let through."""
+        with self._lock:
+            if ok:
+                if self.state != "closed":
+                    print(f"✅ {self.host} answered again; circuit closed")
+                self.state = "closed"
+                self._consecutive = 0
+                return
+            self._consecutive += 1
+            if self.state == "half_open" or (self.state == "closed" and self._consecutive >= self.failures):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                print(f"🔌 {self.host} failed {self._consecutive} time(s) in a row; "
+                      f"circuit open for {self.cooldown:.0f} s")
+
+    def release(self):
+        """Give back the probe of a request whose outcome says nothing about the host."""
+        with self._lock:
+            if self.state == "half_open" and self._probing:
+                self._probing -= 1
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a probe through."""
+        with self._lock:
+            return max(0.0, self._opened_at + self.cooldown - time.monotonic()) if self.state == "open" else 0.0
+
+    def stats(self):
+        with self._lock:
+            state, consecutive = self.state, self._consecutive
+        return {
+            "state": state,
+            "retry_in": round(self.retry_in(), 1),
+            "consecutive_failures": consecutive,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "probes": self.probed,
+        }
+
+
+class Hedge:
+    """When to send a host a second copy of a slow request, learned from its recent response times."""
+
+    def __init__(self, host, percentile=HEDGE_PERCENTILE):
+        self.host = host
+        self.percentile = percentile
+        self.latency_ms = LatencyWindow(size=500)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.sent = 0
+        self.won = 0
+        self.over_budget = 0
+
+    def delay(self):
+        """Seconds to wait before hedging a new request, or None if it won't be hedged."""
+        with self._lock:
+            self.requests += 1
+        if self.percentile <= 0 or self.latency_ms.count < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, self.latency_ms.percentile(self.percentile) / 1000)
+
+    def allow(self):
+        """Take a hedge from the budget, if it has one left."""
+        with self._lock:
+            if self.sent + 1 > HEDGE_MAX_RATIO * self.requests:
+                self.over_budget += 1
+                return False
+            self.sent += 1
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.won += 1
+
+    def stats(self):
+        delay = None
+        if self.percentile > 0 and self.latency_ms.count >= HEDGE_MIN_SAMPLES:
+            delay = max(HEDGE_MIN_DELAY * 1000, self.latency_ms.percentile(self.percentile))
+        with self._lock:
+            return {
+                "percentile": self.percentile,
+                "delay_ms": delay,
+                "requests": self.requests,
+                "sent": self.sent,
+                "won": self.won,
+                "over_budget": self.over_budget,
+                "latency_ms": self.latency_ms.summary(),
+            }
+
+
+def _host_state(host):
+    state = _hosts.get(host)
+    if state is None:
+        with _hosts_lock:
+            state = _hosts.get(host)
+            if state is None:
+                state = _hosts[host] = {"breaker": CircuitBreaker(host), "hedge": Hedge(host)}
+    return state
+
+
+def check_breaker(host):
+    """The host's breaker, if it lets a request through; raises CircuitOpen otherwise."""
+    breaker = _host_state(host)["breaker"]
+    if not breaker.allow():
+        record_upstream(host, "circuit_open", 0, 0)
+        raise CircuitOpen(f"{host} is failing; not contacted for the next {breaker.retry_in():.0f} s")
+    return breaker
+
+
+def _failed(response):
+    return response.status_code in FAILURE_STATUSES
+
+
+def _record(state, started, response=None):
+    """Feed one finished attempt (response None if it raised) to the breaker and latency window."""
+    seconds = time.perf_counter() - started
+    ok = response is not None and not _failed(response)
+    state["breaker"].record(ok and seconds < BREAKER_SLOW_SECONDS)
+    if ok:
+        state["hedge"].latency_ms.record(seconds * 1000)
+
+
+def _timed(state, attempt):
+    started = time.perf_counter()
+    try:
+        response = attempt()
+    except DeadlineExceeded:
+        state["breaker"].release()
+        raise
+    except BaseException:
+        _record(state, started)
+        raise
+    _record(state, started, response)
+    return response
+
+
+def _close_later(future):
+    """Close the losing copy's response once it arrives, returning its connection to the pool."""
+    def close(done):
+        if not done.cancelled() and done.exception() is None:
+            done.result().close()
+    future.add_done_callback(close)
+
+
+def resilient_get(host, attempt, may_hedge=lambda: True):
+    """
+    attempt() (one GET to host, returning its response) behind the host's
+    circuit breaker, hedged with a second attempt() when it is slow.
+
+    may_hedge() is asked before a hedge is sent, e.g. to take a token from
+    the host's rate limit.
+    """
+    state = _host_state(host)
+    breaker = check_breaker(host)
+    delay = state["hedge"].delay() if breaker.state == "closed" else None
+    if delay is None:
+        return _timed(state, attempt)
+
+    primary = _executor.submit(contextvars.copy_context().run, _timed, state, attempt)
+    done, _ = wait([primary], timeout=delay)
+    if done or not (state["hedge"].allow() and may_hedge()):
+        return primary.result()
+
+    backup = _executor.submit(contextvars.copy_context().run, _timed, state, attempt)
+    pending = {primary, backup}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None and not _failed(future.result()):
+                if future is backup:
+                    state["hedge"].record_win()
+                for loser in pending:
+                    _close_later(loser)
+                return future.result()
+    # Both copies failed: report the original's outcome
+    _close_later(backup)
+    return primary.result()
+
+
+async def _timed_async(state, attempt):
+    started = time.perf_counter()
+    try:
+        response = await attempt()
+    except asyncio.CancelledError:
+        # A losing copy: its time so far is a lower bound on the host's response time
+        state["hedge"].latency_ms.record((time.perf_counter() - started) * 1000)
+        raise
+    except DeadlineExceeded:
+        state["breaker"].release()
+        raise
+    except BaseException:
+        _record(state, started)
+        raise
+    _record(state, started, response)
+    return response
+
+
+async def resilient_get_async(host, attempt, may_hedge=lambda: True):
+    """resilient_get() for a coroutine function; the losing copy is cancelled."""
+    state = _host_state(host)
+    breaker = check_breaker(host)
+    delay = state["hedge"].delay() if breaker.state == "closed" else None
+    if delay is None:
+        return await _timed_async(state, attempt)
+
+    primary = asyncio.ensure_future(_timed_async(state, attempt))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done or not (state["hedge"].allow() and may_hedge()):
+            return await primary
+
+        backup = asyncio.ensure_future(_timed_async(state, attempt))
+        pending.add(backup)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and not _failed(task.result()):
+                    if task is backup:
+                        state["hedge"].record_win()
+                    return task.result()
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def resilience_stats():
+    """Breaker state and hedging counters of every upstream host contacted so far."""
+    return {
+        host: {"breaker": state["breaker"].stats(), "hedge": state["hedge"].stats()}
+        for host, state in list(_hosts.items())
+    }
+
+
+Sampled(
+    "bio_upstream_circuit_state", "Circuit breaker state of each upstream host (1 for the current one)", "gauge",
+    ["host", "state"],
+    lambda: [
+        ((host, name), int(state["breaker"].state == name))
+        for host, state in list(_hosts.items())
+        for name in ("closed", "open", "half_open")
+    ]
+)
+Sampled(
+    "bio_upstream_hedges_total", "Hedged upstream requests: sent, won by the hedge, or over budget", "counter",
+    ["host", "outcome"],
+    lambda: [
+        ((host, outcome), getattr(state["hedge"], outcome))
+        for host, state in list(_hosts.items())
+        for outcome in ("sent", "won", "over_budget")
+    ]
+)
@@ -0,0 +1,184 @@
+"""
+Tool-level caching for the Wikipedia and UniProt lookups (PubMed has its own, in pubmed.py).
+
+Results are stored under the arguments as given (case and spacing
+folded), so a misspelled request never overwrites the entry of the term it
+resembles. A miss then falls back, read-only, to a found result of a term
+with the same resolved name (see similarity.py), so "TNFα" is served what
+was fetched for "TNF-alpha". With SHARED_CACHE_URL set, results are also
+shared with the other worker processes (see shared_cache.py).
+"""
+import functools
+import json
+import os
+
+from cache import LRUCache, MISSING, TieredCache, normalize_term
+from shared_cache import off_loop, shared_store
+from similarity import TermMatcher, canonical_term
+from singleflight import AsyncSingleFlight, SingleFlight
+
+# Per-source TTLs in seconds
+SOURCE_TTLS = {
+    "wikipedia": float(os.environ.get("WIKIPEDIA_CACHE_TTL", str(24 * 3600))),
+    "uniprot": float(os.environ.get("UNIPROT_CACHE_TTL", str(24 * 3600))),
+}
+NEGATIVE_CACHE_TTL = float(os.environ.get("NEGATIVE_CACHE_TTL", "900"))
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "4096"))
+
+# Definite misses per source; these are cached for NEGATIVE_CACHE_TTL
+negative_checks = {
+    "wikipedia": lambda r: "error" not in r and not r.get("summary"),
+    "uniprot": lambda r: r.get("results") == [],
+}
+
+# source name -> {"cache", "names", "terms", "flight", "async_flight", "upstream_calls",
+# "negative_stored", "similar_hits"}
+_sources = {}
+
+
+def _source_state(source):
+    """Cache and counters for a source, shared by its sync and async tools."""
+    state = _sources.get(source)
+    if state is None:
+        state = _sources[source] = {
+            "cache": TieredCache(
+                LRUCache(max_entries=RETRIEVAL_CACHE_SIZE, ttl=SOURCE_TTLS[source]),
+                shared_store(source, SOURCE_TTLS[source])
+            ),
+            # Key of names' found results -> key they are cached under
+            "names": LRUCache(max_entries=RETRIEVAL_CACHE_SIZE, ttl=SOURCE_TTLS[source]),
+            "terms": TermMatcher(),
+            "flight": SingleFlight(),
+            "async_flight": AsyncSingleFlight(),
+            "upstream_calls": 0,
+            "negative_stored": 0,
+            "similar_hits": 0,
+        }
+    return state
+
+
+def _key(source, args, kwargs, norm):
+    def norm_value(value):
+        return norm(value) if isinstance(value, str) else value
+
+    return source + ":" + json.dumps(
+        [[norm_value(a) for a in args], {k: norm_value(v) for k, v in sorted(kwargs.items())}]
+    )
+
+
+def _cache_key(source, args, kwargs):
+    """Key on the arguments as given, so "CRISPR" and " crispr" share an entry but "AIDS" and "aid" don't."""
+    return _key(source, args, kwargs, normalize_term)
+
+
+def _similar_key(state, source, args, kwargs):
+    """Cache key of a found result for arguments with the same resolved names, or None."""
+    return state["names"].get(_key(source, args, kwargs, state["terms"].resolve))
+
+
+def _similar_hit(state, source, hit):
+    """hit, if it is a found result to serve for a similar term; else MISSING."""
+    if hit is MISSING or negative_checks[source](hit):
+        return MISSING
+    state["similar_hits"] += 1
+    return hit
+
+
+def _store(state, source, key, result, args, kwargs):
+    """Cache a fresh result under its own key: misses briefly, errors not at all."""
+    if negative_checks[source](result):
+        state["negative_stored"] += 1
+        state["cache"].set(key, result, ttl=NEGATIVE_CACHE_TTL)
+    elif not (isinstance(result, dict) and "error" in result):
+        state["cache"].set(key, result)
+        # Only an exact canonical name points at it, never a similarity match
+        state["names"].set(_key(source, args, kwargs, canonical_term), key)
+        for value in (*args, *kwargs.values()):
+            if isinstance(value, str):
+                state["terms"].add(value)
+
+
+def cached_tool(source):
+    """
+    Cache a retrieval tool's results for the source's TTL.
+
+    Definite misses (see negative_checks) are cached for NEGATIVE_CACHE_TTL;
+    other error results are not cached at all. Concurrent calls with the
+    same arguments share one upstream request.
+    """
+    state = _source_state(source)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = _cache_key(source, args, kwargs)
+            hit = state["cache"].get(key, MISSING)
+            if hit is not MISSING:
+                return hit
+            similar = _similar_key(state, source, args, kwargs)
+            if similar is not None and similar != key:
+                hit = _similar_hit(state, source, state["cache"].get(similar, MISSING))
+                if hit is not MISSING:
+                    return hit
+
+            def fetch():
+                state["upstream_calls"] += 1
+                result = fn(*args, **kwargs)
+                _store(state, source, key, result, args, kwargs)
+                return result
+
+            return state["flight"].do(key, fetch)
+
+        wrapper.cache = state["cache"]
+        return wrapper
+
+    return decorator
+
+
+def async_cached_tool(source):
+    """cached_tool for coroutine tools, sharing the source's cache."""
+    state = _source_state(source)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = _cache_key(source, args, kwargs)
+            hit = await state["cache"].get_async(key, MISSING)
+            if hit is not MISSING:
+                return hit
+            similar = _similar_key(state, source, args, kwargs)
+            if similar is not None and similar != key:
+                hit = _similar_hit(state, source, await state["cache"].get_async(similar, MISSING))
+                if hit is not MISSING:
+                    return hit
+
+            async def fetch():
+                state["upstream_calls"] += 1
+                result = await fn(*args, **kwargs)
+                await off_loop(_store, state, source, key, result, args, kwargs)
+                return result
+
+            return await state["async_flight"].do(key, fetch)
+
+        wrapper.cache = state["cache"]
+        return wrapper
+
+    return decorator
+
+
+def retrieval_cache_stats():
+    """Counters for every cached source."""
+    stats = {}
+    for source, state in _sources.items():
+        stats[source] = {
+            **state["cache"].memory.stats(),
+            "ttl": state["cache"].memory.ttl,
+            "shared": state["cache"].disk.stats() if state["cache"].disk is not None else None,
+            "negative_ttl": NEGATIVE_CACHE_TTL,
+            "coalesced": state["flight"].followers + state["async_flight"].followers,
+            "upstream_calls": state["upstream_calls"],
+            "negative_stored": state["negative_stored"],
+            "similar_hits": state["similar_hits"],
+            "similarity": state["terms"].stats(),
+        }
+    return stats
@@ -1,13 +1,43 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
+import contextvars
+import copy
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from anthropic import Anthropic
+from anthropic import Anthropic, APITimeoutError
 
 # Load environment variables
 load_dotenv()
 
+# Local modules read their settings from the environment when imported
+from tool_executor import run_tool_calls
+from http_client import UNIPROT_API_URL, WIKIPEDIA_API_URL, http_get, rate_limit_stats
+from cache import LRUCache, SQLiteStore, TieredCache, explanation_key, fallback_key, normalize_term
+from retrieval_cache import cached_tool, retrieval_cache_stats
+from singleflight import SingleFlight, StreamFlight
+from term_index import lookup_term, term_index_stats
+from pubmed import pubmed_stats, search_pubmed
+from request_log import log_request
+from capture import capture_stats, captured
+from resilience import resilience_stats
+from admission import ClientQuotas, Overloaded, PriorityLimiter, Rejected
+from model_routing import choose_route, quality_problem, record_route, route_stats
+from sessions import SESSION_IDLE_TTL, SessionStore
+from shared_cache import shared_store
+from similarity import TermMatcher
+from context_reducer import context_stats, reduce_context
+from latency import LatencyWindow
+from tool_router import plan_retrieval
+from tool_projection import projection_stats, serialize_tool_result
+from token_usage import USAGE_FIELDS, record_usage, usage_summary
+from tracing import span, trace_request
+from metrics import Sampled, render_metrics
+
 app = Flask(__name__)
 CORS(app)  # Allow browser extension to call this API
 
@@ -16,7 +46,91 @@ api_key = os.environ.get("API_KEY")
 if not api_key:
     raise ValueError("API_KEY not found in environment variables")
 
-client = Anthropic(api_key=api_key)
+# No SDK retries: each would get a fresh timeout and run past AGENT_DEADLINE.
+# A failed call falls back instead (see agent_loop).
+client = Anthropic(api_key=api_key, max_retries=0)
+
+# Explanation cache: in-process LRU in front of a tier the worker processes
+# share. That is the shared cache when SHARED_CACHE_URL is set (see
+# shared_cache.py), otherwise an SQLite file when EXPLAIN_CACHE_DB is a path.
+EXPLAIN_CACHE_USE_CONTEXT = os.environ.get("EXPLAIN_CACHE_USE_CONTEXT", "true").lower() == "true"
+_explain_cache_db = os.environ.get("EXPLAIN_CACHE_DB")
+_explain_shared_ttl = float(os.environ.get("EXPLAIN_CACHE_DB_TTL", str(7 * 24 * 3600)))
+shared_explanations = shared_store("explain", _explain_shared_ttl)
+explanation_cache = TieredCache(
+    LRUCache(
+        max_entries=int(os.environ.get("EXPLAIN_CACHE_SIZE", "2048")),
+        ttl=float(os.environ.get("EXPLAIN_CACHE_TTL", "86400"))
+    ),
+    shared_explanations or (SQLiteStore(
+        _explain_cache_db,
+        ttl=_explain_shared_ttl,
+        max_entries=int(os.environ.get("EXPLAIN_CACHE_DB_SIZE", "100000"))
+    ) if _explain_cache_db else None)
+)
+# Names of the explained terms, so spelling variants share cache entries (see similarity.py)
+explanation_terms = TermMatcher()
+
+# /explain/batch limits
+BATCH_MAX_TERMS = int(os.environ.get("BATCH_MAX_TERMS", "50"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+
+# Budget for one explanation: calls to Claude and wall time in seconds. The
+# last FINAL_ANSWER_RESERVE seconds are kept for writing the answer.
+MAX_AGENT_ROUNDS = int(os.environ.get("MAX_AGENT_ROUNDS", "4"))
+AGENT_DEADLINE = float(os.environ.get("AGENT_DEADLINE", "30"))
+FINAL_ANSWER_RESERVE = float(os.environ.get("FINAL_ANSWER_RESERVE", "8"))
+FALLBACK_TIMEOUT = float(os.environ.get("FALLBACK_TIMEOUT", "3"))
+
+# Concurrent identical requests share one agent run (streams share its events).
+# Followers give up waiting after EXPLAIN_FOLLOWER_TIMEOUT seconds.
+EXPLAIN_FOLLOWER_TIMEOUT = float(os.environ.get("EXPLAIN_FOLLOWER_TIMEOUT", AGENT_DEADLINE + 10))
+explain_flight = SingleFlight()
+stream_flight = StreamFlight()
+_savings_lock = threading.Lock()
+coalesced_savings = {"agent_runs": 0, "llm_calls": 0, "tool_calls": 0, "tokens": 0}
+Sampled(
+    "bio_coalesced_total", "Work saved by sharing identical in-flight explanations", "counter", ["kind"],
+    lambda: [((kind,), count) for kind, count in coalesced_savings.items()]
+)
+
+# Admission control (see admission.py). At most LLM_CONCURRENCY calls to
+# Claude run at once and LLM_QUEUE_SIZE more may wait for a slot; past that,
+# new explanations get a 503. CLIENT_RATE_LIMIT is each client's quota in
+# requests per minute (0 disables it); clients are told apart by their
+# address, or by the CLIENT_ID_HEADER header when one is configured. A batch
+# costs one request per term, so with quotas on a batch of more than
+# CLIENT_BURST terms gets a 400: no wait would ever let it through.
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "16"))
+LLM_QUEUE_SIZE = int(os.environ.get("LLM_QUEUE_SIZE", "64"))
+CLIENT_RATE_LIMIT = float(os.environ.get("CLIENT_RATE_LIMIT", "0"))
+CLIENT_BURST = int(os.environ.get("CLIENT_BURST", "10"))
+CLIENT_ID_HEADER = os.environ.get("CLIENT_ID_HEADER")
+llm_limiter = PriorityLimiter(LLM_CONCURRENCY, LLM_QUEUE_SIZE)
+client_quotas = ClientQuotas(CLIENT_RATE_LIMIT, CLIENT_BURST)
+Sampled(
+    "bio_llm_slots", "Calls to Claude holding or waiting for a slot", "gauge", ["state"],
+    lambda: [(("active",), llm_limiter.active), (("waiting",), llm_limiter.stats()["waiting"])]
+)
+Sampled(
+    "bio_admission_rejected_total", "Requests and calls turned away by admission control", "counter", ["reason"],
+    lambda: [
+        (("queue_full",), llm_limiter.rejected),
+        (("queue_timeout",), llm_limiter.timeouts),
+        (("client_quota",), client_quotas.rejected)
+    ]
+)
+
+Sampled(
+    "bio_context_tokens_total", "Page-context tokens before and after reduction", "counter", ["stage"],
+    lambda: [(("original",), context_stats()["original_tokens"]), (("reduced",), context_stats()["reduced_tokens"])]
+)
+
+# Time to first token of streamed explanations, in milliseconds
+ttft_stats = LatencyWindow()
+
+# Conversations that /explain/followup can continue (see sessions.py)
+sessions = SessionStore(store=shared_store("session", SESSION_IDLE_TTL))
 
 # Tool definitions
 tools = [
@@ -71,44 +185,19 @@ tools = [
 
 
 # Tool implementations
-def search_pubmed(term, max_results=3):
-    """Search PubMed and return article summaries."""
-    try:
-        search_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-        search_params = {
-            "db": "pubmed",
-            "term": term,
-            "retmax": max_results,
-            "retmode": "json"
-        }
-        search_response = requests.get(search_url, params=search_params)
-        search_data = search_response.json()
-
-        ids = search_data.get("esearchresult", {}).get("idlist", [])
-
-        if not ids:
-            return {"error": "No results found"}
-
-        summary_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
-        summary_params = {
-            "db": "pubmed",
-            "id": ",".join(ids),
-            "retmode": "json"
-        }
-        summary_response = requests.get(summary_url, params=summary_params)
-        summary_data = summary_response.json()
-
-        return summary_data.get("result", {})
-
-    except Exception as e:
-        return {"error": str(e)}
-
-
+# Each tool is cached per source; definite misses are cached for a shorter time.
+# search_pubmed (pubmed.py) caches searches and records separately and batches efetch.
+# Wikipedia and UniProt lookups check the local term index (term_index.py) first.
+@cached_tool("wikipedia")
 def get_wikipedia_summary(term):
-    """Get Wikipedia summary for a term."""
+    """Get Wikipedia summary for a term, from the local term index when it has one."""
+    local = lookup_term("wikipedia", term)
+    if local is not None:
+        return local
+
     try:
-        url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{requests.utils.quote(term)}"
-        response = requests.get(url)
+        url = f"{WIKIPEDIA_API_URL}/page/summary/{requests.utils.quote(term)}"
+        response = http_get(url)
         data = response.json()
 
         return {
@@ -121,16 +210,21 @@ def get_wikipedia_summary(term):
         return {"error": str(e)}
 
 
+@cached_tool("uniprot")
 def search_uniprot(protein_name):
-    """Search UniProt for protein information."""
+    """Search UniProt for protein information, from the local term index when it has one."""
+    local = lookup_term("uniprot", protein_name)
+    if local is not None:
+        return local
+
     try:
-        url = "https://rest.uniprot.org/uniprotkb/search"
+        url = f"{UNIPROT_API_URL}/uniprotkb/search"
         params = {
             "query": protein_name,
             "format": "json",
             "size": 3
         }
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         return response.json()
 
     except Exception as e:
@@ -153,98 +247,647 @@ def execute_tool(tool_name, tool_input):
         return {"error": f"Unknown tool: {tool_name}"}
 
 
-def process_query(term, page_context, difficulty_level="undergrad", length="brief"):
-    """Process a user query with the agent."""
-    difficulty_prompts = {
-        "high_school": "Explain like I'm in high school biology",
-        "undergrad": "Explain at an undergraduate level with some technical detail",
-        "expert": "Use technical terminology, I'm familiar with biology",
-        "eli5": "Explain like I'm 5, use simple analogies"
-    }
+def is_error(result):
+    """Whether a tool result is an error."""
+    return isinstance(result, dict) and "error" in result
 
-    length_prompts = {
-        "brief": "Give a concise 1-2 sentence definition. Be direct and clear.",
-        "short": "Provide a short explanation in 1 paragraph (3-4 sentences).",
-        "medium": "Provide a medium explanation in 2-3 paragraphs with key details.",
-        "detailed": "Provide a comprehensive explanation with multiple paragraphs, examples, and context."
-    }
 
-    system_prompt = f"""You are a biology tutor explaining concepts clearly.
+def collect_sources(tool_name, result):
+    """Extract citable sources (title, url) from a tool result."""
+    if not isinstance(result, dict) or is_error(result):
+        return []
 
-Difficulty level: {difficulty_prompts.get(difficulty_level, difficulty_prompts["undergrad"])}
-Length requirement: {length_prompts.get(length, length_prompts["brief"])}
+    sources = []
+    if tool_name == "search_pubmed":
+        for uid in result.get("uids", []):
+            article = result.get(uid, {})
+            sources.append({
+                "source": "pubmed",
+                "title": article.get("title"),
+                "url": f"https://pubmed.ncbi.nlm.nih.gov/{uid}/"
+            })
+    elif tool_name == "get_wikipedia_summary":
+        if result.get("url"):
+            sources.append({
+                "source": "wikipedia",
+                "title": result.get("title"),
+                "url": result["url"]
+            })
+    elif tool_name == "search_uniprot":
+        for entry in result.get("results", []):
+            accession = entry.get("primaryAccession")
+            if not accession:
+                continue
+            name = (entry.get("proteinDescription", {})
+                    .get("recommendedName", {})
+                    .get("fullName", {})
+                    .get("value"))
+            sources.append({
+                "source": "uniprot",
+                "title": name or accession,
+                "url": f"https://www.uniprot.org/uniprotkb/{accession}"
+            })
+    return sources
 
-Current page context:
-Title: {page_context.get('title', 'Unknown')}
-URL: {page_context.get('url', 'Unknown')}
-Context: {page_context.get('surrounding_text', 'None')}
+
+# Prompt-cache breakpoint; everything up to and including the marked block is cached
+CACHE_BREAKPOINT = {"type": "ephemeral"}
+
+# Per-request instructions, by difficulty level and by length
+difficulty_prompts = {
+    "high_school": "Explain like I'm in high school biology",
+    "undergrad": "Explain at an undergraduate level with some technical detail",
+    "expert": "Use technical terminology, I'm familiar with biology",
+    "eli5": "Explain like I'm 5, use simple analogies"
+}
+
+length_prompts = {
+    "brief": "Give a concise 1-2 sentence definition. Be direct and clear.",
+    "short": "Provide a short explanation in 1 paragraph (3-4 sentences).",
+    "medium": "Provide a medium explanation in 2-3 paragraphs with key details.",
+    "detailed": "Provide a comprehensive explanation with multiple paragraphs, examples, and context."
+}
+
+
+def tutor_instructions(prefetched=False):
+    """The static part of the system prompt, identical across requests."""
+    if prefetched:
+        retrieval_step = "Use the reference material sent with the question (from Wikipedia, PubMed or UniProt)"
+    else:
+        retrieval_step = "Use the tools to fetch accurate, current information"
+
+    return f"""You are a biology tutor explaining concepts clearly.
 
 Your job:
-1. Use the tools to fetch accurate, current information
-2. Synthesize it into a clear explanation following the length requirement above
+1. {retrieval_step}
+2. Synthesize it into a clear explanation following the length requirement below
 3. Use plain English and relatable examples
 4. Provide links to sources when appropriate
 5. Connect the explanation to what they're reading
 
 IMPORTANT: Strictly follow the length requirement. Do not exceed it."""
 
-    messages = [
+
+def build_system_prompt(page_context, difficulty_level="undergrad", length="brief", prefetched=False):
+    """
+    Build the tutor system prompt for a request as a list of text blocks.
+
+    The request is laid out as tools, then the static tutor instructions,
+    then the per-request difficulty/length/page-context block. A cache
+    breakpoint on the instructions lets every request reuse the cached
+    tools + instructions prefix.
+    """
+    request_prompt = f"""Difficulty level: {difficulty_prompts.get(difficulty_level, difficulty_prompts["undergrad"])}
+Length requirement: {length_prompts.get(length, length_prompts["brief"])}
+
+Current page context:
+Title: {page_context.get('title', 'Unknown')}
+URL: {page_context.get('url', 'Unknown')}
+Context: {page_context.get('surrounding_text', 'None')}"""
+
+    return [
+        {"type": "text", "text": tutor_instructions(prefetched), "cache_control": CACHE_BREAKPOINT},
+        {"type": "text", "text": request_prompt}
+    ]
+
+
+def mark_last_message_for_cache(messages):
+    """
+    Move the rolling cache breakpoint to the last block of the last message.
+
+    Each round of the agent loop resends the whole conversation, so the
+    next round reads everything up to here from the cache. Older message
+    breakpoints are removed to stay within the API's limit of four.
+    """
+    for message in messages:
+        if isinstance(message["content"], list):
+            for block in message["content"]:
+                if isinstance(block, dict):
+                    block.pop("cache_control", None)
+
+    last = messages[-1]
+    if isinstance(last["content"], str):
+        last["content"] = [{"type": "text", "text": last["content"]}]
+    last["content"][-1]["cache_control"] = CACHE_BREAKPOINT
+
+
+def explain_question(term):
+    """The opening user message of an explanation."""
+    return f"Explain '{term}' in the context of what I'm reading."
+
+
+def plain_messages(messages):
+    """A JSON-ready copy of a conversation, without cache breakpoints."""
+    plain = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, list):
+            content = [
+                block.model_dump(exclude_none=True) if hasattr(block, "model_dump")
+                else {key: value for key, value in block.items() if key != "cache_control"}
+                for block in content
+            ]
+        plain.append({"role": message["role"], "content": content})
+    return plain
+
+
+def agent_loop(term, page_context, difficulty_level="undergrad", length="brief", retrieval_mode=None,
+               history=None, followup=None):
+    """
+    The agent loop without any I/O, shared by the Flask and ASGI servers.
+
+    Yields requests for the driver to carry out and receives their results:
+        ("llm", request_args)  - send back the Message from Claude, or throw
+                                 the exception the call raised into the loop
+        ("tools", {"calls", "timeout"}) - run the (name, input) calls within
+                                 timeout seconds, send back the results
+        ("cache", key)         - send back explanation_cache's entry for key,
+                                 or None
+        ("event", (name, data)) - progress event for the caller, send back None
+
+    Events:
+        tool_call   - a tool was requested ({"name", "input"})
+        tool_result - a tool finished ({"name", "ok"})
+        escalate    - the answer is being rewritten by a larger model
+                      ({"from", "to", "reason"}); text so far is discarded
+        done        - the final {"explanation", "sources", "stop_reason", "retrieval_mode",
+                      "usage", "rounds", "tool_calls", "degraded", "degraded_reason",
+                      "route", "model", "escalated", "messages",
+                      "context_tokens_saved"}; messages is the conversation
+                      ending with the answer, as plain dicts
+
+    page_context["surrounding_text"] is first cut down to the sentences
+    about the term (see context_reducer); context_tokens_saved is the
+    prompt tokens that saved over all calls to Claude.
+
+    retrieval_mode is "agent", "prefetch" or "auto" (see tool_router). In
+    prefetch mode the lookups run before the first call and their results
+    go into the first message, so the explanation takes a single call.
+
+    With history (the messages of an earlier done event), the loop instead
+    answers the followup question in that conversation. retrieval_mode must
+    then be the mode the conversation was started in: the tools and system
+    prompt stay as they were so the cached prefix still matches, and
+    nothing is prefetched again.
+
+    The model and max_tokens come from the model_routing table. If a fast
+    route's answer is cut off or too short, it is asked again once on the
+    route's escalation model, with one extra round allowed for it.
+
+    Each run is bounded by MAX_AGENT_ROUNDS calls to Claude and
+    AGENT_DEADLINE seconds. When the budget runs out, Claude answers from
+    the evidence gathered so far without more tools; if Claude fails or
+    there is no time left, the answer falls back to the last good
+    explanation of the term or its Wikipedia summary. The done event then
+    has degraded=True and the reason ("max_rounds", "deadline",
+    "overloaded" when no Claude slot freed up in time, or "llm_error"),
+    except for a last-round answer that didn't ask for more tools and
+    lost no evidence, which is as good as any other.
+    """
+    if history is None:
+        plan = plan_retrieval(term, retrieval_mode)
+        question = explain_question(term)
+    else:
+        plan = {"mode": retrieval_mode, "calls": [], "reason": "follow-up"}
+        question = followup
+    prefetched = plan["mode"] == "prefetch"
+    with span("context", "reduce") as context_span:
+        page_context, context = reduce_context(term, page_context)
+        context_span.update(context)
+    system_prompt = build_system_prompt(page_context, difficulty_level, length, prefetched)
+    started = time.monotonic()
+    deadline = started + AGENT_DEADLINE
+    route = choose_route(length, difficulty_level)
+    model, max_tokens = route["model"], route["max_tokens"]
+    max_rounds = MAX_AGENT_ROUNDS
+    escalated = False
+    sources = []
+    usage = None
+    rounds = 0
+    tool_calls = 0
+    dropped = False
+    degraded_reason = None
+
+    def finish(explanation, stop_reason):
+        output_tokens = usage["output_tokens"] if usage else 0
+        record_route(route["name"], time.monotonic() - started, output_tokens, escalated)
+        return "event", ("done", {
+            "explanation": explanation,
+            "sources": _unique_sources(sources),
+            "stop_reason": stop_reason,
+            "retrieval_mode": plan["mode"],
+            "usage": usage,
+            "rounds": rounds,
+            "tool_calls": tool_calls,
+            "degraded": degraded_reason is not None,
+            "degraded_reason": degraded_reason,
+            "route": route["name"],
+            "model": model,
+            "escalated": escalated,
+            "messages": plain_messages(messages) + [
+                {"role": "assistant", "content": [{"type": "text", "text": explanation}]}
+            ],
+            "context_tokens_saved": context["saved_tokens"] * rounds
+        })
+
+    def gathering_time():
+        """Seconds left for tools, keeping FINAL_ANSWER_RESERVE back for the answer."""
+        return deadline - FINAL_ANSWER_RESERVE - time.monotonic()
+
+    print(f"\n🔍 Processing query: {term}")
+
+    if plan["calls"]:
+        print(f"📦 Prefetching evidence ({plan['reason']})")
+        for tool_name, tool_input in plan["calls"]:
+            yield "event", ("tool_call", {"name": tool_name, "input": tool_input})
+
+        tool_calls += len(plan["calls"])
+        results = yield "tools", {"calls": plan["calls"], "timeout": max(gathering_time(), 0)}
+
+        evidence = []
+        for (tool_name, _), result in zip(plan["calls"], results):
+            sources.extend(collect_sources(tool_name, result))
+            yield "event", ("tool_result", {"name": tool_name, "ok": not is_error(result)})
+            evidence.append(
+                f"<result tool=\"{tool_name}\">\n{serialize_tool_result(tool_name, result)}\n</result>"
+            )
+
+        question += "\n\nReference material:\n" + "\n".join(evidence)
+
+    # A copy, so cache breakpoints never end up in the stored history
+    messages = copy.deepcopy(history or []) + [
         {
             "role": "user",
-            "content": f"Explain '{term}' in the context of what I'm reading."
+            "content": question
         }
     ]
 
-    print(f"\n🔍 Processing query: {term}")
-
     while True:
-        response = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2000,
-            system=system_prompt,
-            tools=tools,
-            messages=messages
-        )
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            degraded_reason = "deadline"
+            break
+
+        rounds += 1
+        limit = None
+        mark_last_message_for_cache(messages)
+        request_args = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "system": system_prompt,
+            "messages": messages,
+            "timeout": remaining
+        }
+        if not prefetched:
+            # Tools stay in the request so the cached prefix still matches
+            request_args["tools"] = tools
+            if rounds >= max_rounds or gathering_time() <= 0:
+                limit = "max_rounds" if rounds >= max_rounds else "deadline"
+                request_args["tool_choice"] = {"type": "none"}
+                reached = "Round limit" if limit == "max_rounds" else "Deadline"
+                print(f"⏳ {reached} reached; answering from the evidence so far")
+
+        try:
+            with span("llm", request_args["model"], round=rounds) as llm_span:
+                response = yield "llm", request_args
+        except Exception as e:
+            print(f"⚠️  Claude call failed: {str(e)}")
+            if isinstance(e, APITimeoutError):
+                degraded_reason = "deadline"
+            elif isinstance(e, Overloaded):
+                degraded_reason = "overloaded"
+            else:
+                degraded_reason = "llm_error"
+            break
 
         print(f"Stop reason: {response.stop_reason}")
+        usage = record_usage(response.usage, usage)
+        llm_span["stop_reason"] = response.stop_reason
+        llm_span.update({field: getattr(response.usage, field, None) or 0 for field in USAGE_FIELDS})
 
-        if response.stop_reason == "tool_use":
+        if response.stop_reason == "tool_use" and "tool_choice" not in request_args:
             messages.append({
                 "role": "assistant",
                 "content": response.content
             })
 
-            tool_results = []
-            for block in response.content:
-                if block.type == "tool_use":
-                    tool_name = block.name
-                    tool_input = block.input
-
-                    print(f"🔧 Calling tool: {tool_name}")
+            tool_blocks = [block for block in response.content if block.type == "tool_use"]
+            for block in tool_blocks:
+                print(f"🔧 Calling tool: {block.name}")
+                yield "event", ("tool_call", {"name": block.name, "input": block.input})
 
-                    result = execute_tool(tool_name, tool_input)
+            calls = [(block.name, block.input) for block in tool_blocks]
+            if gathering_time() > 0:
+                tool_calls += len(calls)
+                results = yield "tools", {"calls": calls, "timeout": gathering_time()}
+            else:
+                dropped = True
+                results = [{"error": f"{name} skipped: out of time"} for name, _ in calls]
 
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": block.id,
-                        "content": str(result)
-                    })
+            tool_results = []
+            for block, result in zip(tool_blocks, results):
+                sources.extend(collect_sources(block.name, result))
+                yield "event", ("tool_result", {"name": block.name, "ok": not is_error(result)})
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": block.id,
+                    "content": serialize_tool_result(block.name, result)
+                })
 
             messages.append({
                 "role": "user",
                 "content": tool_results
             })
 
-        elif response.stop_reason == "end_turn":
+        elif response.stop_reason in ("end_turn", "max_tokens") or limit:
             final_text = ""
             for block in response.content:
                 if hasattr(block, "text"):
                     final_text += block.text
 
-            return final_text
+            problem = quality_problem(final_text, response.stop_reason)
+            if problem and route["escalate_to"] and not escalated and gathering_time() > 0:
+                print(f"⬆️  {model} answer was {problem}; asking {route['escalate_to']}")
+                yield "event", ("escalate", {"from": model, "to": route["escalate_to"], "reason": problem})
+                model, max_tokens = route["escalate_to"], route["escalate_max_tokens"]
+                max_rounds += 1
+                escalated = True
+                continue
+
+            # Only an answer that still wanted tools, or lost some evidence, is short of the full run
+            if limit and (response.stop_reason == "tool_use" or dropped):
+                degraded_reason = limit
+            yield finish(final_text, response.stop_reason)
+            return
 
         else:
-            return f"Unexpected stop reason: {response.stop_reason}"
+            yield finish(f"Unexpected stop reason: {response.stop_reason}", response.stop_reason)
+            return
+
+    if history is not None:
+        yield finish("Sorry, I couldn't answer that in time. Please try again.", None)
+        return
+
+    # Claude could not answer in time: serve the last good explanation or Wikipedia's summary
+    fallback = yield "cache", fallback_key(term)
+    if fallback is not None:
+        print(f"🩹 Serving the last good explanation of '{term}' ({degraded_reason})")
+        sources = list(fallback["sources"])
+        yield finish(fallback["explanation"], None)
+        return
+
+    print(f"🩹 Falling back to the Wikipedia summary of '{term}' ({degraded_reason})")
+    calls = [("get_wikipedia_summary", {"term": term})]
+    tool_calls += 1
+    wikipedia = (yield "tools", {"calls": calls, "timeout": FALLBACK_TIMEOUT})[0]
+    if is_error(wikipedia) or not wikipedia.get("summary"):
+        yield finish(f"Sorry, I couldn't put together an explanation of '{term}' in time. Please try again.", None)
+        return
+
+    sources = collect_sources("get_wikipedia_summary", wikipedia)
+    yield finish(wikipedia["summary"], None)
+
+
+def agent_events(term, page_context, difficulty_level="undergrad", length="brief",
+                 retrieval_mode=None, stream=False, history=None, followup=None):
+    """
+    Run the agent loop, yielding (event, data) pairs as it progresses.
+
+    Yields the agent_loop events, plus "text" ({"delta"}) for each text
+    delta from Claude when stream=True. Text from a round that ends in
+    tool use or is escalated is interim; the "done" event has the final
+    explanation.
+
+    Each call to Claude first waits for an llm_limiter slot, within the
+    time the loop has left for it.
+    """
+    steps = captured(
+        agent_loop(term, page_context, difficulty_level, length, retrieval_mode, history, followup),
+        term, page_context, difficulty_level, length, retrieval_mode, history, followup
+    )
+    reply = error = None
+    rounds = 0
+
+    while True:
+        try:
+            kind, payload = steps.throw(error) if error else steps.send(reply)
+        except StopIteration:
+            return
+        reply = error = None
+
+        if kind == "llm":
+            rounds += 1
+            try:
+                payload["timeout"] -= llm_limiter.acquire(llm_priority(length, rounds), payload["timeout"])
+                try:
+                    if stream:
+                        with client.messages.stream(**payload) as message_stream:
+                            for event in message_stream:
+                                if event.type == "text":
+                                    yield "text", {"delta": event.text}
+                            reply = message_stream.get_final_message()
+                    else:
+                        reply = client.messages.create(**payload)
+                finally:
+                    llm_limiter.release()
+            except Exception as e:
+                error = e
+
+        elif kind == "tools":
+            reply = run_tool_calls(payload["calls"], execute_tool, payload["timeout"])
+
+        elif kind == "cache":
+            reply = explanation_cache.get(payload)
+
+        else:
+            yield payload
+
+
+def llm_priority(length, round_number):
+    """
+    Queue priority of a call to Claude (lower goes first).
+
+    Shorter answers go ahead of longer ones, so brief lookups stay fast
+    under load; at equal length, runs already under way go ahead of new ones.
+    """
+    lengths = list(length_prompts)
+    rank = lengths.index(length) if length in lengths else len(lengths)
+    return rank, 0 if round_number > 1 else 1
+
+
+def _unique_sources(sources):
+    seen = set()
+    unique = []
+    for source in sources:
+        if source["url"] not in seen:
+            seen.add(source["url"])
+            unique.append(source)
+    return unique
+
+
+def run_agent(term, page_context, difficulty_level="undergrad", length="brief", retrieval_mode=None,
+              history=None, followup=None):
+    """Run the agent to completion and return the "done" event data."""
+    events = agent_events(
+        term, page_context, difficulty_level, length, retrieval_mode, history=history, followup=followup
+    )
+    for event, data in events:
+        if event == "done":
+            return data
+
+
+def process_query(term, page_context, difficulty_level="undergrad", length="brief", retrieval_mode=None):
+    """
+    Process a user query with the agent.
+
+    retrieval_mode picks between tool autonomy ("agent") and latency
+    ("prefetch", single Claude call); "auto" lets tool_router decide.
+    Defaults to RETRIEVAL_MODE.
+    """
+    return run_agent(term, page_context, difficulty_level, length, retrieval_mode)["explanation"]
+
+
+def explain_term(term, page_context, difficulty_level="undergrad", length="brief", retrieval_mode=None):
+    """
+    Explain a term, serving repeated lookups from the explanation cache.
+
+    Concurrent identical requests share one agent run, across worker
+    processes too when the cache is shared; a caller that waits on another's
+    run raises TimeoutError after EXPLAIN_FOLLOWER_TIMEOUT. A new run raises
+    Overloaded when the queue for Claude is full.
+
+    Returns:
+        (result, cached) where result is {"explanation", "sources", ...}
+    """
+    cache_key, result = cached_explanation(term, difficulty_level, length, page_context)
+    if result is not None:
+        log_request(term, difficulty_level, length, cached=True)
+        return result, True
+
+    led = []
+
+    def compute():
+        llm_limiter.admit()
+        result = run_agent(term, page_context, difficulty_level, length, retrieval_mode)
+        store_explanation(cache_key, term, result)
+        return result
+
+    def run():
+        led.append(True)
+        if shared_explanations is None:
+            return compute()
+        return shared_explanations.fill(cache_key, compute, EXPLAIN_FOLLOWER_TIMEOUT)
+
+    result = explain_flight.do(cache_key, run, EXPLAIN_FOLLOWER_TIMEOUT)
+    if not led:
+        record_coalesced(result)
+    log_request(term, difficulty_level, length, cached=False)
+    return result, False
+
+
+def cached_explanation(term, difficulty_level, length, page_context):
+    """
+    (cache_key, cached result or None) for an explanation request.
+
+    The key is built from the term's resolved name (see similarity.py), so
+    "monoclonal antibodies" is served the cached "mAb" explanation. A miss
+    on a page's own entry falls back to the context-free one that
+    warm_cache.py fills.
+    """
+    name = explanation_terms.resolve(term)
+    cache_key = explanation_key(name, difficulty_level, length, page_context, EXPLAIN_CACHE_USE_CONTEXT)
+    result = explanation_cache.get(cache_key)
+    if result is None and EXPLAIN_CACHE_USE_CONTEXT:
+        result = explanation_cache.get(general_explanation_key(name, difficulty_level, length))
+    if result is not None:
+        explanation_terms.record_hit(term)
+    return cache_key, result
+
+
+def general_explanation_key(term, difficulty_level, length):
+    """Cache key for an explanation that ignores page context, as warm_cache.py stores them."""
+    return explanation_key(term, difficulty_level, length, None, include_context=False)
+
+
+def record_coalesced(result):
+    """Count the work a follower was spared by sharing another request's run."""
+    usage = result.get("usage") or {}
+    with _savings_lock:
+        coalesced_savings["agent_runs"] += 1
+        coalesced_savings["llm_calls"] += result.get("rounds", 0)
+        coalesced_savings["tool_calls"] += result.get("tool_calls", 0)
+        coalesced_savings["tokens"] += sum(usage.values())
+
+
+def store_explanation(cache_key, term, result):
+    """Cache a finished explanation, unless it was cut short or degraded."""
+    if result["stop_reason"] != "end_turn" or result["degraded"]:
+        return
+    # The conversation belongs in a session, not the cache
+    result = {key: value for key, value in result.items() if key != "messages"}
+    explanation_cache.set(cache_key, result)
+    explanation_cache.set(fallback_key(term), result)
+    explanation_terms.add(term)
+
+
+def start_session(term, page_context, difficulty_level, length, result):
+    """
+    Open a follow-up session on an explanation and return its id.
+
+    A cached explanation has no conversation of its own; its session
+    starts from just the question and the answer.
+    """
+    messages = result.get("messages") or [
+        {"role": "user", "content": [{"type": "text", "text": explain_question(term)}]},
+        {"role": "assistant", "content": [{"type": "text", "text": result["explanation"]}]}
+    ]
+    request = {
+        "term": term,
+        "page_context": page_context,
+        "difficulty_level": difficulty_level,
+        "length": length,
+        "retrieval_mode": result.get("retrieval_mode") or "agent"
+    }
+    return sessions.create(request, messages, result["sources"])
+
+
+def followup_params(data):
+    """Pull (session_id, question) from an /explain/followup body, or raise ValueError."""
+    session_id = data.get('session_id') if data else None
+    question = data.get('question') if data else None
+    if not session_id or not isinstance(question, str) or not question.strip():
+        raise ValueError("Missing required fields: 'session_id' and 'question'")
+    return session_id, question.strip()
+
+
+def followup_body(session_id, session, question, result):
+    """Record a finished follow-up in its session and build the response."""
+    if not result["degraded"]:
+        session = sessions.append(session_id, result["messages"], result["sources"]) or session
+    return {
+        "session_id": session_id,
+        "term": session["term"],
+        "question": question,
+        "explanation": result["explanation"],
+        "sources": result["sources"],
+        "turns": session["turns"],
+        "degraded": result["degraded"],
+        "degraded_reason": result["degraded_reason"],
+        "context_tokens_saved": result["context_tokens_saved"]
+    }
+
+
+def client_id(headers, remote_addr):
+    """Who a request counts against for client quotas."""
+    return (CLIENT_ID_HEADER and headers.get(CLIENT_ID_HEADER)) or remote_addr or "unknown"
+
+
+def rejection(e):
+    """The 429/503 response for a request turned away by admission control."""
+    print(f"🚦 Rejected: {str(e)}")
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, e.status
 
 
 # API Endpoints
@@ -268,8 +911,14 @@ def explain():
             "surrounding_text": "...context around the term..."
         },
         "difficulty_level": "undergrad",  // optional
-        "length": "brief"  // optional: "brief", "short", "medium", "detailed"
+        "length": "brief",  // optional: "brief", "short", "medium", "detailed"
+        "retrieval_mode": "auto",  // optional: "agent", "prefetch", "auto"
+        "include_timing": false,  // optional: add a per-request "timing" breakdown
+        "start_session": false  // optional: open a session for follow-up questions
     }
+
+    With "start_session": true the response has a "session_id" to pass to
+    /explain/followup.
     """
     try:
         data = request.json
@@ -280,20 +929,298 @@ def explain():
                 "error": "Missing required field: 'term'"
             }), 400
 
-        term = data['term']
-        page_context = data.get('page_context', {})
-        difficulty_level = data.get('difficulty_level', 'undergrad')
-        length = data.get('length', 'brief')
+        term, page_context, difficulty_level, length, retrieval_mode = explain_params(data)
+        client_quotas.check(client_id(request.headers, request.remote_addr))
 
-        # Process the query
-        explanation = process_query(term, page_context, difficulty_level, length)
+        with trace_request("/explain") as trace:
+            result, cached = explain_term(term, page_context, difficulty_level, length, retrieval_mode)
+            timing = trace.summary()
 
-        return jsonify({
+        body = {
             "term": term,
-            "explanation": explanation,
+            "explanation": result["explanation"],
+            "sources": result["sources"],
             "difficulty_level": difficulty_level,
-            "length": length
-        })
+            "length": length,
+            "cached": cached,
+            "degraded": result.get("degraded", False),
+            "degraded_reason": result.get("degraded_reason"),
+            "context_tokens_saved": 0 if cached else result.get("context_tokens_saved", 0)
+        }
+        if data.get('include_timing'):
+            body["timing"] = timing
+        if data.get('start_session'):
+            body["session_id"] = start_session(term, page_context, difficulty_level, length, result)
+        return jsonify(body)
+
+    except Rejected as e:
+        return rejection(e)
+
+    except TimeoutError as e:
+        print(f"Error: {str(e)}")
+        return jsonify({
+            "error": str(e)
+        }), 504
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return jsonify({
+            "error": str(e)
+        }), 500
+
+
+@app.route('/explain/batch', methods=['POST'])
+def explain_batch():
+    """
+    Explain many terms from one page in a single request.
+
+    Expected JSON body:
+    {
+        "terms": ["cytokine storm", "interleukin-6", "CRISPR"],
+        "page_context": {...},  // shared by every term
+        "difficulty_level": "undergrad",  // optional
+        "length": "brief"  // optional
+    }
+
+    Terms are deduplicated (case and whitespace insensitive). Cached terms
+    are served immediately, the rest run concurrently, at most
+    BATCH_CONCURRENCY at a time. Concurrent runs share retrieval results
+    through the tool caches. A term that fails gets an "error" entry
+    instead of failing the whole batch. Every term counts against the
+    client's quota.
+    """
+    data = request.json
+    if not data or not isinstance(data.get('terms'), list) or not data['terms']:
+        return jsonify({
+            "error": "Missing required field: 'terms' (non-empty list)"
+        }), 400
+
+    terms = unique_terms(data['terms'])
+    max_terms = client_quotas.max_cost(BATCH_MAX_TERMS)
+    if len(terms) > max_terms:
+        return jsonify({
+            "error": f"Too many terms: {len(terms)} (max {max_terms})"
+        }), 400
+
+    try:
+        client_quotas.check(client_id(request.headers, request.remote_addr), cost=len(terms))
+    except Rejected as e:
+        return rejection(e)
+
+    page_context = data.get('page_context', {})
+    difficulty_level = data.get('difficulty_level', 'undergrad')
+    length = data.get('length', 'brief')
+    retrieval_mode = data.get('retrieval_mode')
+
+    def explain_one(term):
+        try:
+            result, cached = explain_term(term, page_context, difficulty_level, length, retrieval_mode)
+            return {
+                "explanation": result["explanation"],
+                "sources": result["sources"],
+                "cached": cached,
+                "degraded": result.get("degraded", False),
+                "degraded_reason": result.get("degraded_reason")
+            }
+        except Exception as e:
+            print(f"Error explaining '{term}': {str(e)}")
+            return {"error": str(e)}
+
+    with trace_request("/explain/batch"):
+        with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(terms))) as pool:
+            # Each term runs in a copy of this context, so its spans land in the batch's trace
+            futures = [pool.submit(contextvars.copy_context().run, explain_one, term) for term in terms]
+            results = {term: future.result() for term, future in zip(terms, futures)}
+
+    return jsonify({
+        "results": results,
+        "difficulty_level": difficulty_level,
+        "length": length,
+        "failed": sum(1 for r in results.values() if "error" in r)
+    })
+
+
+def unique_terms(terms):
+    """Drop blank and duplicate terms, keeping the first spelling of each."""
+    seen = set()
+    unique = []
+    for term in terms:
+        if not isinstance(term, str) or not term.strip():
+            continue
+        key = normalize_term(term)
+        if key not in seen:
+            seen.add(key)
+            unique.append(term.strip())
+    return unique
+
+
+def explain_params(data):
+    """Pull (term, page_context, difficulty_level, length, retrieval_mode) from an /explain body."""
+    return (
+        data['term'],
+        data.get('page_context', {}),
+        data.get('difficulty_level', 'undergrad'),
+        data.get('length', 'brief'),
+        data.get('retrieval_mode')
+    )
+
+
+def format_sse(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/explain/stream', methods=['POST'])
+def explain_stream():
+    """
+    Streaming version of /explain using Server-Sent Events.
+
+    Takes the same JSON body as /explain and emits:
+        event: tool_call    {"name", "input"}
+        event: tool_result  {"name", "ok"}
+        event: escalate     {"from", "to", "reason"}  (discard the text so far)
+        event: text         {"delta"}
+        event: done         {"term", "explanation", "sources", "cached", "ttft_ms", "total_ms"}
+        event: error        {"error"}
+
+    With "include_timing": true the done event also carries a "timing"
+    breakdown, and with "start_session": true a "session_id".
+    Requests turned away by admission control get a 429/503 response instead
+    of an event stream.
+    """
+    data = request.json
+    if not data or 'term' not in data:
+        return jsonify({
+            "error": "Missing required field: 'term'"
+        }), 400
+
+    term, page_context, difficulty_level, length, retrieval_mode = explain_params(data)
+    include_timing = bool(data.get('include_timing'))
+    open_session = bool(data.get('start_session'))
+
+    # Turn the request away before the event stream starts, so it gets a real status
+    try:
+        client_quotas.check(client_id(request.headers, request.remote_addr))
+        cache_key, cached_result = cached_explanation(term, difficulty_level, length, page_context)
+        if cached_result is None:
+            llm_limiter.admit()
+    except Rejected as e:
+        return rejection(e)
+
+    def generate():
+        started = time.monotonic()
+        first_token_ms = None
+
+        with trace_request("/explain/stream") as trace:
+            try:
+                result = cached_result
+                cached = result is not None
+                if cached:
+                    first_token_ms = (time.monotonic() - started) * 1000
+                    yield format_sse("text", {"delta": result["explanation"]})
+                else:
+                    def produce():
+                        events = agent_events(
+                            term, page_context, difficulty_level, length, retrieval_mode, stream=True
+                        )
+                        for event, payload in events:
+                            if event == "done":
+                                store_explanation(cache_key, term, payload)
+                            yield event, payload
+
+                    # Identical concurrent streams subscribe to one run's events
+                    events, leader = stream_flight.subscribe(cache_key, produce, EXPLAIN_FOLLOWER_TIMEOUT)
+                    for event, payload in events:
+                        if event == "done":
+                            result = payload
+                            break
+                        if event == "text" and first_token_ms is None:
+                            first_token_ms = (time.monotonic() - started) * 1000
+                        yield format_sse(event, payload)
+
+                    if not leader:
+                        record_coalesced(result)
+
+                log_request(term, difficulty_level, length, cached)
+                if first_token_ms is not None:
+                    ttft_stats.record(first_token_ms)
+                    print(f"⚡ Time to first token: {first_token_ms:.0f} ms")
+
+                done = {
+                    "term": term,
+                    "explanation": result["explanation"],
+                    "sources": result["sources"],
+                    "difficulty_level": difficulty_level,
+                    "length": length,
+                    "cached": cached,
+                    "degraded": result.get("degraded", False),
+                    "degraded_reason": result.get("degraded_reason"),
+                    "context_tokens_saved": 0 if cached else result.get("context_tokens_saved", 0),
+                    "ttft_ms": first_token_ms,
+                    "total_ms": (time.monotonic() - started) * 1000
+                }
+                if include_timing:
+                    done["timing"] = trace.summary()
+                if open_session:
+                    done["session_id"] = start_session(term, page_context, difficulty_level, length, result)
+                yield format_sse("done", done)
+
+            except Exception as e:
+                print(f"Error: {str(e)}")
+                yield format_sse("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route('/explain/followup', methods=['POST'])
+def explain_followup():
+    """
+    Ask a follow-up question about an earlier explanation.
+
+    Expected JSON body:
+    {
+        "session_id": "...",  // from /explain or /explain/stream with "start_session": true
+        "question": "How is it treated?",
+        "include_timing": false  // optional
+    }
+
+    The question is answered in the conversation the session holds, tool
+    results included, so nothing already looked up is fetched again and
+    Claude reads the earlier turns from its prompt cache. Unknown or
+    expired sessions get a 404.
+    """
+    try:
+        data = request.json
+        session_id, question = followup_params(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+
+    try:
+        client_quotas.check(client_id(request.headers, request.remote_addr))
+        llm_limiter.admit()
+
+        with trace_request("/explain/followup") as trace:
+            result = run_agent(
+                session["term"], session["page_context"], session["difficulty_level"], session["length"],
+                session["retrieval_mode"], history=session["messages"], followup=question
+            )
+            timing = trace.summary()
+
+        body = followup_body(session_id, session, question, result)
+        if data.get('include_timing'):
+            body["timing"] = timing
+        return jsonify(body)
+
+    except Rejected as e:
+        return rejection(e)
 
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -311,11 +1238,67 @@ def list_tools():
     })
 
 
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters for the explanation and retrieval caches, and request coalescing."""
+    return jsonify({
+        "explanations": explanation_cache.stats(),
+        "retrieval": retrieval_cache_stats(),
+        "pubmed": pubmed_stats(),
+        "term_index": term_index_stats(),
+        "similarity": explanation_terms.stats(),
+        "coalescing": coalescing_stats(explain_flight, stream_flight),
+        "include_page_context": EXPLAIN_CACHE_USE_CONTEXT
+    })
+
+
+def coalescing_stats(flight, streams):
+    """Leader/follower counts of request coalescing and the work it saved."""
+    with _savings_lock:
+        saved = dict(coalesced_savings)
+    return {"explain": flight.stats(), "stream": streams.stats(), "saved": saved}
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Latency stats; time-to-first-token of /explain/stream is the headline number."""
+    return jsonify({
+        "ttft_ms": ttft_stats.summary(),
+        "tool_results": projection_stats(),
+        "usage": usage_summary(),
+        "upstream_rate_limits": rate_limit_stats(),
+        "upstreams": resilience_stats(),
+        "admission": admission_stats(),
+        "routes": route_stats(),
+        "sessions": sessions.stats(),
+        "context": context_stats(),
+        "capture": capture_stats()
+    })
+
+
+def admission_stats():
+    """Claude slot and queue counters, and client quota rejections."""
+    return {"llm": llm_limiter.stats(), "clients": client_quotas.stats()}
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, LLM, tool and upstream metrics in the Prometheus text format."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == '__main__':
     print("🚀 Starting Bio for Dummies Agent Server...")
     print("📍 Server will run on http://localhost:5000")
     print("📖 API Documentation:")
     print("   GET  /health  - Check if server is running")
     print("   POST /explain - Explain a biological term")
+    print("   POST /explain/stream - Explain a term, streamed as Server-Sent Events")
+    print("   POST /explain/batch - Explain many terms from one page")
+    print("   POST /explain/followup - Ask a follow-up question about an explanation")
     print("   GET  /tools   - List available tools")
+    print("   GET  /cache/stats - Cache counters")
+    print("   GET  /stats   - Latency, token usage and tool-result size stats")
+    print("   GET  /metrics - Prometheus metrics")
+    print("💡 For production, run the async server: python asgi_server.py --workers 4")
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Conversation sessions, so a follow-up question continues an explanation
+instead of starting over.
+
+A session keeps the request that opened it (term, page context, difficulty,
+length, retrieval mode) and the conversation so far, tool calls and results
+included. A follow-up resends that conversation unchanged after the same
+tools and system prompt, with the new question at the end, so everything
+but the new turn is read from Claude's prompt cache.
+
+A session is only opened when the explanation request asks for one
+("start_session": true), so plain lookups don't fill the store. Sessions
+expire after SESSION_IDLE_TTL seconds without use (reading one counts as
+use), and at most SESSION_MAX are kept (least recently used go first). A
+conversation that grows past SESSION_HISTORY_TOKENS is cut back to half of
+that: older turns lose their tool exchanges, then the oldest turns are
+dropped. Cutting well below the budget means the cached prefix survives
+several more turns before it changes again.
+
+Sessions live in the memory of the process that created them, so with
+several workers, follow-ups must reach the same one (sticky routing),
+unless SHARED_CACHE_URL is set: then they are kept in the shared cache
+(see shared_cache.py) and any worker can continue them. The shared
+server's eviction then bounds them instead of SESSION_MAX.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+
+from cache import LRUCache, MISSING
+
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "1000"))
+SESSION_HISTORY_TOKENS = int(os.environ.get("SESSION_HISTORY_TOKENS", "12000"))
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(messages):
+    return len(json.dumps(messages)) // CHARS_PER_TOKEN
+
+
+def _is_question(message):
+    """A user message that starts a turn, as opposed to one carrying tool results."""
+    if message["role"] != "user":
+        return False
+    content = message["content"]
+    return isinstance(content, str) or not any(block.get("type") == "tool_result" for block in content)
+
+
+def split_turns(messages):
+    """Split a conversation into turns, each a question through its final answer."""
+    turns = []
+    for message in messages:
+        if _is_question(message) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def truncate_history(messages, max_tokens):
+    """
+    Cut a conversation down to max_tokens, oldest material first.
+
+    Older turns are reduced to their question and final answer, then whole
+    turns are dropped from the front. The latest turn is always kept.
+    """
+    if estimate_tokens(messages) <= max_tokens:
+        return messages
+
+    turns = split_turns(messages)
+    turns = [[turn[0], turn[-1]] if len(turn) > 2 else turn for turn in turns[:-1]] + turns[-1:]
+    while len(turns) > 1 and estimate_tokens([m for turn in turns for m in turn]) > max_tokens:
+        turns.pop(0)
+    return [message for turn in turns for message in turn]
+
+
+class SessionStore:
+    """
+    Sessions by id in an LRU cache whose entries expire when idle, or in
+    `store` (a SharedStore with idle_ttl as its TTL) when one is given.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX, idle_ttl=SESSION_IDLE_TTL,
+                 history_tokens=SESSION_HISTORY_TOKENS, store=None):
+        self._cache = store if store is not None else LRUCache(max_entries=max_sessions, ttl=idle_ttl)
+        self.history_tokens = history_tokens
+        self._lock = threading.Lock()
+        self.created = 0
+        self.followups = 0
+        self.truncated = 0
+
+    def _trim(self, messages):
+        if estimate_tokens(messages) <= self.history_tokens:
+            return messages
+        with self._lock:
+            self.truncated += 1
+        return truncate_history(messages, self.history_tokens // 2)
+
+    def create(self, request, messages, sources):
+        """
+        Store a new session and return its id.
+
+        request holds what the conversation was opened with: term,
+        page_context, difficulty_level, length and retrieval_mode.
+        """
+        session_id = secrets.token_urlsafe(16)
+        self._cache.set(session_id, {
+            **request,
+            "messages": self._trim(messages),
+            "sources": list(sources),
+            "turns": 1,
+            "created_at": time.time(),
+        })
+        with self._lock:
+            self.created += 1
+        return session_id
+
+    def _load(self, session_id):
+        session = self._cache.get(session_id, MISSING)
+        return None if session is MISSING else session
+
+    def get(self, session_id):
+        """The session, or None if it is unknown or has expired; reading it restarts its idle timer."""
+        session = self._load(session_id)
+        if session is not None:
+            self._cache.set(session_id, session)
+        return session
+
+    def append(self, session_id, messages, sources):
+        """
+        Replace a session's conversation with its continuation after a follow-up.
+
+        Follow-ups running at the same time on one session don't see each
+        other; the last to finish wins.
+        """
+        session = self._load(session_id)
+        if session is None:
+            return None
+        seen = {source["url"] for source in session["sources"]}
+        session = {
+            **session,
+            "messages": self._trim(messages),
+            "sources": session["sources"] + [s for s in sources if s["url"] not in seen],
+            "turns": session["turns"] + 1,
+        }
+        # Setting it again restarts the idle timer
+        self._cache.set(session_id, session)
+        with self._lock:
+            self.followups += 1
+        return session
+
+    def stats(self):
+        return {
+            **self._cache.stats(),
+            "idle_ttl": self._cache.ttl,
+            "history_tokens": self.history_tokens,
+            "created": self.created,
+            "followups": self.followups,
+            "truncated": self.truncated,
+        }
@@ -0,0 +1,412 @@
+"""
+A cache tier shared by every worker process, spoken to over the Redis protocol (RESP).
+
+With several workers (gunicorn.conf.py, asgi_server.py --workers), each
+one has its own in-process caches, so a term explained by one worker is a
+miss on all the others. With SHARED_CACHE_URL set (redis://host:port/db),
+explanations, Wikipedia/UniProt results, PubMed searches and records, and
+follow-up sessions also go to one store that all workers read, behind
+each worker's in-process LRU.
+
+Fills and evictions are atomic on the server. A value is written whole,
+with its expiry, in one SET, so no worker sees half an entry, and entries
+are evicted by the server (for Redis: maxmemory with
+maxmemory-policy allkeys-lru). An explanation is claimed (SET NX with an
+expiry) before the agent runs for it, so a term asked for on four
+workers at once is explained once; the other workers wait for the value.
+
+No Redis? Run `python shared_cache.py --port 6390` and set
+SHARED_CACHE_URL=redis://127.0.0.1:6390. That starts LocalRespServer, a
+stand-in that speaks the commands used here (GET, SET with EX/PX/NX,
+DEL, EXISTS, ...) with TTLs and an LRU bound on entries. It is meant for
+tests, benchmarks and single-host deployments.
+
+The shared tier is best effort. When it can't be reached, reads miss and
+writes are dropped for SHARED_CACHE_RETRY_AFTER seconds, and each worker
+carries on with its own caches.
+
+Commands block on a socket for up to SHARED_CACHE_TIMEOUT. On the event
+loop (asgi_server.py, async_tools.py) they are sent from a worker thread
+(off_loop, TieredCache.get_async), so a slow cache server delays only the
+requests that wait on it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from urllib.parse import urlsplit
+
+from cache import LRUCache, MISSING
+
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL")
+# Prepended to every key, so several deployments can share one server
+SHARED_CACHE_PREFIX = os.environ.get("SHARED_CACHE_PREFIX", "bio:")
+# Seconds to wait for the server on connect and on each command
+SHARED_CACHE_TIMEOUT = float(os.environ.get("SHARED_CACHE_TIMEOUT", "0.25"))
+# Seconds the shared tier is skipped after it failed
+SHARED_CACHE_RETRY_AFTER = float(os.environ.get("SHARED_CACHE_RETRY_AFTER", "5"))
+# How often a worker waiting on another worker's fill checks for the value
+FILL_POLL_INTERVAL = 0.05
+
+
+class RespError(Exception):
+    """An error reply from the server."""
+
+
+def encode_command(args):
+    """A command as a RESP array of bulk strings."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def encode_reply(value):
+    """A reply in RESP: str is a status, bytes a bulk string, None a null bulk string."""
+    if isinstance(value, RespError):
+        return b"-%s\r\n" % str(value).encode("utf-8")
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode("utf-8")
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(encode_reply(item) for item in value)
+
+
+def read_reply(stream):
+    """Read one RESP value (a reply, or a command on the server side) from a binary file."""
+    line = stream.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        raise RespError(rest.decode("utf-8"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        data = stream.read(size + 2)
+        if len(data) != size + 2:
+            raise ConnectionError("connection closed")
+        return data[:-2]
+    if kind == b"*":
+        size = int(rest)
+        return None if size < 0 else [read_reply(stream) for _ in range(size)]
+    raise RespError(f"unexpected reply {line[:40]!r}")
+
+
+class RespConnection:
+    """One connection to a Redis-protocol server; not thread-safe."""
+
+    def __init__(self, url, timeout=SHARED_CACHE_TIMEOUT):
+        parts = urlsplit(url)
+        self.pid = os.getpid()
+        self._sock = socket.create_connection((parts.hostname or "127.0.0.1", parts.port or 6379), timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        if parts.password:
+            self.command("AUTH", *([parts.username] if parts.username else []), parts.password)
+        db = parts.path.strip("/")
+        if db and db != "0":
+            self.command("SELECT", db)
+
+    def command(self, *args):
+        self._sock.sendall(encode_command(args))
+        return read_reply(self._file)
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+def display_url(url):
+    """url without its credentials, for logs and stats."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.hostname}:{parts.port or 6379}{parts.path}"
+
+
+class SharedStore:
+    """
+    One namespace of the shared cache, with the get/set/stats of SQLiteStore,
+    so it can sit behind an LRUCache in a TieredCache.
+
+    Values are stored as JSON. Each thread keeps its own connection, and a
+    forked worker opens new ones rather than using its parent's.
+    """
+
+    def __init__(self, url, namespace, ttl, timeout=SHARED_CACHE_TIMEOUT, retry_after=SHARED_CACHE_RETRY_AFTER):
+        self.url = url
+        self.namespace = namespace
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._prefix = f"{SHARED_CACHE_PREFIX}{namespace}:"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.fills = {"led": 0, "waited": 0, "shared": 0}
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.pid != os.getpid():
+            conn = self._local.conn = RespConnection(self.url, self.timeout)
+        return conn
+
+    def _command(self, *args):
+        """The command's reply, or MISSING if the server failed or is being skipped."""
+        if time.monotonic() < self._down_until:
+            return MISSING
+        try:
+            return self._connection().command(*args)
+        except RespError as e:
+            print(f"⚠️  Shared cache error on {args[0]}: {e}")
+            with self._lock:
+                self.errors += 1
+            return MISSING
+        except (OSError, ConnectionError) as e:
+            conn, self._local.conn = getattr(self._local, "conn", None), None
+            if conn is not None:
+                conn.close()
+            with self._lock:
+                self.errors += 1
+                announce = time.monotonic() >= self._down_until
+                self._down_until = time.monotonic() + self.retry_after
+            if announce:
+                print(f"⚠️  Shared cache {display_url(self.url)} unavailable ({e}); "
+                      f"using local caches for {self.retry_after:.0f} s")
+            return MISSING
+
+    def _peek(self, key):
+        reply = self._command("GET", self._prefix + key)
+        return MISSING if reply is MISSING or reply is None else json.loads(reply)
+
+    def get(self, key, default=None):
+        value = self._peek(key)
+        with self._lock:
+            if value is MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl_ms = max(1, int((self.ttl if ttl is None else ttl) * 1000))
+        self._command("SET", self._prefix + key, json.dumps(value), "PX", ttl_ms)
+
+    def delete(self, key):
+        self._command("DEL", self._prefix + key)
+
+    def _claim(self, key, ttl):
+        """True if this worker may fill key: it claimed it, or the server can't arbitrate."""
+        ttl_ms = max(1, int(ttl * 1000))
+        return self._command("SET", self._prefix + "fill:" + key, os.getpid(), "NX", "PX", ttl_ms) is not None
+
+    def _claimed(self, key):
+        return self._command("EXISTS", self._prefix + "fill:" + key) == 1
+
+    def _release(self, key):
+        self._command("DEL", self._prefix + "fill:" + key)
+
+    def _count_fill(self, outcome):
+        with self._lock:
+            self.fills[outcome] += 1
+
+    def fill(self, key, compute, timeout):
+        """
+        compute() once across all workers for key, and return its value.
+
+        The worker that claims key runs compute(), which stores the value.
+        The others poll for it for up to timeout seconds, and compute it
+        themselves if the claim is dropped without a value (the run failed
+        or wasn't cached) or expires. The claim lasts timeout seconds, so
+        compute() should finish well within it.
+        """
+        if self._claim(key, timeout):
+            self._count_fill("led")
+            try:
+                return compute()
+            finally:
+                self._release(key)
+
+        self._count_fill("waited")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(FILL_POLL_INTERVAL)
+            value = self._peek(key)
+            if value is not MISSING:
+                self._count_fill("shared")
+                return value
+            if not self._claimed(key):
+                break
+        return compute()
+
+    async def fill_async(self, key, compute, timeout):
+        """fill() for a coroutine function; waits on the event loop, and talks to the server off it."""
+        if await asyncio.to_thread(self._claim, key, timeout):
+            self._count_fill("led")
+            try:
+                return await compute()
+            finally:
+                await asyncio.to_thread(self._release, key)
+
+        self._count_fill("waited")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(FILL_POLL_INTERVAL)
+            value = await asyncio.to_thread(self._peek, key)
+            if value is not MISSING:
+                self._count_fill("shared")
+                return value
+            if not await asyncio.to_thread(self._claimed, key):
+                break
+        return await compute()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "url": display_url(self.url),
+                "namespace": self.namespace,
+                "ttl": self.ttl,
+                "available": time.monotonic() >= self._down_until,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "fills": dict(self.fills),
+            }
+
+
+def shared_store(namespace, ttl):
+    """A SharedStore for namespace when SHARED_CACHE_URL is set, otherwise None."""
+    return SharedStore(SHARED_CACHE_URL, namespace, ttl) if SHARED_CACHE_URL else None
+
+
+async def off_loop(fn, *args):
+    """
+    fn(*args) from a coroutine: on a worker thread when the shared cache is
+    in use, since fn may wait on it, and inline otherwise.
+    """
+    if not SHARED_CACHE_URL:
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, OSError, RespError, ValueError):
+                return
+            try:
+                reply = self.server.execute(command)
+            except RespError as e:
+                reply = e
+            except (IndexError, ValueError):
+                reply = RespError("ERR syntax error")
+            self.wfile.write(encode_reply(reply))
+
+
+class LocalRespServer(socketserver.ThreadingTCPServer):
+    """
+    A stand-in for Redis with the commands SharedStore uses, on an LRUCache.
+
+    Entries are bounded by count, not memory; past max_entries the least
+    recently used go. Commands run one at a time, so SET NX is atomic.
+    SELECT and AUTH are accepted and ignored.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), max_entries=100000):
+        super().__init__(address, _RespHandler)
+        self.cache = LRUCache(max_entries=max_entries, ttl=float("inf"))
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def _set(self, key, value, options):
+        ttl = None
+        only_new = False
+        i = 0
+        while i < len(options):
+            option = options[i].upper()
+            if option in (b"EX", b"PX"):
+                ttl = int(options[i + 1]) / (1 if option == b"EX" else 1000)
+                i += 2
+            elif option == b"NX":
+                only_new = True
+                i += 1
+            else:
+                raise RespError("ERR syntax error")
+        if only_new and self.cache.get(key, MISSING) is not MISSING:
+            return None
+        self.cache.set(key, value, ttl=ttl)
+        return "OK"
+
+    def execute(self, command):
+        name, args = command[0].upper(), command[1:]
+        with self.lock:
+            if name == b"GET":
+                return self.cache.get(args[0])
+            if name == b"SET":
+                return self._set(args[0], args[1], args[2:])
+            if name in (b"DEL", b"EXISTS"):
+                found = [key for key in args if self.cache.get(key, MISSING) is not MISSING]
+                if name == b"DEL":
+                    for key in found:
+                        self.cache.delete(key)
+                return len(found)
+            if name == b"PING":
+                return "PONG"
+            if name in (b"SELECT", b"AUTH"):
+                return "OK"
+            if name == b"DBSIZE":
+                return len(self.cache)
+            if name == b"FLUSHDB":
+                self.cache.clear()
+                return "OK"
+            if name == b"INFO":
+                stats = self.cache.stats()
+                return "".join(f"{key}:{value}\r\n" for key, value in stats.items()).encode("utf-8")
+        raise RespError(f"ERR unknown command '{name.decode('utf-8', 'replace')}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the shared cache's Redis server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--max-entries", type=int, default=100000)
+    args = parser.parse_args()
+
+    server = LocalRespServer((args.host, args.port), args.max_entries)
+    print(f"🗄️  Shared cache stand-in listening; set SHARED_CACHE_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Coalesce concurrent calls (or event streams) for the same key into one execution."""
+import asyncio
+import contextvars
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Duplicate-call suppression, in the spirit of Go's singleflight.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running (followers) wait for and share its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+        self.follower_timeouts = 0
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn() once for all concurrent callers with the same key.
+
+        Followers wait at most `timeout` seconds and raise TimeoutError after
+        that; the leader keeps running and still fills in the result for the
+        others.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(timeout):
+            with self._lock:
+                self.follower_timeouts += 1
+            raise TimeoutError(f"Timed out waiting for in-flight call {key!r}")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight(),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "follower_timeouts": self.follower_timeouts,
+        }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop."""
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+        self.follower_timeouts = 0
+
+    async def do(self, key, coro_fn, timeout=None):
+        """Await coro_fn() once for all concurrent callers with the same key."""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._calls[key] = future
+            self.leaders += 1
+            try:
+                result = await coro_fn()
+                future.set_result(result)
+                return result
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                future.exception()  # followers may not exist; mark it retrieved
+                raise
+            finally:
+                del self._calls[key]
+
+        self.followers += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.follower_timeouts += 1
+            raise TimeoutError(f"Timed out waiting for in-flight call {key!r}")
+
+    def in_flight(self):
+        return len(self._calls)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight(),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "follower_timeouts": self.follower_timeouts,
+        }
+
+
+class _Broadcast:
+    """The events produced so far for one key, and whether production has finished."""
+
+    def __init__(self, changed):
+        self.events = []
+        self.finished = False
+        self.error = None
+        self.changed = changed
+        self.task = None
+
+
+class StreamFlight:
+    """
+    SingleFlight for event streams.
+
+    The first subscriber for a key starts produce() in a background thread;
+    every subscriber, the first included, receives all of its events from
+    the beginning. Production carries on if a subscriber goes away.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = {}
+        self.leaders = 0
+        self.followers = 0
+        self.follower_timeouts = 0
+
+    def subscribe(self, key, produce, timeout=None):
+        """
+        Subscribe to the stream for key, starting produce() if none is running.
+
+        Returns (events, leader). Followers raise TimeoutError from events
+        if the stream has not finished within `timeout` seconds; the leader
+        waits for as long as production takes.
+        """
+        with self._lock:
+            stream = self._streams.get(key)
+            leader = stream is None
+            if leader:
+                stream = _Broadcast(threading.Condition())
+                self._streams[key] = stream
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if leader:
+            # The producer joins the leader's context (e.g. its trace)
+            context = contextvars.copy_context()
+            threading.Thread(
+                target=context.run, args=(self._produce, key, stream, produce), daemon=True
+            ).start()
+        return self._follow(key, stream, None if leader else timeout), leader
+
+    def _produce(self, key, stream, produce):
+        try:
+            for event in produce():
+                with stream.changed:
+                    stream.events.append(event)
+                    stream.changed.notify_all()
+        except Exception as e:
+            stream.error = e
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with stream.changed:
+                stream.finished = True
+                stream.changed.notify_all()
+
+    def _follow(self, key, stream, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        index = 0
+        while True:
+            with stream.changed:
+                while index >= len(stream.events) and not stream.finished:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        with self._lock:
+                            self.follower_timeouts += 1
+                        raise TimeoutError(f"Timed out waiting for in-flight stream {key!r}")
+                    stream.changed.wait(remaining)
+                events = stream.events[index:]
+                finished = stream.finished
+            index += len(events)
+            yield from events
+            if finished:
+                if stream.error is not None:
+                    raise stream.error
+                return
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._streams)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight(),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "follower_timeouts": self.follower_timeouts,
+        }
+
+
+class AsyncStreamFlight:
+    """StreamFlight for async generators running on one event loop."""
+
+    def __init__(self):
+        self._streams = {}
+        self.leaders = 0
+        self.followers = 0
+        self.follower_timeouts = 0
+
+    def subscribe(self, key, produce, timeout=None):
+        """Subscribe to the stream for key; returns (async events, leader)."""
+        stream = self._streams.get(key)
+        leader = stream is None
+        if leader:
+            stream = _Broadcast(asyncio.Condition())
+            self._streams[key] = stream
+            self.leaders += 1
+            stream.task = asyncio.get_running_loop().create_task(self._produce(key, stream, produce))
+        else:
+            self.followers += 1
+        return self._follow(key, stream, None if leader else timeout), leader
+
+    async def _produce(self, key, stream, produce):
+        try:
+            async for event in produce():
+                async with stream.changed:
+                    stream.events.append(event)
+                    stream.changed.notify_all()
+        except asyncio.CancelledError:
+            stream.error = RuntimeError(f"In-flight stream {key!r} was cancelled")
+            raise
+        except Exception as e:
+            stream.error = e
+        finally:
+            del self._streams[key]
+            async with stream.changed:
+                stream.finished = True
+                stream.changed.notify_all()
+
+    async def _follow(self, key, stream, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        index = 0
+        while True:
+            async with stream.changed:
+                while index >= len(stream.events) and not stream.finished:
+                    remaining = None if deadline is None else deadline - loop.time()
+                    try:
+                        if remaining is not None and remaining <= 0:
+                            raise asyncio.TimeoutError
+                        await asyncio.wait_for(stream.changed.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        self.follower_timeouts += 1
+                        raise TimeoutError(f"Timed out waiting for in-flight stream {key!r}")
+                events = stream.events[index:]
+                finished = stream.finished
+            index += len(events)
+            for event in events:
+                yield event
+            if finished:
+                if stream.error is not None:
+                    raise stream.error
+                return
+
+    def in_flight(self):
+        return len(self._streams)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight(),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "follower_timeouts": self.follower_timeouts,
+        }
@@ -0,0 +1,400 @@
+"""
+Local index of pre-harvested Wikipedia summaries and UniProt records.
+
+The most frequent lookups hit the same few thousand entities, so the
+get_wikipedia_summary and search_uniprot tools check this SQLite file
+before going to the network. Entries are stored in the tools' own result
+format under a normalized key. They can also be reached through aliases
+(synonyms, Wikipedia titles, gene names, accessions), and near misses are
+matched fuzzily: one typo in one long word, as similarity.one_typo_apart
+allows, so "interleukin 6" never finds interleukin 8. Aliases are held in
+memory, so a lookup is a dict probe plus one primary-key read.
+
+    python term_index.py refresh terms.txt     # fetch new and stale terms
+    python term_index.py lookup "IL-6"
+    python term_index.py stats
+
+A terms file has one term per line, optionally followed by synonyms
+separated by "|", e.g. "interleukin 6 | IL-6 | IL6". Lines starting
+with # are ignored. The servers pick up a rebuilt file without a restart.
+"""
+import argparse
+import difflib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Local modules read their settings from the environment when imported
+from http_client import UNIPROT_API_URL, WIKIPEDIA_API_URL, http_get
+
+TERM_INDEX_PATH = os.environ.get(
+    "TERM_INDEX_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "term_index.db")
+)
+# Similarity (0-1) a near miss needs to count as a match; 1 disables fuzzy matching
+TERM_INDEX_FUZZY_CUTOFF = float(os.environ.get("TERM_INDEX_FUZZY_CUTOFF", "0.88"))
+# Seconds between checks for a rebuilt index file
+RELOAD_CHECK_INTERVAL = 30
+SOURCES = ("wikipedia", "uniprot")
+
+_SEPARATORS = re.compile(r"[-_/,.()'\"]+")
+_FUZZY_MEMO_SIZE = 10000
+
+_stats = {"hits": 0, "fuzzy_hits": 0, "misses": 0}
+
+
+def index_key(term):
+    """Normalize a term for the index: case-folded, punctuation and whitespace collapsed."""
+    return " ".join(_SEPARATORS.sub(" ", term).split()).casefold()
+
+
+class TermIndex:
+    """The index file: entries per (source, key) and aliases pointing at them."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._closed = False
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA mmap_size=268435456")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " source TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (source, key))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS aliases ("
+            " source TEXT NOT NULL,"
+            " alias TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " PRIMARY KEY (source, alias))"
+        )
+        self._conn.commit()
+        self._load_aliases()
+
+    def _load_aliases(self):
+        self._aliases = {source: {} for source in SOURCES}
+        # Fuzzy candidates grouped by first character, so a near miss is only
+        # compared with aliases that could plausibly match
+        self._candidates = {source: {} for source in SOURCES}
+        self._fuzzy_memo = {}
+        self._remember_aliases(self._conn.execute("SELECT source, alias, key FROM aliases").fetchall())
+
+    def _remember_aliases(self, rows):
+        for source, alias, key in rows:
+            known = self._aliases.setdefault(source, {})
+            if alias not in known:
+                self._candidates.setdefault(source, {}).setdefault(alias[:1], []).append(alias)
+            known[alias] = key
+
+    def _fuzzy(self, source, alias):
+        memo_key = (source, alias)
+        if memo_key in self._fuzzy_memo:
+            return self._fuzzy_memo[memo_key]
+
+        candidates = [
+            c for c in self._candidates.get(source, {}).get(alias[:1], [])
+            if abs(len(c) - len(alias)) <= 3
+        ]
+        # similarity imports this module, so its typo check is imported here
+        from similarity import one_typo_apart
+
+        # A close ratio alone joins different entities ("interleukin 6" and
+        # "interleukin 8", "inulin" and "insulin"); only a typo counts
+        matches = difflib.get_close_matches(alias, candidates, n=3, cutoff=TERM_INDEX_FUZZY_CUTOFF)
+        match = next((m for m in matches if one_typo_apart(alias, m)), None)
+        key = self._aliases[source][match] if match is not None else None
+
+        if len(self._fuzzy_memo) >= _FUZZY_MEMO_SIZE:
+            self._fuzzy_memo.clear()
+        self._fuzzy_memo[memo_key] = key
+        return key
+
+    def lookup(self, source, term, fuzzy=True):
+        """The stored tool result for term, or None if the index does not have it."""
+        alias = index_key(term)
+        key = self._aliases.get(source, {}).get(alias)
+        matched_fuzzily = False
+        if key is None and fuzzy and alias and TERM_INDEX_FUZZY_CUTOFF < 1:
+            key = self._fuzzy(source, alias)
+            matched_fuzzily = key is not None
+        if key is None:
+            _stats["misses"] += 1
+            return None
+
+        with self._lock:
+            # Replaced by a rebuilt index since the caller got it
+            row = None if self._closed else self._conn.execute(
+                "SELECT data FROM entries WHERE source = ? AND key = ?", (source, key)
+            ).fetchone()
+        if row is None:
+            _stats["misses"] += 1
+            return None
+        _stats["fuzzy_hits" if matched_fuzzily else "hits"] += 1
+        return json.loads(row[0])
+
+    def resolve(self, source, term):
+        """The key an alias points at (no fuzzy matching), or None."""
+        return self._aliases.get(source, {}).get(index_key(term))
+
+    def updated_at(self, source):
+        """When each key of a source was last fetched."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, updated_at FROM entries WHERE source = ?", (source,)
+            ).fetchall()
+        return dict(rows)
+
+    def upsert(self, source, term, data, aliases=()):
+        """Store a tool result for term, reachable through term and its aliases."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (source, key, data, updated_at) VALUES (?, ?, ?, ?)",
+                (source, index_key(term), json.dumps(data, separators=(",", ":")), time.time()),
+            )
+            self._store_aliases(source, term, aliases)
+
+    def add_aliases(self, source, term, aliases):
+        """Make an existing entry reachable through more names."""
+        with self._lock:
+            self._store_aliases(source, term, aliases)
+
+    def _store_aliases(self, source, term, aliases):
+        key = index_key(term)
+        rows = [(source, alias, key) for alias in {index_key(a) for a in (term, *aliases) if a} if alias]
+        self._conn.executemany("INSERT OR REPLACE INTO aliases (source, alias, key) VALUES (?, ?, ?)", rows)
+        self._remember_aliases(rows)
+        self._fuzzy_memo.clear()
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def counts(self):
+        with self._lock:
+            entries = dict(self._conn.execute("SELECT source, COUNT(*) FROM entries GROUP BY source").fetchall())
+            aliases = self._conn.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]
+        return {"entries": entries, "aliases": aliases}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._conn.close()
+
+
+_index = None
+_index_mtime = None
+_checked_at = None
+_open_lock = threading.Lock()
+
+
+def get_index():
+    """The shared index, reopened when the file changes; None if it has not been built."""
+    global _index, _index_mtime, _checked_at
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < RELOAD_CHECK_INTERVAL:
+        return _index
+
+    with _open_lock:
+        if _checked_at is not None and now - _checked_at < RELOAD_CHECK_INTERVAL:
+            return _index
+        _checked_at = now
+        try:
+            mtime = os.stat(TERM_INDEX_PATH).st_mtime
+        except OSError:
+            _replace_index(None)
+            return None
+        if _index is None or mtime != _index_mtime:
+            _replace_index(TermIndex(TERM_INDEX_PATH))
+            _index_mtime = mtime
+            print(f"📚 Loaded term index {TERM_INDEX_PATH}")
+        return _index
+
+
+def _replace_index(index):
+    """Swap in index and close the one it replaces, so rebuilds don't leak connections."""
+    global _index
+    old, _index = _index, index
+    if old is not None:
+        old.close()
+
+
+def lookup_term(source, term):
+    """The locally indexed tool result for term ("wikipedia" or "uniprot"), or None."""
+    index = get_index()
+    if index is None:
+        return None
+    return index.lookup(source, term)
+
+
+def indexed_name(term, source="wikipedia"):
+    """The name term is indexed under, when it is a known synonym of it; else None."""
+    index = get_index()
+    if index is None:
+        return None
+    return index.resolve(source, term)
+
+
+def term_index_stats():
+    index = get_index()
+    if index is None:
+        return {"path": TERM_INDEX_PATH, "enabled": False}
+    return {"path": TERM_INDEX_PATH, "enabled": True, **index.counts(), **_stats}
+
+
+# Harvesting
+def slim_uniprot_entry(entry):
+    """Keep the fields the prompt and sources use, in UniProt's own layout."""
+    functions = [c for c in entry.get("comments", []) if c.get("commentType") == "FUNCTION"]
+    return {
+        "primaryAccession": entry.get("primaryAccession"),
+        "proteinDescription": {
+            "recommendedName": entry.get("proteinDescription", {}).get("recommendedName", {})
+        },
+        "genes": entry.get("genes", [])[:1],
+        "organism": {"scientificName": entry.get("organism", {}).get("scientificName")},
+        "comments": functions[:1],
+    }
+
+
+def fetch_wikipedia(term):
+    """(result, aliases) for a term from Wikipedia, or None if it has no article."""
+    response = http_get(f"{WIKIPEDIA_API_URL}/page/summary/{quote(term)}")
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if data.get("type") == "disambiguation" or not data.get("extract"):
+        return None
+    result = {
+        "title": data.get("title"),
+        "summary": data.get("extract"),
+        "url": data.get("content_urls", {}).get("desktop", {}).get("page")
+    }
+    return result, [data.get("title")]
+
+
+def fetch_uniprot(term):
+    """(result, aliases) for a term from UniProt, or None if nothing matches."""
+    response = http_get(
+        f"{UNIPROT_API_URL}/uniprotkb/search",
+        params={"query": term, "format": "json", "size": 3}
+    )
+    if response.status_code != 200:
+        return None
+    entries = response.json().get("results", [])
+    if not entries:
+        return None
+    top = entries[0]
+    aliases = [
+        top.get("primaryAccession"),
+        top.get("proteinDescription", {}).get("recommendedName", {}).get("fullName", {}).get("value"),
+        *(gene.get("geneName", {}).get("value") for gene in top.get("genes", [])[:1]),
+    ]
+    return {"results": [slim_uniprot_entry(e) for e in entries]}, aliases
+
+
+fetchers = {
+    "wikipedia": fetch_wikipedia,
+    "uniprot": fetch_uniprot,
+}
+
+
+def read_terms(path):
+    """[(term, [synonyms])] from a terms file."""
+    terms = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            names = [name.strip() for name in line.split("|") if name.strip()]
+            terms.append((names[0], names[1:]))
+    return terms
+
+
+def refresh(index, terms, sources=SOURCES, max_age=30 * 24 * 3600, workers=4):
+    """
+    Fetch the terms that are missing from the index or older than max_age seconds.
+
+    Terms that are already fresh only get their synonyms updated, so a
+    refresh of an unchanged list does no network requests.
+    """
+    for source in sources:
+        updated = index.updated_at(source)
+        cutoff = time.time() - max_age
+        stale = [(t, s) for t, s in terms if updated.get(index_key(t), 0) < cutoff]
+        for term, synonyms in terms:
+            if index_key(term) in updated and synonyms:
+                index.add_aliases(source, term, synonyms)
+
+        print(f"🔄 {source}: {len(stale)} of {len(terms)} term(s) to fetch")
+
+        def fetch(item):
+            term, _ = item
+            try:
+                return fetchers[source](term)
+            except Exception as e:
+                print(f"⚠️  {source} lookup for '{term}' failed: {e}")
+                return None
+
+        stored = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for (term, synonyms), found in zip(stale, pool.map(fetch, stale)):
+                if found is None:
+                    continue
+                result, aliases = found
+                index.upsert(source, term, result, [*synonyms, *aliases])
+                stored += 1
+                if stored % 50 == 0:
+                    index.commit()
+        index.commit()
+        print(f"✅ {source}: stored {stored} entr{'y' if stored == 1 else 'ies'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the local term index")
+    parser.add_argument("--db", default=TERM_INDEX_PATH, help="Index file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    refresh_parser = commands.add_parser("refresh", help="Fetch new and stale terms from a terms file")
+    refresh_parser.add_argument("terms_file")
+    refresh_parser.add_argument("--sources", nargs="+", choices=SOURCES, default=list(SOURCES))
+    refresh_parser.add_argument("--max-age-days", type=float, default=30,
+                                help="Refetch entries older than this (0 refetches everything)")
+    refresh_parser.add_argument("--workers", type=int, default=4)
+
+    lookup_parser = commands.add_parser("lookup", help="Look a term up the way the tools do")
+    lookup_parser.add_argument("term")
+    lookup_parser.add_argument("--source", choices=SOURCES, default="wikipedia")
+
+    commands.add_parser("stats", help="Entry and alias counts")
+    args = parser.parse_args()
+
+    index = TermIndex(args.db)
+    if args.command == "refresh":
+        refresh(index, read_terms(args.terms_file), args.sources,
+                args.max_age_days * 24 * 3600, args.workers)
+    elif args.command == "lookup":
+        started = time.perf_counter()
+        result = index.lookup(args.source, args.term)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        print(json.dumps(result, indent=2) if result is not None else "Not in the index")
+        print(f"⏱️  {elapsed_us:.0f} µs")
+    else:
+        print(json.dumps(index.counts(), indent=2))
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
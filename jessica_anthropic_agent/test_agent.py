@@ -61,6 +61,72 @@ def test_explain(term, difficulty="undergrad", length="brief"):
         print(f"Error: {response.text}")
 
 
+def test_explain_stream(term, difficulty="undergrad", length="brief"):
+    """Test the streaming explain endpoint."""
+    print(f"🔍 Testing streaming explain endpoint for: '{term}'")
+
+    payload = {
+        "term": term,
+        "page_context": {
+            "title": "Biology Research Article",
+            "url": "https://example.com/research",
+            "surrounding_text": f"This article discusses {term} in detail..."
+        },
+        "difficulty_level": difficulty,
+        "length": length
+    }
+
+    response = requests.post(f"{SERVER_URL}/explain/stream", json=payload, stream=True)
+    print(f"Status: {response.status_code}\n")
+
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: "):])
+            if event == "text":
+                print(data["delta"], end="", flush=True)
+            elif event in ("tool_call", "tool_result"):
+                print(f"\n[{event}] {data['name']}")
+            elif event == "done":
+                print(f"\n\nTime to first token: {data['ttft_ms']} ms | Total: {data['total_ms']:.0f} ms")
+                print(f"Sources: {[s['url'] for s in data['sources']]}")
+            elif event == "error":
+                print(f"\nError: {data['error']}")
+    print()
+
+
+def test_explain_batch(terms, difficulty="undergrad", length="brief"):
+    """Test the batch explain endpoint."""
+    print(f"🔍 Testing batch explain endpoint for: {terms}")
+
+    payload = {
+        "terms": terms,
+        "page_context": {
+            "title": "Biology Research Article",
+            "url": "https://example.com/research",
+            "surrounding_text": "This article discusses " + ", ".join(terms) + "..."
+        },
+        "difficulty_level": difficulty,
+        "length": length
+    }
+
+    response = requests.post(f"{SERVER_URL}/explain/batch", json=payload)
+    print(f"Status: {response.status_code}\n")
+
+    if response.status_code == 200:
+        data = response.json()
+        for term, result in data["results"].items():
+            print("=" * 60)
+            print(f"TERM: {term} | CACHED: {result.get('cached')}")
+            print(result.get("explanation") or f"Error: {result.get('error')}")
+        print("=" * 60)
+        print(f"Failed: {data['failed']}\n")
+    else:
+        print(f"Error: {response.text}")
+
+
 def test_tools():
     """Test the tools listing endpoint."""
     print("🔍 Testing tools endpoint...")
@@ -87,4 +153,18 @@ if __name__ == "__main__":
     print("Testing different difficulty levels...")
     print("=" * 60 + "\n")
 
-    test_explain("CRISPR", difficulty="eli5")
\ No newline at end of file
+    test_explain("CRISPR", difficulty="eli5")
+
+    # Test 5: Streaming endpoint
+    print("\n" + "=" * 60)
+    print("Testing streaming endpoint...")
+    print("=" * 60 + "\n")
+
+    test_explain_stream("mRNA", difficulty="high_school")
+
+    # Test 6: Batch endpoint (duplicate spellings are explained once)
+    print("\n" + "=" * 60)
+    print("Testing batch endpoint...")
+    print("=" * 60 + "\n")
+
+    test_explain_batch(["CRISPR", "crispr", "cytokine storm", "mRNA"])
\ No newline at end of file
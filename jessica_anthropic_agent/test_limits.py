@@ -0,0 +1,62 @@
+"""
+Request budget and admission limits, checked in-process against stand-ins.
+
+Unlike test_agent.py these need no running server or network:
+
+    python -m pytest test_limits.py
+"""
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+os.environ.setdefault("API_KEY", "test")
+
+import server
+
+
+class StalledClaude(BaseHTTPRequestHandler):
+    """A Messages API that never answers in time."""
+
+    def do_POST(self):
+        time.sleep(10)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stalled_claude():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StalledClaude)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_timed_out_call_stays_within_deadline(stalled_claude, monkeypatch):
+    monkeypatch.setattr(server, "client", server.client.with_options(base_url=stalled_claude))
+    monkeypatch.setattr(server, "AGENT_DEADLINE", 2.0)
+    monkeypatch.setattr(server, "FINAL_ANSWER_RESERVE", 0.5)
+    monkeypatch.setitem(server.tool_functions, "get_wikipedia_summary", lambda term: {
+        "title": term, "summary": f"{term} summary", "url": f"https://en.wikipedia.org/wiki/{term}"
+    })
+
+    started = time.monotonic()
+    result = server.run_agent("stalled claude test term", {}, retrieval_mode="agent")
+    elapsed = time.monotonic() - started
+
+    assert result["degraded_reason"] == "deadline"
+    assert elapsed < server.AGENT_DEADLINE + 1
+
+
+def test_over_burst_batch_is_invalid_not_rate_limited(monkeypatch):
+    monkeypatch.setattr(server, "client_quotas", server.ClientQuotas(per_minute=60, burst=10))
+    terms = [f"term {i}" for i in range(11)]
+
+    response = server.app.test_client().post("/explain/batch", json={"terms": terms})
+
+    assert response.status_code == 400
+    assert "Retry-After" not in response.headers
+    assert response.get_json()["error"] == "Too many terms: 11 (max 10)"
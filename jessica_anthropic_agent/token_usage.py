@@ -0,0 +1,46 @@
+"""Token usage counters, including prompt-cache reads and writes."""
+import threading
+
+USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_read_input_tokens",
+    "cache_creation_input_tokens",
+)
+
+_lock = threading.Lock()
+_totals = {"calls": 0, **{field: 0 for field in USAGE_FIELDS}}
+
+
+def record_usage(usage, request_usage=None):
+    """
+    Add one response's usage to the process totals.
+
+    Returns the running totals for the current request: request_usage
+    plus this response's usage, in a new dict.
+    """
+    counts = {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+    with _lock:
+        _totals["calls"] += 1
+        for field, count in counts.items():
+            _totals[field] += count
+
+    request_usage = dict(request_usage or {field: 0 for field in USAGE_FIELDS})
+    for field, count in counts.items():
+        request_usage[field] += count
+    return request_usage
+
+
+def usage_summary():
+    """Process-wide token totals and the share of input tokens read from the cache."""
+    with _lock:
+        totals = dict(_totals)
+    prompt_tokens = (
+        totals["input_tokens"]
+        + totals["cache_read_input_tokens"]
+        + totals["cache_creation_input_tokens"]
+    )
+    totals["cache_hit_ratio"] = (
+        totals["cache_read_input_tokens"] / prompt_tokens if prompt_tokens else None
+    )
+    return totals
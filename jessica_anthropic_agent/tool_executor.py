@@ -0,0 +1,117 @@
+"""Run the tool_use blocks from one agent turn concurrently."""
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from tracing import span
+
+# Thread pool shared by every request; tool calls are network bound
+TOOL_WORKERS = int(os.environ.get("TOOL_WORKERS", "16"))
+
+# Deadlines in seconds, counted from when the turn's tools are submitted
+DEFAULT_TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", "10"))
+tool_timeouts = {
+    "search_pubmed": float(os.environ.get("PUBMED_TOOL_TIMEOUT", DEFAULT_TOOL_TIMEOUT)),
+    "get_wikipedia_summary": float(os.environ.get("WIKIPEDIA_TOOL_TIMEOUT", DEFAULT_TOOL_TIMEOUT)),
+    "search_uniprot": float(os.environ.get("UNIPROT_TOOL_TIMEOUT", DEFAULT_TOOL_TIMEOUT)),
+}
+
+_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+# When the tool call running in this context is due (time.monotonic());
+# http_client keeps its timeouts and retries within it
+call_deadline = contextvars.ContextVar("call_deadline", default=None)
+
+
+def _is_error(result):
+    return isinstance(result, dict) and "error" in result
+
+
+def time_left():
+    """Seconds until the current tool call is due, or None outside a tool call."""
+    deadline = call_deadline.get()
+    return deadline - time.monotonic() if deadline is not None else None
+
+
+def _safe_execute(execute_tool, tool_name, tool_input, deadline):
+    """Call a tool in a trace span, turning any exception into an error result."""
+    # Runs in a copied context, so this doesn't outlive the call
+    call_deadline.set(deadline)
+    with span("tool", tool_name, activate=True) as record:
+        try:
+            result = execute_tool(tool_name, tool_input)
+        except Exception as e:
+            result = {"error": str(e)}
+        record["ok"] = not _is_error(result)
+    return result
+
+
+def _tool_timeout(tool_name, max_timeout):
+    timeout = tool_timeouts.get(tool_name, DEFAULT_TOOL_TIMEOUT)
+    return min(timeout, max_timeout) if max_timeout is not None else timeout
+
+
+def run_tool_calls(calls, execute_tool, max_timeout=None):
+    """
+    Execute tool calls concurrently and return their results in order.
+
+    Args:
+        calls: List of (tool_name, tool_input) pairs from one assistant turn
+        execute_tool: Function taking (tool_name, tool_input)
+        max_timeout: Optional cap on every tool's deadline, e.g. the time
+            left in the request's budget
+
+    Returns:
+        A list of results, one per call, in the same order as `calls`.
+        A call that misses its deadline gets an error result; the model
+        can still answer from the other tools.
+
+    Cancelling a late call only stops it if it hasn't started yet. One
+    that is already running keeps its worker until it returns, so its
+    HTTP requests (see http_client) get no more time than its deadline
+    leaves them.
+    """
+    started = time.monotonic()
+    # Each call runs in a copy of the caller's context so it joins the request's trace
+    futures = [
+        _executor.submit(
+            contextvars.copy_context().run, _safe_execute, execute_tool, tool_name, tool_input,
+            started + _tool_timeout(tool_name, max_timeout)
+        )
+        for tool_name, tool_input in calls
+    ]
+
+    results = []
+    for (tool_name, _), future in zip(calls, futures):
+        timeout = _tool_timeout(tool_name, max_timeout)
+        remaining = max(0.0, started + timeout - time.monotonic())
+        try:
+            results.append(future.result(timeout=remaining))
+        except FutureTimeout:
+            future.cancel()
+            print(f"⏱️  Tool {tool_name} timed out after {timeout:.1f}s")
+            results.append({"error": f"{tool_name} timed out after {timeout:.1f}s"})
+
+    return results
+
+
+async def run_tool_calls_async(calls, execute_tool_async, max_timeout=None):
+    """run_tool_calls for coroutine tools, with the same per-tool deadlines."""
+    async def run_one(tool_name, tool_input):
+        timeout = _tool_timeout(tool_name, max_timeout)
+        with span("tool", tool_name, activate=True) as record:
+            try:
+                result = await asyncio.wait_for(execute_tool_async(tool_name, tool_input), timeout)
+            except asyncio.TimeoutError:
+                print(f"⏱️  Tool {tool_name} timed out after {timeout:.1f}s")
+                result = {"error": f"{tool_name} timed out after {timeout:.1f}s"}
+            except Exception as e:
+                result = {"error": str(e)}
+            record["ok"] = not _is_error(result)
+        return result
+
+    return list(await asyncio.gather(
+        *(run_one(tool_name, tool_input) for tool_name, tool_input in calls)
+    ))
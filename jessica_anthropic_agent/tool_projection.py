@@ -0,0 +1,142 @@
+"""
+Compact serialization of tool results for the prompt.
+
+Raw tool results are large: search_uniprot returns whole UniProtKB
+entries and search_pubmed full records with author lists. Each
+projector keeps only the fields an explanation needs (title, abstract,
+accession, URL). The output is compact JSON, cut down to a per-tool
+token budget.
+"""
+import json
+import os
+import threading
+
+# Rough prompt-token budget per tool result (~4 characters per token)
+DEFAULT_RESULT_TOKENS = int(os.environ.get("TOOL_RESULT_TOKENS", "600"))
+result_token_budgets = {
+    "search_pubmed": int(os.environ.get("PUBMED_RESULT_TOKENS", str(DEFAULT_RESULT_TOKENS))),
+    "get_wikipedia_summary": int(os.environ.get("WIKIPEDIA_RESULT_TOKENS", str(DEFAULT_RESULT_TOKENS))),
+    "search_uniprot": int(os.environ.get("UNIPROT_RESULT_TOKENS", str(DEFAULT_RESULT_TOKENS))),
+}
+CHARS_PER_TOKEN = 4
+
+# Progressively shorter limits for long text fields when over budget
+_TRUNCATION_STEPS = (800, 400, 200, 100)
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def project_pubmed(result):
+    articles = []
+    for uid in result.get("uids", []):
+        article = result.get(uid, {})
+        articles.append({
+            "pmid": uid,
+            "title": article.get("title"),
+            "journal": article.get("fulljournalname") or article.get("source"),
+            "year": (article.get("pubdate") or "")[:4] or None,
+            "abstract": article.get("abstract"),
+            "url": f"https://pubmed.ncbi.nlm.nih.gov/{uid}/"
+        })
+    return articles
+
+
+def project_wikipedia(result):
+    return {
+        "title": result.get("title"),
+        "summary": result.get("summary"),
+        "url": result.get("url")
+    }
+
+
+def project_uniprot(result):
+    proteins = []
+    for entry in result.get("results", []):
+        accession = entry.get("primaryAccession")
+        name = (entry.get("proteinDescription", {})
+                .get("recommendedName", {})
+                .get("fullName", {})
+                .get("value"))
+        genes = entry.get("genes") or [{}]
+        function = None
+        for comment in entry.get("comments", []):
+            if comment.get("commentType") == "FUNCTION" and comment.get("texts"):
+                function = comment["texts"][0].get("value")
+                break
+        proteins.append({
+            "accession": accession,
+            "name": name,
+            "gene": genes[0].get("geneName", {}).get("value"),
+            "organism": entry.get("organism", {}).get("scientificName"),
+            "function": function,
+            "url": f"https://www.uniprot.org/uniprotkb/{accession}" if accession else None
+        })
+    return proteins
+
+
+projectors = {
+    "search_pubmed": project_pubmed,
+    "get_wikipedia_summary": project_wikipedia,
+    "search_uniprot": project_uniprot,
+}
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _truncate_strings(value, limit):
+    if isinstance(value, str):
+        return value if len(value) <= limit else value[:limit].rstrip() + "…"
+    if isinstance(value, list):
+        return [_truncate_strings(v, limit) for v in value]
+    if isinstance(value, dict):
+        return {k: _truncate_strings(v, limit) for k, v in value.items()}
+    return value
+
+
+def fit_to_budget(value, max_chars):
+    """Serialize value compactly, shortening text and then dropping list items to fit."""
+    text = _dumps(value)
+    for limit in _TRUNCATION_STEPS:
+        if len(text) <= max_chars:
+            return text
+        value = _truncate_strings(value, limit)
+        text = _dumps(value)
+
+    if isinstance(value, list):
+        while len(text) > max_chars and len(value) > 1:
+            value = value[:-1]
+            text = _dumps(value)
+    return text
+
+
+def serialize_tool_result(tool_name, result):
+    """Project a tool result and serialize it as compact JSON within the tool's budget."""
+    raw_bytes = len(str(result).encode("utf-8"))
+
+    if isinstance(result, dict) and "error" in result:
+        text = _dumps({"error": result["error"]})
+    elif tool_name in projectors and isinstance(result, dict):
+        budget = result_token_budgets.get(tool_name, DEFAULT_RESULT_TOKENS) * CHARS_PER_TOKEN
+        text = fit_to_budget(projectors[tool_name](result), budget)
+    else:
+        text = _dumps(result)
+
+    projected_bytes = len(text.encode("utf-8"))
+    with _stats_lock:
+        stats = _stats.setdefault(tool_name, {"calls": 0, "raw_bytes": 0, "projected_bytes": 0})
+        stats["calls"] += 1
+        stats["raw_bytes"] += raw_bytes
+        stats["projected_bytes"] += projected_bytes
+    return text
+
+
+def projection_stats():
+    """Bytes each projector has received and emitted, and how many it saved."""
+    with _stats_lock:
+        return {
+            tool_name: {**stats, "saved_bytes": stats["raw_bytes"] - stats["projected_bytes"]}
+            for tool_name, stats in _stats.items()
+        }
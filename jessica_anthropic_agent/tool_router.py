@@ -0,0 +1,108 @@
+"""
+Heuristic router deciding how a term's evidence is retrieved.
+
+"agent" lets Claude pick tools over several rounds. "prefetch" runs the
+likely lookups up front and sends the results with the first message, so
+the explanation is a single Claude call. "auto" prefetches when the tool
+choice is predictable and falls back to the agent loop otherwise.
+"""
+import os
+import re
+
+RETRIEVAL_MODES = ("agent", "prefetch", "auto")
+DEFAULT_RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "agent")
+
+# Gene/protein symbols such as TP53, BRCA1, IL-6, TNF-alpha, HER2, EGFR, p53
+_GENE_SYMBOL = re.compile(r"^(?:[A-Z][A-Z0-9]{1,9}|p\d{2,3})(?:[-/]?(?:[A-Z0-9]+|alpha|beta|gamma|[αβγδκ]))?$")
+
+# All-caps abbreviations that are not proteins; "HIV-1" and "COVID-19"
+# are matched by the part before the hyphen
+_NON_PROTEIN_ACRONYMS = {
+    "DNA", "RNA", "MRNA", "TRNA", "RRNA", "CDNA", "ATP", "ADP", "GTP", "NADH", "PCR", "CRISPR",
+    "GMO", "SNP", "GWAS", "MRI", "CT", "ECG", "IVF", "BMI", "LDL", "HDL",
+    # Viruses
+    "HIV", "COVID", "SARS", "MERS", "HPV", "HSV", "EBV", "CMV", "HBV", "HCV", "RSV", "MPOX", "ZIKV",
+    # Diseases
+    "AIDS", "ALS", "ADHD", "COPD", "TB", "MS", "CF", "SLE", "IBD", "IBS", "CKD", "CVD", "PTSD", "OCD",
+    "ASD", "ARDS", "NAFLD", "T1D", "T2D",
+}
+# Influenza subtypes: H1N1, H5N1, H3N2
+_FLU_SUBTYPE = re.compile(r"^H\d{1,2}N\d{1,2}$")
+
+_PROTEIN_WORDS = {
+    "protein", "proteins", "receptor", "receptors", "kinase", "kinases", "enzyme", "enzymes",
+    "hormone", "interleukin", "interferon", "antibody", "antibodies", "immunoglobulin",
+    "channel", "transporter", "factor", "ligand", "hemoglobin", "haemoglobin", "insulin",
+    "collagen", "keratin", "actin", "myosin", "tubulin", "albumin", "ubiquitin", "histone",
+    "dnase", "rnase",
+}
+
+# Suffixes common in protein names (polymerase, helicase, globulin, ...)
+_PROTEIN_SUFFIXES = ("ase", "ases", "globulin", "kine", "kines")
+# Letters a protein name has before its suffix: "lipase" is an enzyme, "phase" and "base" are not
+_MIN_STEM_LENGTH = 3
+# Everyday words that end like enzymes
+_NOT_ENZYMES = {
+    "disease", "phase", "base", "lease", "release", "case", "increase", "decrease", "purchase",
+    "database", "phrase", "chase", "erase", "showcase", "crease",
+}
+
+# Phrasing that means the user wants more than a definition
+_OPEN_ENDED = re.compile(r"\?|\b(?:vs\.?|versus|difference|compare|why|how|between)\b", re.IGNORECASE)
+
+MAX_PREFETCH_WORDS = int(os.environ.get("MAX_PREFETCH_WORDS", "5"))
+
+
+def looks_like_protein(term):
+    """Guess whether a term names a protein or gene."""
+    stripped = term.strip()
+    if _GENE_SYMBOL.match(stripped):
+        symbol = stripped.upper()
+        return not (
+            symbol in _NON_PROTEIN_ACRONYMS
+            or re.split(r"[-/]", symbol)[0] in _NON_PROTEIN_ACRONYMS
+            or _FLU_SUBTYPE.match(symbol)
+        )
+
+    # The head noun decides: "insulin receptor" is a protein, "cytokine storm" is not
+    words = re.findall(r"[a-z]+", stripped.lower())
+    if not words:
+        return False
+    head = words[-1]
+    if head in _PROTEIN_WORDS:
+        return True
+    singular = head[:-1] if head.endswith("s") else head
+    if singular in _NOT_ENZYMES:
+        return False
+    return any(
+        head.endswith(suffix) and len(head) - len(suffix) >= _MIN_STEM_LENGTH for suffix in _PROTEIN_SUFFIXES
+    )
+
+
+def plan_retrieval(term, mode=None):
+    """
+    Decide how to retrieve evidence for a term.
+
+    Returns:
+        {"mode": "agent" | "prefetch", "calls": [(tool_name, tool_input), ...], "reason": str}
+        "calls" is only filled in for prefetch.
+    """
+    mode = mode if mode in RETRIEVAL_MODES else DEFAULT_RETRIEVAL_MODE
+    if mode == "agent":
+        return {"mode": "agent", "calls": [], "reason": "requested"}
+
+    if mode == "auto":
+        if _OPEN_ENDED.search(term):
+            return {"mode": "agent", "calls": [], "reason": "open-ended question"}
+        if len(term.split()) > MAX_PREFETCH_WORDS:
+            return {"mode": "agent", "calls": [], "reason": "long phrase"}
+
+    calls = [("get_wikipedia_summary", {"term": term})]
+    if looks_like_protein(term):
+        calls.append(("search_uniprot", {"protein_name": term}))
+        reason = "protein name"
+    else:
+        calls.append(("search_pubmed", {"term": term}))
+        reason = "general term"
+
+    return {"mode": "prefetch", "calls": calls, "reason": reason}
@@ -0,0 +1,165 @@
+"""
+Per-request traces: where an explanation's wall time went.
+
+A trace is started per request (trace_request) and carried in a
+contextvar, so the agent loop, the tool threads and the HTTP clients can
+add to it without passing it around. Spans record each Claude round
+(with its token counts) and each tool call (with the upstream host,
+status and bytes of every HTTP request it made). Every span also feeds
+the process-wide metrics served at /metrics.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import Counter, Histogram, Sampled
+from token_usage import USAGE_FIELDS, usage_summary
+
+_trace = contextvars.ContextVar("trace", default=None)
+_active_span = contextvars.ContextVar("active_span", default=None)
+
+REQUEST_SECONDS = Histogram(
+    "bio_request_duration_seconds", "Wall time of API requests", ["endpoint"]
+)
+LLM_SECONDS = Histogram(
+    "bio_llm_call_duration_seconds", "Wall time of one Claude messages call", ["model"]
+)
+TOOL_SECONDS = Histogram(
+    "bio_tool_call_duration_seconds", "Wall time of one tool call, cache hits included", ["tool"]
+)
+TOOL_CALLS = Counter(
+    "bio_tool_calls_total", "Tool calls by outcome", ["tool", "outcome"]
+)
+UPSTREAM_SECONDS = Histogram(
+    "bio_upstream_request_duration_seconds", "Wall time of HTTP requests to retrieval upstreams", ["host"]
+)
+UPSTREAM_REQUESTS = Counter(
+    "bio_upstream_requests_total", "HTTP requests to retrieval upstreams by status", ["host", "status"]
+)
+UPSTREAM_BYTES = Counter(
+    "bio_upstream_response_bytes_total", "Response bytes received from retrieval upstreams", ["host"]
+)
+Sampled(
+    "bio_llm_tokens_total", "Tokens billed by Claude, by kind", "counter", ["kind"],
+    lambda: [((field,), usage_summary()[field]) for field in USAGE_FIELDS]
+)
+Sampled(
+    "bio_llm_calls_total", "Claude messages calls", "counter", [],
+    lambda: [((), usage_summary()["calls"])]
+)
+
+
+class Trace:
+    """The spans of one request, with offsets relative to its start."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def summary(self):
+        """Timing block for the API response: totals plus every span."""
+        with self._lock:
+            spans = [dict(record) for record in self.spans]
+        llm_spans = [s for s in spans if s["kind"] == "llm"]
+        tool_spans = [s for s in spans if s["kind"] == "tool"]
+        return {
+            "total_ms": round(self.elapsed_ms(), 1),
+            "llm_ms": round(sum(s["duration_ms"] for s in llm_spans), 1),
+            "tool_ms": round(_covered_ms(tool_spans), 1),
+            "rounds": len(llm_spans),
+            "tool_calls": len(tool_spans),
+            "spans": spans,
+        }
+
+
+def _covered_ms(spans):
+    """Wall time covered by possibly overlapping spans (tools run concurrently)."""
+    covered = 0.0
+    end = None
+    for s in sorted(spans, key=lambda s: s["start_ms"]):
+        start, stop = s["start_ms"], s["start_ms"] + s["duration_ms"]
+        if end is None or start > end:
+            covered += stop - start
+            end = stop
+        elif stop > end:
+            covered += stop - end
+            end = stop
+    return covered
+
+
+def current_trace():
+    return _trace.get()
+
+
+@contextmanager
+def trace_request(endpoint):
+    """Trace everything done for one request; yields the Trace."""
+    trace = Trace(endpoint)
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        total_ms = trace.elapsed_ms()
+        REQUEST_SECONDS.observe(total_ms / 1000, endpoint=endpoint)
+        summary = trace.summary()
+        if summary["rounds"] or summary["tool_calls"]:
+            print(f"⏱️  {endpoint} took {total_ms:.0f} ms: {summary['rounds']} LLM round(s) "
+                  f"{summary['llm_ms']:.0f} ms, {summary['tool_calls']} tool call(s) {summary['tool_ms']:.0f} ms")
+
+
+@contextmanager
+def span(kind, name, activate=False, **attrs):
+    """
+    Time a block as a span of the current trace; yields the span dict.
+
+    Attributes can be added to the dict inside or after the block. With
+    activate=True, HTTP requests made inside the block are attached to
+    this span (used for tool calls, which run in their own thread or task).
+    """
+    trace = _trace.get()
+    record = {"kind": kind, "name": name, **attrs}
+    token = _active_span.set(record) if activate else None
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        duration = time.perf_counter() - started
+        if token is not None:
+            _active_span.reset(token)
+        record["duration_ms"] = round(duration * 1000, 1)
+        if kind == "llm":
+            LLM_SECONDS.observe(duration, model=name)
+        elif kind == "tool":
+            TOOL_SECONDS.observe(duration, tool=name)
+            TOOL_CALLS.inc(tool=name, outcome="ok" if record.get("ok", True) else "error")
+        if trace is not None:
+            record["start_ms"] = round((started - trace.started) * 1000, 1)
+            trace.add(record)
+
+
+def record_upstream(host, status, nbytes, seconds):
+    """Count one HTTP request to an upstream and attach it to the active tool span."""
+    UPSTREAM_SECONDS.observe(seconds, host=host)
+    UPSTREAM_REQUESTS.inc(host=host, status=status)
+    if nbytes:
+        UPSTREAM_BYTES.inc(nbytes, host=host)
+
+    record = _active_span.get()
+    if record is not None:
+        record.setdefault("upstream", []).append({
+            "host": host,
+            "status": status,
+            "bytes": nbytes,
+            "ms": round(seconds * 1000, 1)
+        })
@@ -0,0 +1,128 @@
+"""
+Pre-compute explanations so the first reader of a term doesn't pay for the agent run.
+
+Every term is explained at each difficulty level and length (16 variants by
+default) and stored in the explanation cache, exactly as /explain would store
+it. Work is spread over a small worker pool and paced by a token bucket; the
+tools additionally respect the per-upstream limits in http_client.
+
+    python warm_cache.py --terms terms.txt
+    python warm_cache.py --from-log requests.log --top 200 --length brief short
+
+Variants that are already cached are skipped, so an interrupted run picks up
+where it stopped when rerun. The warmed entries must outlive this process, so
+SHARED_CACHE_URL or EXPLAIN_CACHE_DB has to point at the store the servers use.
+
+Explanations are cached without page context, under the context-free key
+that /explain falls back to when a page has no entry of its own.
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+from rate_limit import TokenBucket
+from request_log import frequent_terms
+from term_index import read_terms
+
+
+def pending_jobs(terms, difficulty_levels, lengths):
+    """The (term, difficulty_level, length, cache_key) variants that are not cached yet."""
+    jobs = []
+    for term in terms:
+        for difficulty_level in difficulty_levels:
+            for length in lengths:
+                name = server.explanation_terms.resolve(term)
+                key = server.general_explanation_key(name, difficulty_level, length)
+                if server.explanation_cache.get(key) is None:
+                    jobs.append((term, difficulty_level, length, key))
+    return jobs
+
+
+def warm(jobs, workers=4, per_minute=30, retrieval_mode=None):
+    """
+    Explain and cache each job, starting at most `per_minute` runs a minute.
+
+    Returns counts of stored, skipped (degraded or cut short) and failed runs.
+    """
+    bucket = TokenBucket(per_minute / 60.0, capacity=workers)
+    stop = threading.Event()
+    counts = {"stored": 0, "skipped": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def run(job):
+        if stop.is_set():
+            return
+        bucket.acquire()
+        if stop.is_set():
+            return
+        term, difficulty_level, length, key = job
+        try:
+            result = server.run_agent(term, {}, difficulty_level, length, retrieval_mode)
+            server.store_explanation(key, term, result)
+            outcome = "skipped" if result["degraded"] or result["stop_reason"] != "end_turn" else "stored"
+        except Exception as e:
+            print(f"⚠️  {term} ({difficulty_level}, {length}) failed: {e}")
+            outcome = "failed"
+        with lock:
+            counts[outcome] += 1
+            done = sum(counts.values())
+        if outcome == "skipped":
+            print(f"⚠️  {term} ({difficulty_level}, {length}) was degraded, not cached")
+        if done % 10 == 0 or done == len(jobs):
+            print(f"🔥 {done}/{len(jobs)} done ({counts['stored']} cached)")
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = [pool.submit(run, job) for job in jobs]
+    try:
+        for future in futures:
+            future.result()
+    except KeyboardInterrupt:
+        stop.set()
+        print("\n🛑 Interrupted, finishing the runs in progress; rerun to resume")
+        for future in futures:
+            future.cancel()
+    finally:
+        pool.shutdown(wait=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-compute explanations into the explanation cache")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--terms", help="Terms file (one term per line, as for term_index.py)")
+    source.add_argument("--from-log", help="Request log (REQUEST_LOG) to take the most frequent terms from")
+    parser.add_argument("--top", type=int, default=100, help="Number of terms to take from the log")
+    parser.add_argument("--difficulty", nargs="+", choices=list(server.difficulty_prompts),
+                        default=list(server.difficulty_prompts))
+    parser.add_argument("--length", nargs="+", choices=list(server.length_prompts),
+                        default=list(server.length_prompts))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=30, help="Agent runs started per minute")
+    parser.add_argument("--retrieval-mode", choices=["agent", "prefetch", "auto"])
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be computed")
+    args = parser.parse_args()
+
+    if server.explanation_cache.disk is None:
+        parser.error("Neither SHARED_CACHE_URL nor EXPLAIN_CACHE_DB is set; warmed entries would be lost on exit")
+
+    if args.terms:
+        terms = [term for term, _ in read_terms(args.terms)]
+    else:
+        terms = frequent_terms(args.from_log, args.top)
+
+    variants = len(terms) * len(args.difficulty) * len(args.length)
+    jobs = pending_jobs(terms, args.difficulty, args.length)
+    print(f"📋 {len(terms)} term(s), {variants} variant(s), {variants - len(jobs)} already cached")
+    if args.dry_run or not jobs:
+        return
+
+    started = time.time()
+    counts = warm(jobs, args.workers, args.rate, args.retrieval_mode)
+    print(f"✅ Cached {counts['stored']}, degraded {counts['skipped']}, "
+          f"failed {counts['failed']} in {time.time() - started:.0f} s")
+
+
+if __name__ == "__main__":
+    main()